@@ -1,28 +1,39 @@
 """
 Tenant Middleware - Extract tenant info from JWT token
+Decoding is shared with utils.auth (same SECRET_KEY, one decode per request).
 """
-from fastapi import HTTPException, status, Header
+from fastapi import HTTPException, status, Header, Request
 from typing import Optional
 from jose import jwt, JWTError
-import os
+from utils.auth import SECRET_KEY, ALGORITHM, get_token_claims
 
-SECRET_KEY = os.environ.get("SECRET_KEY", "super-secret-key-change-in-production-123")
-ALGORITHM = "HS256"
+
+def _decode_header(authorization: str) -> dict:
+    # Remove 'Bearer ' prefix if present
+    token = authorization.replace("Bearer ", "") if authorization.startswith("Bearer ") else authorization
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def get_tenant_id(request: Request) -> Optional[str]:
+    """
+    Dependency: tenant ID of the caller, read from the request's cached token claims.
+    Returns None for super_admin or if no valid token was provided.
+    """
+    claims = get_token_claims(request)
+    return claims.get("tenantId") if claims else None
 
 
 def get_tenant_from_token(authorization: Optional[str] = Header(None)) -> Optional[str]:
     """
     Extract tenant ID from JWT token in Authorization header.
     Returns None for super_admin or if no token provided.
+    Prefer the get_tenant_id dependency inside routes - it reuses the request's decode.
     """
     if not authorization:
         return None
-    
+
     try:
-        # Remove 'Bearer ' prefix if present
-        token = authorization.replace("Bearer ", "") if authorization.startswith("Bearer ") else authorization
-        
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode_header(authorization)
         tenant_id = payload.get("tenantId")
         return tenant_id
     except JWTError:
@@ -39,15 +50,14 @@ def require_tenant(authorization: Optional[str] = Header(None)) -> str:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authorization header required"
         )
-    
+
     try:
-        token = authorization.replace("Bearer ", "") if authorization.startswith("Bearer ") else authorization
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
+        payload = _decode_header(authorization)
+
         # Super admin can access without tenant
         if payload.get("role") == "super_admin":
             return None  # Will return all data
-        
+
         tenant_id = payload.get("tenantId")
         if not tenant_id:
             raise HTTPException(
@@ -68,10 +78,9 @@ def get_user_info(authorization: Optional[str] = Header(None)) -> dict:
     """
     if not authorization:
         return {}
-    
+
     try:
-        token = authorization.replace("Bearer ", "") if authorization.startswith("Bearer ") else authorization
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode_header(authorization)
         return {
             "userId": payload.get("userId"),
             "username": payload.get("username"),
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+
+
+class InventoryCountCreate(BaseModel):
+    """فتح جلسة جرد لمستودع"""
+    warehouseId: str
+    notes: Optional[str] = None
+
+
+class InventoryCountScan(BaseModel):
+    """دفعة Tags ممسوحة من القارئ (التكرار يُحذف على الخادم)"""
+    tags: List[str] = Field(..., max_length=5000)
+
+
+class InventoryCountClose(BaseModel):
+    """إغلاق الجلسة - apply=False يغلقها بدون تعديل المخزون"""
+    apply: bool = True
+    notes: Optional[str] = None
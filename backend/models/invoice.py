@@ -54,6 +54,7 @@ class InvoiceModel(BaseModel):
     model_config = ConfigDict(validate_by_name=True, arbitrary_types_allowed=True)
 
 class InvoiceCreate(BaseModel):
+    invoiceNumber: Optional[str] = None  # from POST /api/invoices/number-block (offline terminals)
     customerId: Optional[str] = None
     customerName: str
     date: Optional[datetime] = None
@@ -66,6 +67,12 @@ class InvoiceCreate(BaseModel):
     status: str = "unpaid"
     paymentMethod: Optional[str] = None
 
+class InvoiceBatchCreate(BaseModel):
+    """Offline queue flush: each entry is validated as InvoiceCreate on its own so one bad
+    invoice does not reject the batch. An optional clientRef (unique per tenant) is stored
+    with the invoice, so resending the batch returns the stored invoices instead of new ones."""
+    invoices: List[dict] = Field(..., max_length=1000)
+
 class InvoiceUpdate(BaseModel):
     status: Optional[str] = None
     items: Optional[List[InvoiceItem]] = None
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, ConfigDict, Field, GetJsonSchemaHandler
 from pydantic.json_schema import JsonSchemaValue
 from pydantic_core import core_schema
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Literal
 from datetime import datetime
 from bson import ObjectId
 
@@ -77,3 +77,16 @@ class ProductUpdate(BaseModel):
     reorderLevel: Optional[int] = None
     warehouseId: Optional[str] = None
     eslDeviceId: Optional[str] = None
+
+class ProductBulkPrice(BaseModel):
+    """
+    تغيير أسعار البيع دفعة واحدة
+    rule: percent (نسبة من السعر الحالي), fixed (مبلغ يضاف للسعر), margin (هامش على سعر التكلفة)
+    """
+    rule: Literal["percent", "fixed", "margin"]
+    value: float
+    categories: List[str] = Field(default_factory=list, max_length=500)
+    supplierId: Optional[str] = None
+    skus: List[str] = Field(default_factory=list, max_length=20000)
+    decimals: int = Field(2, ge=0, le=4)
+    dryRun: bool = False
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
 from bson import ObjectId
 
@@ -12,7 +12,7 @@ class ProductUnitModel(BaseModel):
     productId: str  # المنتج الأساسي
     rfidTag: str  # رقم الـ RFID الفريد لهذه الوحدة
     serialNumber: Optional[str] = None  # رقم تسلسلي إضافي
-    status: str = "available"  # available, sold, reserved, damaged
+    status: str = "available"  # available, sold, reserved, damaged, missing (set by inventory count)
     warehouseId: Optional[str] = None
     location: Optional[str] = None  # موقع في المستودع مثل: A-1-3
     notes: Optional[str] = None
@@ -48,3 +48,14 @@ class ProductUnitBulkCreate(BaseModel):
     productId: str
     rfidTags: List[str]  # قائمة الـ Tags
     warehouseId: Optional[str] = None
+
+class ProductUnitBulkStatus(BaseModel):
+    """تغيير حالة عدة وحدات دفعة واحدة (بيع، حجز، تالف، إرجاع)"""
+    unitIds: List[str] = Field(default_factory=list, max_length=5000)
+    rfidTags: List[str] = Field(default_factory=list, max_length=5000)
+    status: Literal["available", "sold", "reserved", "damaged"]
+    invoiceId: Optional[str] = None
+
+class ProductUnitResolve(BaseModel):
+    """قراءة مجموعة Tags من القارئ اليدوي دفعة واحدة"""
+    tags: List[str] = Field(..., max_length=20000)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Header
+from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List, Optional
 from models.accounting import (
     ExpenseCreate, ExpenseUpdate,
@@ -6,11 +6,11 @@ from models.accounting import (
     JournalEntryCreate, JournalEntryLine
 )
 from utils.auth import require_permission
-from middleware.tenant import get_tenant_from_token
+from middleware.tenant import get_tenant_id
 from bson import ObjectId
 from datetime import datetime, timezone
-import random
-import string
+from utils import counters
+from utils.rollups import apply_rollups, rollup_expense_categories, rollup_totals
 
 router = APIRouter(prefix="/api/accounting", tags=["accounting"])
 
@@ -18,21 +18,19 @@ router = APIRouter(prefix="/api/accounting", tags=["accounting"])
 def _base_query(tenant_id: Optional[str]) -> dict:
     return {"tenantId": tenant_id} if tenant_id else {}
 
-def generate_entry_number():
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d")
-    random_str = ''.join(random.choices(string.digits, k=4))
-    return f"JE-{timestamp}-{random_str}"
+async def generate_entry_number(db, tenant_id: Optional[str]) -> str:
+    value = await counters.next_value(db, tenant_id, counters.JOURNAL_ENTRIES)
+    return counters.format_entry_number(value)
 
 # ============ EXPENSES ============
 
 @router.get("/expenses", response_model=List[dict])
 async def get_expenses(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Get all expenses"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     expenses = await db.expenses.find(base).sort("date", -1).to_list(1000)
     for expense in expenses:
@@ -42,13 +40,12 @@ async def get_expenses(
 @router.post("/expenses", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_expense(
     expense: ExpenseCreate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Create new expense"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
     expense_dict = expense.model_dump()
     expense_dict['tenantId'] = tenant_id
     if not expense_dict.get('date'):
@@ -57,6 +54,7 @@ async def create_expense(
     expense_dict['updatedAt'] = datetime.now(timezone.utc)
 
     result = await db.expenses.insert_one(expense_dict)
+    await apply_rollups(db, "expenses", added=[expense_dict])
     created = await db.expenses.find_one({"_id": result.inserted_id})
     created['_id'] = str(created['_id'])
     
@@ -66,7 +64,7 @@ async def create_expense(
 async def update_expense(
     expense_id: str,
     expense: ExpenseUpdate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Update expense"""
@@ -74,7 +72,6 @@ async def update_expense(
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=400, detail="Invalid expense ID")
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     query = {"_id": ObjectId(expense_id), **base}
 
@@ -84,12 +81,13 @@ async def update_expense(
 
     update_data['updatedAt'] = datetime.now(timezone.utc)
 
-    result = await db.expenses.update_one(query, {"$set": update_data})
+    existing = await db.expenses.find_one_and_update(query, {"$set": update_data})
 
-    if result.matched_count == 0:
+    if not existing:
         raise HTTPException(status_code=404, detail="Expense not found")
 
     updated = await db.expenses.find_one({"_id": ObjectId(expense_id)})
+    await apply_rollups(db, "expenses", removed=[existing], added=[updated])
     updated['_id'] = str(updated['_id'])
     
     return updated
@@ -97,7 +95,7 @@ async def update_expense(
 @router.delete("/expenses/{expense_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_expense(
     expense_id: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Delete expense"""
@@ -105,12 +103,12 @@ async def delete_expense(
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=400, detail="Invalid expense ID")
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
-    result = await db.expenses.delete_one({"_id": ObjectId(expense_id), **base})
+    deleted = await db.expenses.find_one_and_delete({"_id": ObjectId(expense_id), **base})
 
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Expense not found")
+    await apply_rollups(db, "expenses", removed=[deleted])
 
     return None
 
@@ -118,12 +116,11 @@ async def delete_expense(
 
 @router.get("/accounts", response_model=List[dict])
 async def get_accounts(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Get all accounts"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     accounts = await db.accounts.find(base).sort("code", 1).to_list(1000)
     for account in accounts:
@@ -133,13 +130,12 @@ async def get_accounts(
 @router.post("/accounts", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_account(
     account: AccountCreate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Create new account"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     # Check if code already exists within tenant
     existing = await db.accounts.find_one({"code": account.code, **base})
@@ -162,7 +158,7 @@ async def create_account(
 async def update_account(
     account_id: str,
     account: AccountUpdate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Update account"""
@@ -170,7 +166,6 @@ async def update_account(
     if not ObjectId.is_valid(account_id):
         raise HTTPException(status_code=400, detail="Invalid account ID")
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     query = {"_id": ObjectId(account_id), **base}
 
@@ -194,12 +189,11 @@ async def update_account(
 
 @router.get("/journal-entries", response_model=List[dict])
 async def get_journal_entries(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Get all journal entries"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     entries = await db.journal_entries.find(base).sort("date", -1).to_list(1000)
     for entry in entries:
@@ -209,13 +203,12 @@ async def get_journal_entries(
 @router.post("/journal-entries", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_journal_entry(
     entry: JournalEntryCreate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Create new journal entry"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
 
     # Validate that debits = credits
@@ -230,7 +223,7 @@ async def create_journal_entry(
 
     entry_dict = entry.model_dump()
     entry_dict['tenantId'] = tenant_id
-    entry_dict['entryNumber'] = generate_entry_number()
+    entry_dict['entryNumber'] = await generate_entry_number(db, tenant_id)
     if not entry_dict.get('date'):
         entry_dict['date'] = datetime.now(timezone.utc)
     entry_dict['status'] = 'posted'
@@ -257,41 +250,25 @@ async def create_journal_entry(
 
 @router.get("/summary")
 async def get_accounting_summary(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Get accounting summary"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
 
     now = datetime.now(timezone.utc)
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
-    # Get expenses (tenant-scoped)
-    expenses = await db.expenses.find(base).to_list(10000)
-    total_expenses = sum(e.get('amount', 0) for e in expenses)
-
-    monthly_expenses = await db.expenses.find({**base, "date": {"$gte": month_start}}).to_list(10000)
-    monthly_expense_total = sum(e.get('amount', 0) for e in monthly_expenses)
-
-    # Expenses by category
-    expense_by_category = {}
-    for e in expenses:
-        cat = e.get('category', 'other')
-        expense_by_category[cat] = expense_by_category.get(cat, 0) + e.get('amount', 0)
-
-    # Get sales (revenue) - tenant-scoped
-    invoices = await db.invoices.find({**base, "status": "paid"}).to_list(10000)
-    total_revenue = sum(inv.get('total', 0) for inv in invoices)
-
-    monthly_invoices = await db.invoices.find({
-        **base,
-        "createdAt": {"$gte": month_start},
-        "status": "paid"
-    }).to_list(10000)
-    monthly_revenue = sum(inv.get('total', 0) for inv in monthly_invoices)
+    # Revenue (paid invoices) and expenses from the daily rollups
+    totals = await rollup_totals(db, tenant_id, None)
+    monthly = await rollup_totals(db, tenant_id, month_start)
+    total_expenses = totals["expenses.total"]
+    monthly_expense_total = monthly["expenses.total"]
+    expense_by_category = await rollup_expense_categories(db, tenant_id)
+    total_revenue = totals["sales.paidRevenue"]
+    monthly_revenue = monthly["sales.paidRevenue"]
 
     # Get accounts (tenant-scoped)
     accounts = await db.accounts.find(base).to_list(1000)
@@ -325,13 +302,12 @@ async def get_accounting_summary(
 
 @router.post("/seed-accounts")
 async def seed_default_accounts(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("accounting"))
 ):
     """Seed default chart of accounts for current tenant"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     count = await db.accounts.count_documents(base)
     if count > 0:
@@ -11,8 +11,8 @@ import os
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-# Simple secret key for JWT-like tokens
-SECRET_KEY = os.environ.get("SECRET_KEY", "super-secret-key-change-in-production-123")
+# Secret key for JWT-like tokens (shared with utils.auth)
+from utils.auth import SECRET_KEY
 TOKEN_EXPIRE_HOURS = 24
 
 # In-memory token storage (in production, use Redis)
@@ -75,8 +75,12 @@ async def login(login_data: LoginRequest):
             detail="اسم المستخدم أو كلمة المرور غير صحيحة"
         )
     
-    # Check for passwordHash (new format) or hashedPassword (old format) - order matters!
-    stored_password = user.get("passwordHash") or user.get("hashedPassword") or user.get("hashed_password")
+    # passwordHash (new format) first, then hashedPassword / hashed_password (old format)
+    from utils.password_hashing import (
+        hash_password as hash_bcrypt, password_hash_update, stored_password_of, verify_stored_password,
+    )
+    stored_password = stored_password_of(user)
+    needs_rehash = False
     
     if not stored_password:
         # First login - set password
@@ -86,30 +90,8 @@ async def login(login_data: LoginRequest):
             {"$set": {"hashedPassword": hashed}}
         )
     else:
-        # Try both hash methods (bcrypt first when hash looks like bcrypt)
-        password_valid = False
-        from passlib.context import CryptContext
-        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-        # Bcrypt hashes start with $2b$ or $2a$ - try these first
-        if stored_password and (stored_password.startswith("$2b$") or stored_password.startswith("$2a$")):
-            try:
-                if pwd_context.verify(password, stored_password):
-                    password_valid = True
-            except Exception:
-                pass
-
-        # Otherwise try SHA256 (old method)
-        if not password_valid and verify_password(password, stored_password):
-            password_valid = True
-
-        # Last: try bcrypt for any other stored format
-        if not password_valid and stored_password:
-            try:
-                if pwd_context.verify(password, stored_password):
-                    password_valid = True
-            except Exception:
-                pass
+        # bcrypt on the hashing pool, old SHA256 and other bcrypt variants as fallback
+        password_valid, needs_rehash = await verify_stored_password(password, stored_password)
 
         if not password_valid:
             raise HTTPException(
@@ -146,6 +128,10 @@ async def login(login_data: LoginRequest):
                     detail="اشتراك الشركة منتهي أو موقوف"
                 )
     
+    if needs_rehash:
+        # Legacy hash of an accepted login: replaced by bcrypt now that the plain password is known
+        await db.users.update_one({"_id": user["_id"]}, password_hash_update(await hash_bcrypt(password)))
+    
     # Create JWT token with tenant info
     token_payload = {
         "userId": str(user["_id"]),
@@ -261,14 +247,15 @@ async def change_password(token: str, old_password: str, new_password: str):
     if not user:
         raise HTTPException(status_code=404, detail="المستخدم غير موجود")
     
-    stored_password = user.get("hashedPassword")
-    if stored_password and not verify_password(old_password, stored_password):
+    # Same hash the login checks; the new password replaces every legacy field
+    from utils.password_hashing import (
+        hash_password as hash_bcrypt, password_hash_update, stored_password_of, verify_stored_password,
+    )
+    stored_password = stored_password_of(user)
+    if stored_password and not (await verify_stored_password(old_password, stored_password))[0]:
         raise HTTPException(status_code=400, detail="كلمة المرور الحالية غير صحيحة")
     
-    await db.users.update_one(
-        {"_id": user["_id"]},
-        {"$set": {"hashedPassword": hash_password(new_password)}}
-    )
+    await db.users.update_one({"_id": user["_id"]}, password_hash_update(await hash_bcrypt(new_password)))
     
     return {"message": "تم تغيير كلمة المرور بنجاح"}
 
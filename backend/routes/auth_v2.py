@@ -4,33 +4,21 @@ Authentication Routes V2 - Multi-Tenant Support
 from fastapi import APIRouter, HTTPException, status
 from datetime import datetime, timezone, timedelta
 from bson import ObjectId
-from passlib.context import CryptContext
 from jose import jwt
 import os
 import secrets
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-_DEFAULT_SECRET = "super-secret-key-change-in-production-123"
-SECRET_KEY = os.environ.get("SECRET_KEY", _DEFAULT_SECRET)
-ALGORITHM = "HS256"
+from utils.password_hashing import hash_password, password_hash_update, stored_password_of, verify_stored_password
 
 # SECRET_KEY: Set in .env for production. Default is insecure.
-ACCESS_TOKEN_EXPIRE_HOURS = 24
+# Shared with utils.auth so tokens issued here decode everywhere.
+from utils.auth import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_HOURS
 
 
-def verify_password_bcrypt(plain_password: str, hashed_password: str) -> bool:
-    if not hashed_password or not (hashed_password.startswith("$2b$") or hashed_password.startswith("$2a$")):
-        return False
-    try:
-        return pwd_context.verify(plain_password, hashed_password)
-    except Exception:
-        return False
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await hash_password(password)
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
@@ -62,7 +50,7 @@ def serialize_doc(doc):
 async def fix_superadmin():
     """إصلاح حساب superadmin: إنشاؤه أو ضبط كلمة المرور إلى Admin@123 (افتح هذا الرابط في المتصفح ثم جرّب الدخول)."""
     from server import db
-    default_hash = get_password_hash("Admin@123")
+    default_hash = await get_password_hash("Admin@123")
     u = await db.users.find_one({"username": "superadmin"})
     if not u:
         await db.users.insert_one({
@@ -140,7 +128,7 @@ async def fix_demo_user():
         tenant_id = str(r.inserted_id)
     else:
         tenant_id = str(tenant["_id"])
-    hash_pass = get_password_hash(DEMO_PASSWORD)
+    hash_pass = await get_password_hash(DEMO_PASSWORD)
     perms = {
         "dashboard": True, "products": True, "products_create": True, "products_edit": True, "products_delete": True,
         "customers": True, "customers_create": True, "customers_edit": True,
@@ -208,17 +196,9 @@ async def login(login_data: dict):
         )
     
     # Accept passwordHash (bcrypt) or hashedPassword / hashed_password (SHA256 or bcrypt)
-    stored = user.get("passwordHash") or user.get("hashedPassword") or user.get("hashed_password")
-    password_ok = False
-    if stored:
-        if stored.startswith("$2b$") or stored.startswith("$2a$"):
-            password_ok = verify_password_bcrypt(password, stored)
-        if not password_ok:
-            import hashlib
-            if hashlib.sha256(password.encode()).hexdigest() == stored:
-                password_ok = True
-        if not password_ok:
-            password_ok = verify_password_bcrypt(password, stored)
+    stored = stored_password_of(user)
+    # bcrypt off the event loop; legacy SHA256 and other bcrypt variants as fallback
+    password_ok, needs_rehash = await verify_stored_password(password, stored)
     if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -267,10 +247,13 @@ async def login(login_data: dict):
                 detail="انتهى اشتراك الشركة"
             )
     
-    await db.users.update_one(
-        {"_id": user["_id"]},
-        {"$set": {"lastLogin": datetime.now(timezone.utc)}}
-    )
+    now = datetime.now(timezone.utc)
+    login_update = {"$set": {"lastLogin": now}}
+    if needs_rehash:
+        # Legacy hash of an accepted login: replaced by bcrypt now that the plain password is known
+        login_update = password_hash_update(await get_password_hash(password))
+        login_update["$set"].update({"lastLogin": now, "updatedAt": now})
+    await db.users.update_one({"_id": user["_id"]}, login_update)
     
     token_data = {
         "userId": str(user["_id"]),
@@ -369,10 +352,10 @@ async def reset_password(data: dict):
     if not user:
         raise HTTPException(status_code=404, detail="المستخدم غير موجود")
 
-    await db.users.update_one(
-        {"_id": user["_id"]},
-        {"$set": {"passwordHash": get_password_hash(new_password), "updatedAt": datetime.now(timezone.utc)}}
-    )
+    # The new bcrypt hash replaces any legacy password field
+    update = password_hash_update(await get_password_hash(new_password))
+    update["$set"]["updatedAt"] = datetime.now(timezone.utc)
+    await db.users.update_one({"_id": user["_id"]}, update)
     await db.password_reset_tokens.delete_many({"token": token})
 
     return {"message": "تم تغيير كلمة المرور بنجاح"}
@@ -416,7 +399,7 @@ async def register_super_admin(user_data: dict):
             "pos": True, "inventory_count": True, "reports": True, "accounting": True, "settings": True, "users": True, "warehouses": True
         },
         "tenantId": None,
-        "passwordHash": get_password_hash(user_data.get("password")),
+        "passwordHash": await get_password_hash(user_data.get("password")),
         "createdAt": datetime.now(timezone.utc),
         "updatedAt": datetime.now(timezone.utc),
     }
@@ -8,6 +8,7 @@ from datetime import datetime, timezone
 from bson import ObjectId
 
 from utils.auth import get_current_user
+from utils.rollups import ROLLUP_SOURCES, rebuild_rollups
 
 router = APIRouter(prefix="/api/backup", tags=["backup"])
 
@@ -170,6 +171,10 @@ async def restore_backup(
         except Exception as e:
             errors.append(f"{coll_name}: {str(e)}")
 
+    # Daily rollups are derived data: recompute them from the restored documents
+    if any(name in collections for name in ROLLUP_SOURCES):
+        await rebuild_rollups(db, backup_tenant_id)
+
     if errors:
         return JSONResponse(
             status_code=status.HTTP_207_MULTI_STATUS,
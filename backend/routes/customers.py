@@ -1,10 +1,10 @@
 """
 Customers Routes - Multi-Tenant Support
 """
-from fastapi import APIRouter, HTTPException, status, Header, Depends
+from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List, Optional
 from models.customer import CustomerModel, CustomerCreate, CustomerUpdate
-from middleware.tenant import get_tenant_from_token
+from middleware.tenant import get_tenant_id
 from utils.auth import require_permission
 from bson import ObjectId
 from datetime import datetime, timezone
@@ -13,11 +13,10 @@ router = APIRouter(prefix="/api/customers", tags=["customers"])
 
 
 @router.get("", response_model=List[dict])
-async def get_customers(authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("customers"))):
+async def get_customers(tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("customers"))):
     """Get all customers for tenant"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"tenantId": tenant_id} if tenant_id else {}
     
     customers = await db.customers.find(query).to_list(1000)
@@ -27,14 +26,13 @@ async def get_customers(authorization: Optional[str] = Header(None), _: dict = D
 
 
 @router.get("/{customer_id}", response_model=dict)
-async def get_customer(customer_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("customers"))):
+async def get_customer(customer_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("customers"))):
     """Get customer by ID"""
     from server import db
     
     if not ObjectId.is_valid(customer_id):
         raise HTTPException(status_code=400, detail="Invalid customer ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(customer_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -48,12 +46,10 @@ async def get_customer(customer_id: str, authorization: Optional[str] = Header(N
 
 
 @router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
-async def create_customer(customer: CustomerCreate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("customers"))):
+async def create_customer(customer: CustomerCreate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("customers"))):
     """Create new customer"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
-    
     customer_dict = customer.model_dump()
     customer_dict['tenantId'] = tenant_id
     customer_dict['createdAt'] = datetime.now(timezone.utc)
@@ -67,14 +63,13 @@ async def create_customer(customer: CustomerCreate, authorization: Optional[str]
 
 
 @router.put("/{customer_id}", response_model=dict)
-async def update_customer(customer_id: str, customer: CustomerUpdate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("customers"))):
+async def update_customer(customer_id: str, customer: CustomerUpdate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("customers"))):
     """Update customer"""
     from server import db
     
     if not ObjectId.is_valid(customer_id):
         raise HTTPException(status_code=400, detail="Invalid customer ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(customer_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -95,14 +90,13 @@ async def update_customer(customer_id: str, customer: CustomerUpdate, authorizat
 
 
 @router.delete("/{customer_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_customer(customer_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("customers"))):
+async def delete_customer(customer_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("customers"))):
     """Delete customer"""
     from server import db
     
     if not ObjectId.is_valid(customer_id):
         raise HTTPException(status_code=400, detail="Invalid customer ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(customer_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
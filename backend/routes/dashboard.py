@@ -1,154 +1,189 @@
 """
 Dashboard Routes - Multi-Tenant Support
 """
-from fastapi import APIRouter, Header, Depends
+import asyncio
+from fastapi import APIRouter, Depends
 from datetime import datetime, timezone, timedelta
 from typing import Optional
-from middleware.tenant import get_tenant_from_token
+from middleware.tenant import get_tenant_id
 from utils.auth import require_permission
+from utils.dashboard_cache import cached_dashboard
+from utils.rollups import day_key, days_between, top_products_stages
+from utils.stock_state import LOW, OUT
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
+LOW_STOCK_ITEMS = 10
+TOP_PRODUCTS = 5
+CHART_DAYS = 7
 
-@router.get("/stats")
-async def get_dashboard_stats(authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("dashboard"))):
-    """Get dashboard statistics for tenant"""
-    from server import db
-    
-    tenant_id = get_tenant_from_token(authorization)
+
+def _sum_since(first_day: str, path: str) -> dict:
+    """$sum of a rollup field over the days from first_day (inside a $group)."""
+    return {"$sum": {"$cond": [{"$gte": ["$day", first_day]}, {"$ifNull": [f"${path}", 0]}, 0]}}
+
+
+def sales_overview_pipeline(tenant_id: Optional[str], today_start: datetime) -> list:
+    """
+    Sales/purchase windows, 7-day chart and top sellers from daily_rollups in one $facet.
+    The tenant's rollups are one document per day, so the facet reads little even over years.
+    """
+    today = day_key(today_start)
+    week = day_key(today_start - timedelta(days=7))
+    month = day_key(today_start - timedelta(days=30))
+    chart = day_key(today_start - timedelta(days=CHART_DAYS - 1))
+    return [
+        {"$match": {"tenantId": tenant_id} if tenant_id else {}},
+        {"$facet": {
+            "windows": [
+                {"$match": {"day": {"$gte": month}}},
+                {"$group": {
+                    "_id": None,
+                    "todaySales": _sum_since(today, "sales.revenue"),
+                    "todayOrders": _sum_since(today, "sales.orders"),
+                    "weekSales": _sum_since(week, "sales.revenue"),
+                    "monthSales": _sum_since(month, "sales.revenue"),
+                    "todayPurchases": _sum_since(today, "purchases.total"),
+                    "weekPurchases": _sum_since(week, "purchases.total"),
+                }},
+            ],
+            "chart": [
+                {"$match": {"day": {"$gte": chart}}},
+                # Super admin (no tenant) sees every tenant: days are summed
+                {"$group": {
+                    "_id": "$day",
+                    "sales": {"$sum": {"$ifNull": ["$sales.revenue", 0]}},
+                    "orders": {"$sum": {"$ifNull": ["$sales.orders", 0]}},
+                }},
+            ],
+            "topProducts": top_products_stages(TOP_PRODUCTS),
+        }},
+    ]
+
+
+def inventory_overview_pipeline(tenant_id: Optional[str]) -> list:
+    """Product count, stock states, first low-stock items and stock value in one $facet."""
+    return [
+        {"$match": {"tenantId": tenant_id} if tenant_id else {}},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "products": {"$sum": 1},
+                "lowStock": {"$sum": {"$cond": [{"$in": ["$stockState", [LOW, OUT]]}, 1, 0]}},
+                "outOfStock": {"$sum": {"$cond": [{"$eq": ["$stockState", OUT]}, 1, 0]}},
+                "totalValue": {"$sum": {"$multiply": [{"$ifNull": ["$stock", 0]}, {"$ifNull": ["$costPrice", 0]}]}},
+                "retailValue": {"$sum": {"$multiply": [{"$ifNull": ["$stock", 0]}, {"$ifNull": ["$salePrice", 0]}]}},
+            }}],
+            "lowStockItems": [
+                {"$match": {"stockState": {"$in": [LOW, OUT]}}},
+                {"$limit": LOW_STOCK_ITEMS},
+                {"$project": {"searchKeys": 0}},
+            ],
+        }},
+    ]
+
+
+async def _first(cursor) -> dict:
+    rows = await cursor.to_list(1)
+    return rows[0] if rows else {}
+
+
+async def dashboard_stats(db, tenant_id: Optional[str], now: datetime) -> dict:
+    """
+    Every dashboard query is independent, so they run concurrently: two $facet
+    aggregations (products, daily rollups), the recent invoices and the counts.
+    """
     base_query = {"tenantId": tenant_id} if tenant_id else {}
-    
-    now = datetime.now(timezone.utc)
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=7)
-    month_start = today_start - timedelta(days=30)
-    
-    # Get counts
-    total_products = await db.products.count_documents(base_query)
-    total_customers = await db.customers.count_documents(base_query)
-    total_suppliers = await db.suppliers.count_documents(base_query)
-    
-    users_query = {"tenantId": tenant_id} if tenant_id else {}
-    total_users = await db.users.count_documents(users_query)
-    total_warehouses = await db.warehouses.count_documents(base_query)
-    
-    # Get low stock products
-    low_stock_query = {**base_query, "$expr": {"$lte": ["$stock", "$reorderLevel"]}}
-    low_stock = await db.products.find(low_stock_query).to_list(100)
+
+    inventory, sales, recent_invoices, customers, suppliers, users, warehouses = await asyncio.gather(
+        _first(db.products.aggregate(inventory_overview_pipeline(tenant_id))),
+        _first(db.daily_rollups.aggregate(sales_overview_pipeline(tenant_id, today_start))),
+        db.invoices.find(base_query).sort("createdAt", -1).limit(5).to_list(5),
+        db.customers.count_documents(base_query),
+        db.suppliers.count_documents(base_query),
+        db.users.count_documents(base_query),
+        db.warehouses.count_documents(base_query),
+    )
+    totals = (inventory.get("totals") or [{}])[0]
+    windows = (sales.get("windows") or [{}])[0]
+
+    low_stock = inventory.get("lowStockItems") or []
     for p in low_stock:
         p['_id'] = str(p['_id'])
-    
-    # Get out of stock products
-    out_of_stock_query = {**base_query, "stock": {"$lte": 0}}
-    out_of_stock = await db.products.count_documents(out_of_stock_query)
-    
-    # Get today's sales
-    today_query = {**base_query, "createdAt": {"$gte": today_start}}
-    today_invoices = await db.invoices.find(today_query).to_list(1000)
-    today_sales = sum(inv.get('total', 0) for inv in today_invoices)
-    today_orders = len(today_invoices)
-    
-    # Get weekly sales
-    week_query = {**base_query, "createdAt": {"$gte": week_start}}
-    week_invoices = await db.invoices.find(week_query).to_list(1000)
-    week_sales = sum(inv.get('total', 0) for inv in week_invoices)
-    
-    # Get monthly sales
-    month_query = {**base_query, "createdAt": {"$gte": month_start}}
-    month_invoices = await db.invoices.find(month_query).to_list(1000)
-    month_sales = sum(inv.get('total', 0) for inv in month_invoices)
-    
-    # Get today's purchases
-    today_purchases = await db.purchases.find(today_query).to_list(1000)
-    today_purchase_total = sum(p.get('total', 0) for p in today_purchases)
-    
-    # Get weekly purchases
-    week_purchases = await db.purchases.find(week_query).to_list(1000)
-    week_purchase_total = sum(p.get('total', 0) for p in week_purchases)
-    
-    # Get total inventory value
-    all_products = await db.products.find(base_query).to_list(10000)
-    inventory_value = sum(p.get('stock', 0) * p.get('costPrice', 0) for p in all_products)
-    inventory_retail_value = sum(p.get('stock', 0) * p.get('salePrice', 0) for p in all_products)
-    
-    # Get recent invoices
-    recent_invoices = await db.invoices.find(base_query).sort("createdAt", -1).limit(5).to_list(5)
     for inv in recent_invoices:
         inv['_id'] = str(inv['_id'])
-    
-    # Get top selling products
-    all_invoices = await db.invoices.find(base_query).to_list(10000)
-    product_sales = {}
-    for inv in all_invoices:
-        for item in inv.get('items', []):
-            pid = item.get('productId') or item.get('productName', 'unknown')
-            pname = item.get('productName', 'Unknown')
-            if pid not in product_sales:
-                product_sales[pid] = {'name': pname, 'quantity': 0, 'revenue': 0}
-            product_sales[pid]['quantity'] += item.get('quantity', 0)
-            product_sales[pid]['revenue'] += item.get('total', 0)
-    
-    top_products = sorted(product_sales.values(), key=lambda x: x['revenue'], reverse=True)[:5]
-    
-    # Daily sales for chart (last 7 days)
+
+    # Daily sales for chart (last 7 days, empty days included)
+    chart = {row["_id"]: row for row in sales.get("chart") or []}
     daily_sales = []
-    for i in range(6, -1, -1):
-        day = today_start - timedelta(days=i)
-        next_day = day + timedelta(days=1)
-        day_query = {**base_query, "createdAt": {"$gte": day, "$lt": next_day}}
-        day_invoices = await db.invoices.find(day_query).to_list(1000)
-        day_total = sum(inv.get('total', 0) for inv in day_invoices)
+    for day in days_between(today_start - timedelta(days=CHART_DAYS - 1), today_start):
+        date = datetime.strptime(day, '%Y-%m-%d')
         daily_sales.append({
-            'date': day.strftime('%Y-%m-%d'),
-            'dayName': day.strftime('%A'),
-            'sales': day_total,
-            'orders': len(day_invoices)
+            'date': day,
+            'dayName': date.strftime('%A'),
+            'sales': chart.get(day, {}).get("sales", 0),
+            'orders': chart.get(day, {}).get("orders", 0)
         })
-    
+
     return {
         "counts": {
-            "products": total_products,
-            "customers": total_customers,
-            "suppliers": total_suppliers,
-            "users": total_users,
-            "warehouses": total_warehouses
+            "products": totals.get("products", 0),
+            "customers": customers,
+            "suppliers": suppliers,
+            "users": users,
+            "warehouses": warehouses
         },
         "inventory": {
-            "lowStock": len(low_stock),
-            "outOfStock": out_of_stock,
-            "lowStockItems": low_stock[:10],
-            "totalValue": inventory_value,
-            "retailValue": inventory_retail_value
+            "lowStock": totals.get("lowStock", 0),
+            "outOfStock": totals.get("outOfStock", 0),
+            "lowStockItems": low_stock,
+            "totalValue": totals.get("totalValue", 0),
+            "retailValue": totals.get("retailValue", 0)
         },
         "sales": {
-            "today": today_sales,
-            "todayOrders": today_orders,
-            "weekly": week_sales,
-            "monthly": month_sales
+            "today": windows.get("todaySales", 0),
+            "todayOrders": windows.get("todayOrders", 0),
+            "weekly": windows.get("weekSales", 0),
+            "monthly": windows.get("monthSales", 0)
         },
         "purchases": {
-            "today": today_purchase_total,
-            "weekly": week_purchase_total
+            "today": windows.get("todayPurchases", 0),
+            "weekly": windows.get("weekPurchases", 0)
         },
         "recentInvoices": recent_invoices,
-        "topProducts": top_products,
+        "topProducts": sales.get("topProducts") or [],
         "dailySales": daily_sales
     }
 
 
-@router.get("/alerts")
-async def get_alerts(authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("dashboard"))):
-    """Get system alerts for tenant"""
+@router.get("/stats")
+async def get_dashboard_stats(tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("dashboard"))):
+    """Get dashboard statistics for tenant (cached per tenant, see utils.dashboard_cache)"""
     from server import db
-    
-    tenant_id = get_tenant_from_token(authorization)
+
+    return await cached_dashboard(
+        tenant_id, "stats", lambda: dashboard_stats(db, tenant_id, datetime.now(timezone.utc))
+    )
+
+
+async def dashboard_alerts(db, tenant_id: Optional[str]) -> dict:
+    """Low / out of stock and unpaid invoice alerts of a tenant."""
     base_query = {"tenantId": tenant_id} if tenant_id else {}
     
     alerts = []
     
+    # The three alert sources are independent: fetch them concurrently
+    low_stock, out_of_stock, unpaid = await asyncio.gather(
+        db.products.find({**base_query, "stockState": LOW}, {"searchKeys": 0}).to_list(100),
+        db.products.find({**base_query, "stockState": OUT}, {"searchKeys": 0}).to_list(100),
+        _first(db.invoices.aggregate([
+            {"$match": {**base_query, "status": "unpaid"}},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "total": {"$sum": {"$ifNull": ["$total", 0]}}}},
+        ])),
+    )
+
     # Low stock alerts
-    low_stock_query = {**base_query, "$expr": {"$lte": ["$stock", "$reorderLevel"]}, "stock": {"$gt": 0}}
-    low_stock = await db.products.find(low_stock_query).to_list(100)
     for p in low_stock:
         alerts.append({
             "type": "warning",
@@ -160,8 +195,6 @@ async def get_alerts(authorization: Optional[str] = Header(None), _: dict = Depe
         })
     
     # Out of stock alerts
-    out_of_stock_query = {**base_query, "stock": {"$lte": 0}}
-    out_of_stock = await db.products.find(out_of_stock_query).to_list(100)
     for p in out_of_stock:
         alerts.append({
             "type": "critical",
@@ -173,17 +206,24 @@ async def get_alerts(authorization: Optional[str] = Header(None), _: dict = Depe
         })
     
     # Unpaid invoices alerts
-    unpaid_query = {**base_query, "status": "unpaid"}
-    unpaid = await db.invoices.find(unpaid_query).to_list(100)
-    if len(unpaid) > 0:
-        total_unpaid = sum(inv.get('total', 0) for inv in unpaid)
+    unpaid_count = unpaid.get("count", 0)
+    if unpaid_count > 0:
+        total_unpaid = unpaid.get("total", 0)
         alerts.append({
             "type": "info",
             "category": "finance",
-            "title": f"فواتير غير مدفوعة: {len(unpaid)}",
-            "titleEn": f"Unpaid Invoices: {len(unpaid)}",
+            "title": f"فواتير غير مدفوعة: {unpaid_count}",
+            "titleEn": f"Unpaid Invoices: {unpaid_count}",
             "message": f"المبلغ الإجمالي: ${total_unpaid:,.2f}",
             "messageEn": f"Total Amount: ${total_unpaid:,.2f}"
         })
     
     return {"alerts": alerts}
+
+
+@router.get("/alerts")
+async def get_alerts(tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("dashboard"))):
+    """Get system alerts for tenant (cached per tenant, see utils.dashboard_cache)"""
+    from server import db
+
+    return await cached_dashboard(tenant_id, "alerts", lambda: dashboard_alerts(db, tenant_id))
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Header
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from typing import List, Optional
 from models.esl import ESLDeviceModel, ESLDeviceCreate, ESLDeviceUpdate, SettingModel
 from utils.auth import require_permission
-from middleware.tenant import get_tenant_from_token
+from middleware.tenant import get_tenant_id
 from bson import ObjectId
 from datetime import datetime
 
@@ -13,14 +13,37 @@ def _base_query(tenant_id: Optional[str]) -> dict:
     return {"tenantId": tenant_id} if tenant_id else {}
 
 
+# Cleared when the device is refreshed (update-price / update-all)
+REFRESH_FIELDS = {"refreshStatus": "", "refreshBatch": "", "refreshRequestedAt": ""}
+
+
+async def enqueue_device_refresh(db, tenant_id: Optional[str], product_ids: List[str],
+                                 device_ids: List[str], batch: ObjectId) -> int:
+    """
+    Queue the ESL devices showing these products (linked by esl_devices.productId or
+    products.eslDeviceId) for a refresh with one update_many. Returns devices queued.
+    """
+    conditions = []
+    if product_ids:
+        conditions.append({"productId": {"$in": product_ids}})
+    if device_ids:
+        conditions.append({"deviceId": {"$in": device_ids}})
+    if not conditions:
+        return 0
+    result = await db.esl_devices.update_many(
+        {**_base_query(tenant_id), "$or": conditions},
+        {"$set": {"refreshStatus": "pending", "refreshBatch": batch, "refreshRequestedAt": datetime.utcnow()}}
+    )
+    return result.matched_count
+
+
 @router.get("/devices", response_model=List[dict])
 async def get_esl_devices(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Get all ESL devices"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     devices = await db.esl_devices.find(base).to_list(1000)
     for device in devices:
@@ -28,15 +51,30 @@ async def get_esl_devices(
     return devices
 
 
+@router.get("/refresh-queue", response_model=List[dict])
+async def get_refresh_queue(
+    limit: int = Query(500, ge=1, le=5000),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("products"))
+):
+    from server import db
+    """ESL devices waiting for a refresh (e.g. after a bulk price change), oldest first"""
+    base = _base_query(tenant_id)
+    devices = await db.esl_devices.find({"refreshStatus": "pending", **base}).sort("refreshRequestedAt", 1).to_list(limit)
+    for device in devices:
+        device['_id'] = str(device['_id'])
+        device['refreshBatch'] = str(device['refreshBatch'])
+    return devices
+
+
 @router.get("/devices/{device_id}", response_model=dict)
 async def get_esl_device(
     device_id: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Get ESL device by deviceId"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     device = await db.esl_devices.find_one({"deviceId": device_id, **base})
     if not device:
@@ -49,12 +87,11 @@ async def get_esl_device(
 @router.post("/devices", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_esl_device(
     device: ESLDeviceCreate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Register new ESL device"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     existing = await db.esl_devices.find_one({"deviceId": device.deviceId, **base})
     if existing:
@@ -77,12 +114,11 @@ async def create_esl_device(
 async def update_esl_device(
     device_id: str,
     device: ESLDeviceUpdate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Update ESL device"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     query = {"deviceId": device_id, **base}
 
@@ -107,12 +143,11 @@ async def update_esl_device(
 @router.post("/devices/{device_id}/update-price", response_model=dict)
 async def update_device_price(
     device_id: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Update price on ESL device"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     device = await db.esl_devices.find_one({"deviceId": device_id, **base})
     if not device:
@@ -123,7 +158,7 @@ async def update_device_price(
 
     await db.esl_devices.update_one(
         {"deviceId": device_id, **base},
-        {"$set": {"lastUpdate": datetime.utcnow()}}
+        {"$set": {"lastUpdate": datetime.utcnow()}, "$unset": REFRESH_FIELDS}
     )
 
     updated_device = await db.esl_devices.find_one({"deviceId": device_id})
@@ -134,16 +169,15 @@ async def update_device_price(
 
 @router.post("/update-all")
 async def update_all_devices(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Update all online ESL devices for current tenant"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     result = await db.esl_devices.update_many(
         {"status": "online", **base},
-        {"$set": {"lastUpdate": datetime.utcnow()}}
+        {"$set": {"lastUpdate": datetime.utcnow()}, "$unset": REFRESH_FIELDS}
     )
 
     return {
@@ -154,12 +188,11 @@ async def update_all_devices(
 
 @router.get("/settings", response_model=List[dict])
 async def get_settings(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Get all settings for current tenant"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     settings = await db.settings.find(base).to_list(1000)
     for setting in settings:
@@ -170,12 +203,11 @@ async def get_settings(
 @router.get("/settings/{key}", response_model=dict)
 async def get_setting(
     key: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Get setting by key"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     setting = await db.settings.find_one({"key": key, **base})
     if not setting:
@@ -189,12 +221,11 @@ async def get_setting(
 async def update_setting(
     key: str,
     value: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     from server import db
     """Update or create setting for current tenant"""
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     result = await db.settings.update_one(
         {"key": key, **base},
@@ -0,0 +1,447 @@
+"""
+Inventory Count Routes - جلسات الجرد بالـ RFID
+
+A session is opened per warehouse, handhelds stream scanned tags in batches and the
+server keeps one document per (session, tag) in `inventory_count_scans`, classified at
+scan time with one $in query per batch. Missing units are found by walking the
+warehouse's available units in batches against the scans, so a store with 100k units
+is reconciled without loading it into memory. Closing applies the adjustments in one
+bulk write per collection.
+"""
+import os
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from typing import AsyncIterator, Dict, List, Optional
+from models.inventory_count import InventoryCountCreate, InventoryCountScan, InventoryCountClose
+from utils.auth import require_permission, get_auth_context
+from utils.database import run_in_transaction, transactions_supported
+from utils.dashboard_cache import invalidate_dashboard
+from utils.product_cache import invalidate_products
+from utils.stock_state import stock_inc_pipeline
+from middleware.tenant import get_tenant_id
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from datetime import datetime, timezone
+
+router = APIRouter(prefix="/api/inventory-counts", tags=["inventory-counts"])
+
+# Units per $in query when reconciling
+COUNT_BATCH = int(os.environ.get("INVENTORY_COUNT_BATCH", "1000"))
+
+MATCHED = "matched"
+UNEXPECTED = "unexpected"
+WRONG_WAREHOUSE = "wrong_warehouse"
+MISSING = "missing"
+SCAN_RESULTS = (MATCHED, UNEXPECTED, WRONG_WAREHOUSE)
+
+
+def _base_query(tenant_id: Optional[str]) -> dict:
+    return {"tenantId": tenant_id} if tenant_id else {}
+
+
+def _serialize(doc: dict) -> dict:
+    doc["_id"] = str(doc["_id"])
+    return doc
+
+
+def _expected_query(count: dict) -> dict:
+    """Units the warehouse should have on the shelf."""
+    return {**_base_query(count.get("tenantId")), "warehouseId": count["warehouseId"], "status": "available"}
+
+
+def classify_scan(unit: Optional[dict], warehouse_id: str) -> str:
+    """matched / wrong_warehouse for available units, unexpected for unknown tags and sold/damaged/missing units."""
+    if not unit or unit.get("status") != "available":
+        return UNEXPECTED
+    if unit.get("warehouseId") != warehouse_id:
+        return WRONG_WAREHOUSE
+    return MATCHED
+
+
+async def _get_count(db, count_id: str, tenant_id: Optional[str]) -> dict:
+    if not ObjectId.is_valid(count_id):
+        raise HTTPException(status_code=400, detail="Invalid count session ID")
+    count = await db.inventory_counts.find_one({"_id": ObjectId(count_id), **_base_query(tenant_id)})
+    if not count:
+        raise HTTPException(status_code=404, detail="Count session not found")
+    return count
+
+
+def _require_open(count: dict, *also: str) -> None:
+    if count["status"] != "open" and count["status"] not in also:
+        raise HTTPException(status_code=400, detail=f"Count session is {count['status']}")
+
+
+async def record_scans(db, count: dict, tags: List[str]) -> dict:
+    """
+    Deduplicate a batch against itself and the session (unique (sessionId, rfidTag) upserts),
+    classify the new tags with one $in on product_units and store them in one bulk_write.
+    """
+    received = len(tags)
+    tags = list(dict.fromkeys(t.strip() for t in tags if t and t.strip()))
+    result = {"received": received, "new": 0, "duplicates": 0, **{r: 0 for r in SCAN_RESULTS}, "flagged": []}
+    if not tags:
+        return result
+
+    session_id = str(count["_id"])
+    units = {
+        u["rfidTag"]: u
+        async for u in db.product_units.find(
+            {**_base_query(count.get("tenantId")), "rfidTag": {"$in": tags}},
+            {"rfidTag": 1, "productId": 1, "warehouseId": 1, "status": 1}
+        )
+    }
+    now = datetime.now(timezone.utc)
+    classified = []
+    ops = []
+    for tag in tags:
+        unit = units.get(tag)
+        outcome = classify_scan(unit, count["warehouseId"])
+        classified.append(outcome)
+        ops.append(UpdateOne(
+            {"sessionId": session_id, "rfidTag": tag},
+            {"$setOnInsert": {
+                "tenantId": count.get("tenantId"),
+                "result": outcome,
+                "unitId": str(unit["_id"]) if unit else None,
+                "productId": unit.get("productId") if unit else None,
+                "unitWarehouseId": unit.get("warehouseId") if unit else None,
+                "unitStatus": unit.get("status") if unit else None,
+                "scannedAt": now
+            }},
+            upsert=True
+        ))
+    written = await db.inventory_count_scans.bulk_write(ops, ordered=False)
+
+    for index in written.upserted_ids:
+        outcome = classified[index]
+        result[outcome] += 1
+        if outcome != MATCHED:
+            result["flagged"].append({"tag": tags[index], "result": outcome})
+    result["new"] = len(written.upserted_ids)
+    result["duplicates"] = received - result["new"]
+
+    if result["new"]:
+        await db.inventory_counts.update_one(
+            {"_id": count["_id"]},
+            {"$inc": {"scanned": result["new"]}, "$set": {"updatedAt": now}}
+        )
+    return result
+
+
+async def iter_missing(db, count: dict, batch_size: Optional[int] = None) -> AsyncIterator[List[dict]]:
+    """Batches of expected units that were not scanned - one $in on the scans per batch."""
+    batch_size = batch_size or COUNT_BATCH
+    session_id = str(count["_id"])
+
+    async def unscanned(units):
+        cursor = db.inventory_count_scans.find(
+            {"sessionId": session_id, "rfidTag": {"$in": [u["rfidTag"] for u in units]}}, {"rfidTag": 1}
+        )
+        scanned = {s["rfidTag"] async for s in cursor}
+        return [u for u in units if u["rfidTag"] not in scanned]
+
+    batch = []
+    cursor = db.product_units.find(_expected_query(count), {"rfidTag": 1, "productId": 1}).sort("_id", 1)
+    async for unit in cursor:
+        batch.append(unit)
+        if len(batch) >= batch_size:
+            missing = await unscanned(batch)
+            if missing:
+                yield missing
+            batch = []
+    if batch:
+        missing = await unscanned(batch)
+        if missing:
+            yield missing
+
+
+async def session_summary(db, count: dict) -> dict:
+    """Expected / scanned / difference counts from indexed counts, no unit is loaded."""
+    if count.get("summary"):
+        return count["summary"]
+    counts = {r: 0 for r in SCAN_RESULTS}
+    pipeline = [
+        {"$match": {"sessionId": str(count["_id"])}},
+        {"$group": {"_id": "$result", "count": {"$sum": 1}}},
+    ]
+    async for row in db.inventory_count_scans.aggregate(pipeline):
+        counts[row["_id"]] = row["count"]
+    expected = await db.product_units.count_documents(_expected_query(count))
+    return {
+        "expected": expected,
+        "scanned": sum(counts.values()),
+        "matched": counts[MATCHED],
+        "missing": max(0, expected - counts[MATCHED]),
+        "unexpected": counts[UNEXPECTED],
+        "wrongWarehouse": counts[WRONG_WAREHOUSE],
+    }
+
+
+async def marked_missing(db, count: dict, session=None) -> Dict[Optional[str], int]:
+    """Units this session marked missing, per product - whatever attempt marked them."""
+    pipeline = [
+        {"$match": {**_base_query(count.get("tenantId")), "countSessionId": str(count["_id"]), "status": MISSING}},
+        {"$group": {"_id": "$productId", "count": {"$sum": 1}}},
+    ]
+    return {row["_id"]: row["count"] async for row in db.product_units.aggregate(pipeline, session=session)}
+
+
+async def close_count(db, count: dict, apply: bool, notes: Optional[str] = None) -> dict:
+    """
+    Close a session. With apply=True missing units are marked `missing` (and product stock
+    lowered), units found here from another warehouse are moved to it - one bulk_write for
+    product_units and one for products, in a transaction when available.
+
+    Without transactions a failed close cannot be rolled back: the session is left `failed`
+    and closing it again finishes the job. Every step is safe to repeat - units carry the
+    session in countSessionId, stock is lowered from those marks and each product carries
+    the session in lastCountSessionId once its stock was lowered.
+    """
+    atomic = await transactions_supported(db)
+    # Claim the session so two closes cannot apply the same adjustments; a retry after a
+    # failed close keeps the apply choice of the first attempt
+    claimed = await db.inventory_counts.find_one_and_update(
+        {"_id": count["_id"], "status": {"$in": ["open", "failed"]}},
+        [{"$set": {"status": "closing", "closeApply": {"$ifNull": ["$closeApply", apply]}}}],
+        return_document=ReturnDocument.AFTER
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Count session is already being closed")
+    apply = claimed["closeApply"]
+    session_id = str(count["_id"])
+    stock: Dict[Optional[str], int] = {}
+
+    try:
+        summary = await session_summary(db, claimed)
+        if not atomic:
+            # Kept for a retry: the expected / matched counts change once units are marked
+            await db.inventory_counts.update_one({"_id": count["_id"]}, {"$set": {"summary": summary}})
+        base = _base_query(count.get("tenantId"))
+        now = datetime.now(timezone.utc)
+        unit_ops = []
+        adjustments = {"markedMissing": 0, "relocated": 0}
+
+        if apply:
+            async for batch in iter_missing(db, claimed):
+                unit_ops.append(UpdateMany(
+                    {"_id": {"$in": [u["_id"] for u in batch]}, "status": "available"},
+                    {"$set": {"status": MISSING, "countSessionId": session_id, "updatedAt": now}}
+                ))
+
+            tags = []
+            cursor = db.inventory_count_scans.find(
+                {"sessionId": session_id, "result": WRONG_WAREHOUSE}, {"rfidTag": 1}
+            )
+            async for scan in cursor:
+                tags.append(scan["rfidTag"])
+                if len(tags) >= COUNT_BATCH:
+                    unit_ops.append(UpdateMany({**base, "rfidTag": {"$in": tags}}, {"$set": {"warehouseId": count["warehouseId"], "updatedAt": now}}))
+                    adjustments["relocated"] += len(tags)
+                    tags = []
+            if tags:
+                unit_ops.append(UpdateMany({**base, "rfidTag": {"$in": tags}}, {"$set": {"warehouseId": count["warehouseId"], "updatedAt": now}}))
+                adjustments["relocated"] += len(tags)
+
+        closed = {
+            "status": "closed",
+            "applied": apply,
+            "summary": summary,
+            "adjustments": adjustments,
+            "closedAt": now,
+            "updatedAt": now,
+        }
+        if notes:
+            closed["closeNotes"] = notes
+
+        async def write(session):
+            if unit_ops:
+                await db.product_units.bulk_write(unit_ops, ordered=False, session=session)
+            stock.clear()
+            if apply:
+                stock.update(await marked_missing(db, count, session=session))
+            adjustments["markedMissing"] = sum(stock.values())
+            product_ops = [
+                UpdateOne(
+                    {"_id": ObjectId(pid), **base, "lastCountSessionId": {"$ne": session_id}},
+                    stock_inc_pipeline(-n, {"updatedAt": now, "lastCountSessionId": session_id})
+                )
+                for pid, n in stock.items() if pid and ObjectId.is_valid(pid)
+            ]
+            if product_ops:
+                await db.products.bulk_write(product_ops, ordered=False, session=session)
+            await db.inventory_counts.update_one(
+                {"_id": count["_id"]}, {"$set": closed, "$unset": {"closeError": ""}}, session=session
+            )
+
+        await run_in_transaction(db, write)
+    except Exception as e:
+        if atomic:
+            # Nothing was applied - the session is open again, for either choice of apply
+            restore = {"$set": {"status": "open"}, "$unset": {"closeApply": ""}}
+        else:
+            restore = {"$set": {"status": "failed", "closeError": str(e), "updatedAt": datetime.now(timezone.utc)}}
+        await db.inventory_counts.update_one({"_id": count["_id"], "status": "closing"}, restore)
+        raise
+    finally:
+        if stock:
+            invalidate_products(count.get("tenantId"), [pid for pid in stock if pid])
+            invalidate_dashboard(count.get("tenantId"))
+
+    return {**claimed, **closed}
+
+
+@router.get("", response_model=List[dict])
+async def get_counts(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    warehouse_id: Optional[str] = None,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("inventory_count"))
+):
+    """جلسات الجرد"""
+    from server import db
+    query = _base_query(tenant_id)
+    if status_filter:
+        query["status"] = status_filter
+    if warehouse_id:
+        query["warehouseId"] = warehouse_id
+    counts = await db.inventory_counts.find(query).sort("createdAt", -1).to_list(200)
+    return [_serialize(c) for c in counts]
+
+
+@router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
+async def open_count(
+    data: InventoryCountCreate,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("inventory_count")),
+    context: dict = Depends(get_auth_context)
+):
+    """فتح جلسة جرد - جلسة مفتوحة واحدة لكل مستودع"""
+    from server import db
+    base = _base_query(tenant_id)
+
+    if not ObjectId.is_valid(data.warehouseId):
+        raise HTTPException(status_code=400, detail="Invalid warehouse ID")
+    warehouse = await db.warehouses.find_one({"_id": ObjectId(data.warehouseId), **base}, {"name": 1})
+    if not warehouse:
+        raise HTTPException(status_code=404, detail="Warehouse not found")
+
+    existing = await db.inventory_counts.find_one(
+        {**base, "warehouseId": data.warehouseId, "status": {"$in": ["open", "closing", "failed"]}}, {"_id": 1}
+    )
+    if existing:
+        raise HTTPException(status_code=400, detail="An open count session already exists for this warehouse")
+
+    now = datetime.now(timezone.utc)
+    count = {
+        "tenantId": tenant_id,
+        "warehouseId": data.warehouseId,
+        "warehouseName": warehouse.get("name"),
+        "status": "open",
+        "scanned": 0,
+        "notes": data.notes,
+        "openedBy": context.get("username"),
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    await db.inventory_counts.insert_one(count)
+    return _serialize(count)
+
+
+@router.get("/{count_id}", response_model=dict)
+async def get_count(
+    count_id: str,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("inventory_count"))
+):
+    """جلسة جرد مع ملخص الفروقات"""
+    from server import db
+    count = await _get_count(db, count_id, tenant_id)
+    count["summary"] = await session_summary(db, count)
+    return _serialize(count)
+
+
+@router.post("/{count_id}/scans", response_model=dict)
+async def add_scans(
+    count_id: str,
+    data: InventoryCountScan,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("inventory_count"))
+):
+    """إضافة دفعة Tags ممسوحة"""
+    from server import db
+    count = await _get_count(db, count_id, tenant_id)
+    _require_open(count)
+    return await record_scans(db, count, data.tags)
+
+
+@router.get("/{count_id}/differences", response_model=dict)
+async def get_differences(
+    count_id: str,
+    type: str = Query(MISSING, pattern=f"^({MISSING}|{UNEXPECTED}|{WRONG_WAREHOUSE})$"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("inventory_count"))
+):
+    """الفروقات: missing / unexpected / wrong_warehouse (مع ترقيم الصفحات)"""
+    from server import db
+    count = await _get_count(db, count_id, tenant_id)
+
+    items = []
+    if type == MISSING:
+        if count["status"] == "closed" and count.get("applied"):
+            # Adjusted units are no longer available; list what this session marked
+            query = {**_base_query(count.get("tenantId")), "countSessionId": str(count["_id"]), "status": MISSING}
+            cursor = db.product_units.find(query, {"rfidTag": 1, "productId": 1}).sort("_id", 1).skip(skip).limit(limit)
+            items = [_serialize(u) async for u in cursor]
+        else:
+            to_skip = skip
+            async for batch in iter_missing(db, count):
+                if to_skip >= len(batch):
+                    to_skip -= len(batch)
+                    continue
+                items.extend(_serialize(u) for u in batch[to_skip:])
+                to_skip = 0
+                if len(items) >= limit:
+                    break
+            items = items[:limit]
+    else:
+        cursor = db.inventory_count_scans.find(
+            {"sessionId": str(count["_id"]), "result": type}
+        ).sort("rfidTag", 1).skip(skip).limit(limit)
+        items = [_serialize(s) async for s in cursor]
+
+    return {"type": type, "skip": skip, "limit": limit, "items": items}
+
+
+@router.post("/{count_id}/close", response_model=dict)
+async def close_count_session(
+    count_id: str,
+    data: InventoryCountClose,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("inventory_count"))
+):
+    """إغلاق الجلسة وتطبيق التعديلات (أو إكمال إغلاق فشل سابقاً)"""
+    from server import db
+    count = await _get_count(db, count_id, tenant_id)
+    _require_open(count, "failed")
+    return _serialize(await close_count(db, count, data.apply, data.notes))
+
+
+@router.post("/{count_id}/cancel", response_model=dict)
+async def cancel_count(
+    count_id: str,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("inventory_count"))
+):
+    """إلغاء الجلسة بدون أي تعديل"""
+    from server import db
+    count = await _get_count(db, count_id, tenant_id)
+    _require_open(count)
+    now = datetime.now(timezone.utc)
+    await db.inventory_counts.update_one(
+        {"_id": count["_id"], "status": "open"},
+        {"$set": {"status": "cancelled", "closedAt": now, "updatedAt": now}}
+    )
+    await db.inventory_count_scans.delete_many({"sessionId": str(count["_id"])})
+    return {"message": "Count session cancelled"}
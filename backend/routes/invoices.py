@@ -1,23 +1,185 @@
 """
 Invoices Routes - Multi-Tenant Support
 """
-from fastapi import APIRouter, HTTPException, status, Header, Depends
-from typing import List, Optional
-from models.invoice import InvoiceModel, InvoiceCreate, InvoiceUpdate
-from middleware.tenant import get_tenant_from_token
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from typing import Dict, List, Optional
+from models.invoice import InvoiceModel, InvoiceCreate, InvoiceUpdate, InvoiceBatchCreate
+from pydantic import ValidationError
+from middleware.tenant import get_tenant_id
 from utils.auth import require_permission
+from utils import counters
+from utils.database import run_in_transaction
+from utils.costing import carry_line_costs, snapshot_line_costs
+from utils.dashboard_cache import invalidate_dashboard
+from utils.product_cache import invalidate_products
+from utils.rollups import apply_rollups
+from utils.stock_state import stock_inc_pipeline
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/api/invoices", tags=["invoices"])
 
+NUMBER_NOT_RESERVED = "Invoice number was not reserved"
+DUPLICATE_NUMBER = "Invoice number already used"
+DUPLICATE_CLIENT_REF = "Invoice with this clientRef already exists"
+
+
+def stock_decrement_ops(items: List[dict], tenant_id: Optional[str]) -> List[UpdateOne]:
+    """
+    One stock decrement per product (quantities of repeated lines are summed) for a single
+    bulk_write; each is a pipeline update that also recomputes stockState.
+    """
+    quantities: Dict[str, int] = {}
+    for item in items:
+        product_id = item.get('productId')
+        if product_id and ObjectId.is_valid(product_id):
+            quantities[product_id] = quantities.get(product_id, 0) + item['quantity']
+    base = {"tenantId": tenant_id} if tenant_id else {}
+    return [
+        UpdateOne({"_id": ObjectId(product_id), **base}, stock_inc_pipeline(-quantity))
+        for product_id, quantity in quantities.items()
+    ]
+
+
+def customer_charge_ops(invoices: List[dict], tenant_id: Optional[str]) -> List[UpdateOne]:
+    """Unpaid invoices lower the customer balance - one $inc per customer."""
+    amounts: Dict[str, float] = {}
+    for invoice in invoices:
+        customer_id = invoice.get('customerId')
+        if customer_id and ObjectId.is_valid(customer_id) and invoice.get('status') != 'paid':
+            amounts[customer_id] = amounts.get(customer_id, 0) + invoice['total']
+    base = {"tenantId": tenant_id} if tenant_id else {}
+    return [
+        UpdateOne({"_id": ObjectId(customer_id), **base}, {"$inc": {"balance": -amount}})
+        for customer_id, amount in amounts.items()
+    ]
+
+
+def prepare_invoice(invoice: InvoiceCreate, tenant_id: Optional[str], now: datetime) -> dict:
+    """Invoice document ready for insert (invoiceNumber is kept only if the client sent one)."""
+    invoice_dict = invoice.model_dump()
+    invoice_dict['tenantId'] = tenant_id
+    if not invoice_dict.get('date'):
+        invoice_dict['date'] = now
+    if not invoice_dict.get('dueDate'):
+        invoice_dict['dueDate'] = now
+    invoice_dict['createdAt'] = now
+    invoice_dict['updatedAt'] = now
+    return invoice_dict
+
+
+async def check_client_numbers(db, tenant_id: Optional[str], invoices: List[dict]) -> Dict[int, str]:
+    """
+    Client-sent invoiceNumbers must come from /number-block: numbers of the tenant sequence
+    that were already handed out and are not used by another invoice (or earlier in the batch).
+    Returns {index: error}; the unique (tenantId, invoiceNumber) index still guards races.
+    """
+    sent = {i: inv['invoiceNumber'] for i, inv in enumerate(invoices) if inv.get('invoiceNumber')}
+    if not sent:
+        return {}
+    issued = await counters.issued_value(db, tenant_id, counters.INVOICES)
+    base = {"tenantId": tenant_id} if tenant_id else {}
+    cursor = db.invoices.find({**base, "invoiceNumber": {"$in": list(set(sent.values()))}}, {"invoiceNumber": 1})
+    used = {doc['invoiceNumber'] async for doc in cursor}
+    errors: Dict[int, str] = {}
+    for i, number in sent.items():
+        value = counters.parse_invoice_number(number)
+        if value is None or value > issued:
+            errors[i] = NUMBER_NOT_RESERVED
+        elif number in used:
+            errors[i] = DUPLICATE_NUMBER
+        else:
+            used.add(number)
+    return errors
+
+
+async def invoices_by_client_ref(db, tenant_id: Optional[str], refs: List[Optional[str]]) -> Dict[str, dict]:
+    """Stored invoices of the tenant for the given clientRefs (offline queue resends) - one $in query."""
+    refs = list({ref for ref in refs if ref})
+    if not refs:
+        return {}
+    base = {"tenantId": tenant_id} if tenant_id else {}
+    cursor = db.invoices.find({**base, "clientRef": {"$in": refs}}, {"invoiceNumber": 1, "clientRef": 1})
+    return {doc['clientRef']: doc async for doc in cursor}
+
+
+def _write_error(err: dict) -> str:
+    if err.get("code") == 11000:
+        message = err.get("errmsg", "")
+        if "clientRef" in message:
+            return DUPLICATE_CLIENT_REF
+        if "invoiceNumber" in message:
+            return DUPLICATE_NUMBER
+    return err.get("errmsg", "write error")
+
+
+def _duplicate_key(e: BulkWriteError) -> Optional[str]:
+    """DUPLICATE_NUMBER / DUPLICATE_CLIENT_REF when every write error is one of those."""
+    messages = {_write_error(err) for err in e.details.get("writeErrors", [])}
+    if messages and messages <= {DUPLICATE_NUMBER, DUPLICATE_CLIENT_REF}:
+        return sorted(messages)[0]
+    return None
+
+
+async def insert_invoices(db, tenant_id: Optional[str], invoices: List[dict]) -> Dict[int, str]:
+    """
+    Persist prepared invoices: line costs are snapshot with one product query, then one
+    insert_many, the stock decrements of every inserted invoice in one bulk_write, the
+    customer balances and the daily rollups in one more each - inside one transaction
+    when the deployment supports it. Each dict gets its _id set in place (no re-read needed).
+    Returns {index: error} for invoices that were not inserted; inside a transaction any
+    failure aborts the whole batch and is raised instead (409 for a number or clientRef
+    taken meanwhile).
+    """
+    touched: List[str] = []
+    await snapshot_line_costs(db, tenant_id, invoices)
+
+    async def write(session):
+        failed: Dict[int, str] = {}
+        try:
+            await db.invoices.insert_many(invoices, ordered=False, session=session)
+        except BulkWriteError as e:
+            if session is not None:
+                raise
+            failed = {err["index"]: _write_error(err) for err in e.details.get("writeErrors", [])}
+        inserted = [inv for i, inv in enumerate(invoices) if i not in failed]
+        stock_ops = stock_decrement_ops([item for inv in inserted for item in inv['items']], tenant_id)
+        if stock_ops:
+            await db.products.bulk_write(stock_ops, ordered=False, session=session)
+            touched[:] = [op._filter["_id"] for op in stock_ops]
+        charge_ops = customer_charge_ops(inserted, tenant_id)
+        if charge_ops:
+            await db.customers.bulk_write(charge_ops, ordered=False, session=session)
+        await apply_rollups(db, "invoices", added=inserted, session=session)
+        return failed
+
+    try:
+        failed = await run_in_transaction(db, write)
+    except BulkWriteError as e:
+        duplicate = _duplicate_key(e)
+        if duplicate:
+            raise HTTPException(status_code=409, detail=duplicate)
+        raise
+    invalidate_products(tenant_id, touched)
+    invalidate_dashboard(tenant_id)
+    return failed
+
+
+async def insert_invoice(db, tenant_id: Optional[str], invoice_dict: dict) -> dict:
+    """Persist one prepared invoice (see insert_invoices); returns it with _id set."""
+    failed = await insert_invoices(db, tenant_id, [invoice_dict])
+    if failed:
+        raise HTTPException(status_code=409 if failed[0] == DUPLICATE_NUMBER else 500, detail=failed[0])
+    return invoice_dict
+
 
 @router.get("", response_model=List[dict])
-async def get_invoices(authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("invoices"))):
+async def get_invoices(tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("invoices"))):
     """Get all invoices for tenant"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"tenantId": tenant_id} if tenant_id else {}
     
     invoices = await db.invoices.find(query).sort("createdAt", -1).to_list(1000)
@@ -27,14 +189,13 @@ async def get_invoices(authorization: Optional[str] = Header(None), _: dict = De
 
 
 @router.get("/{invoice_id}", response_model=dict)
-async def get_invoice(invoice_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("invoices"))):
+async def get_invoice(invoice_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("invoices"))):
     """Get invoice by ID"""
     from server import db
     
     if not ObjectId.is_valid(invoice_id):
         raise HTTPException(status_code=400, detail="Invalid invoice ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(invoice_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -47,66 +208,145 @@ async def get_invoice(invoice_id: str, authorization: Optional[str] = Header(Non
     return invoice
 
 
-@router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
-async def create_invoice(invoice: InvoiceCreate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("invoices"))):
-    """Create new invoice"""
+@router.post("/number-block", response_model=dict)
+async def reserve_invoice_numbers(
+    size: int = Query(100, ge=1, le=10000),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("invoices")),
+):
+    """Reserve a block of invoice numbers for an offline terminal (sent back as invoiceNumber)."""
     from server import db
-    
-    tenant_id = get_tenant_from_token(authorization)
-    
-    # Generate invoice number per tenant
-    count_query = {"tenantId": tenant_id} if tenant_id else {}
-    count = await db.invoices.count_documents(count_query)
-    invoice_number = f"INV-{str(count + 1).zfill(4)}"
-    
-    invoice_dict = invoice.model_dump()
-    invoice_dict['tenantId'] = tenant_id
-    invoice_dict['invoiceNumber'] = invoice_number
-    
+
+    block = await counters.reserve(db, tenant_id, counters.INVOICES, size, counters.invoice_baseline(db, tenant_id))
+    return {
+        "start": block[0],
+        "end": block[-1],
+        "numbers": [counters.format_invoice_number(v) for v in block],
+    }
+
+
+@router.post("/batch", response_model=dict)
+async def create_invoices_batch(
+    payload: InvoiceBatchCreate,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("invoices")),
+):
+    """
+    Create many invoices in one request (offline POS queue flush).
+    Numbers come from one counter reservation, stock and customer balances from one
+    bulk_write each. Results are returned per invoice, in request order.
+    An invoice whose clientRef is already stored (a resend after a lost response) is not
+    created again: the stored invoice is returned as "created".
+    """
+    from server import db
+
+    def created_result(index: int, invoice: dict) -> dict:
+        return {
+            "index": index,
+            "status": "created",
+            "_id": str(invoice['_id']),
+            "invoiceNumber": invoice['invoiceNumber'],
+            "clientRef": invoice.get('clientRef'),
+        }
+
     now = datetime.now(timezone.utc)
-    if not invoice_dict.get('date'):
-        invoice_dict['date'] = now
-    if not invoice_dict.get('dueDate'):
-        invoice_dict['dueDate'] = now
-    
-    invoice_dict['createdAt'] = now
-    invoice_dict['updatedAt'] = now
-    
-    # Update customer balance
-    if invoice_dict.get('customerId') and invoice_dict['customerId'] and invoice_dict['status'] != 'paid':
+    results: List[dict] = [None] * len(payload.invoices)
+    prepared: List[dict] = []
+    positions: List[int] = []
+    for index, raw in enumerate(payload.invoices):
         try:
-            if ObjectId.is_valid(invoice_dict['customerId']):
-                await db.customers.update_one(
-                    {"_id": ObjectId(invoice_dict['customerId'])},
-                    {"$inc": {"balance": -invoice_dict['total']}}
-                )
-        except:
-            pass
+            invoice = InvoiceCreate.model_validate(raw)
+        except ValidationError as e:
+            err = e.errors()[0]
+            field = ".".join(str(part) for part in err.get("loc", ()))
+            results[index] = {"index": index, "status": "error", "message": f"{field}: {err.get('msg')}"}
+            continue
+        invoice_dict = prepare_invoice(invoice, tenant_id, now)
+        client_ref = raw.get("clientRef")
+        if isinstance(client_ref, str) and client_ref.strip():
+            invoice_dict['clientRef'] = client_ref.strip()
+        prepared.append(invoice_dict)
+        positions.append(index)
+
+    # Resends: clientRefs already stored, or repeated earlier in this batch
+    stored = await invoices_by_client_ref(db, tenant_id, [inv.get('clientRef') for inv in prepared])
+    first: Dict[str, int] = {}
+    repeats: Dict[int, str] = {}
+    fresh: List[int] = []
+    for i, (index, inv) in enumerate(zip(positions, prepared)):
+        ref = inv.get('clientRef')
+        if ref in stored:
+            results[index] = created_result(index, stored[ref])
+        elif ref in first:
+            repeats[index] = ref
+        else:
+            if ref:
+                first[ref] = index
+            fresh.append(i)
+    prepared = [prepared[i] for i in fresh]
+    positions = [positions[i] for i in fresh]
+
+    rejected = await check_client_numbers(db, tenant_id, prepared)
+    for i, message in rejected.items():
+        results[positions[i]] = {"index": positions[i], "status": "error", "message": message}
+    prepared = [inv for i, inv in enumerate(prepared) if i not in rejected]
+    positions = [pos for i, pos in enumerate(positions) if i not in rejected]
+
+    unnumbered = [inv for inv in prepared if not inv.get('invoiceNumber')]
+    if unnumbered:
+        block = await counters.reserve(
+            db, tenant_id, counters.INVOICES, len(unnumbered), counters.invoice_baseline(db, tenant_id)
+        )
+        for inv, value in zip(unnumbered, block):
+            inv['invoiceNumber'] = counters.format_invoice_number(value)
+
+    failed = await insert_invoices(db, tenant_id, prepared) if prepared else {}
+    # Without a transaction a concurrent resend can win the race on the clientRef index
+    raced = await invoices_by_client_ref(
+        db, tenant_id, [prepared[i].get('clientRef') for i, message in failed.items() if message == DUPLICATE_CLIENT_REF]
+    )
+    for i, (index, inv) in enumerate(zip(positions, prepared)):
+        if i not in failed:
+            results[index] = created_result(index, inv)
+        elif inv.get('clientRef') in raced:
+            results[index] = created_result(index, raced[inv['clientRef']])
+        else:
+            results[index] = {"index": index, "status": "error", "message": failed[i]}
+    for index, ref in repeats.items():
+        results[index] = {**results[first[ref]], "index": index}
+
+    created = sum(1 for r in results if r["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
+async def create_invoice(invoice: InvoiceCreate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("invoices"))):
+    """Create new invoice"""
+    from server import db
     
-    # Update product stock
-    for item in invoice_dict['items']:
-        if item.get('productId') and ObjectId.is_valid(item['productId']):
-            await db.products.update_one(
-                {"_id": ObjectId(item['productId'])},
-                {"$inc": {"stock": -item['quantity']}}
-            )
+    invoice_dict = prepare_invoice(invoice, tenant_id, datetime.now(timezone.utc))
+    # Number from a pre-allocated block (offline terminal) or the next one of the tenant sequence
+    rejected = await check_client_numbers(db, tenant_id, [invoice_dict])
+    if rejected:
+        raise HTTPException(status_code=409 if rejected[0] == DUPLICATE_NUMBER else 400, detail=rejected[0])
+    if not invoice_dict.get('invoiceNumber'):
+        value = await counters.next_value(db, tenant_id, counters.INVOICES, counters.invoice_baseline(db, tenant_id))
+        invoice_dict['invoiceNumber'] = counters.format_invoice_number(value)
     
-    result = await db.invoices.insert_one(invoice_dict)
-    created_invoice = await db.invoices.find_one({"_id": result.inserted_id})
-    created_invoice['_id'] = str(created_invoice['_id'])
+    await insert_invoice(db, tenant_id, invoice_dict)
+    invoice_dict['_id'] = str(invoice_dict['_id'])
     
-    return created_invoice
+    return invoice_dict
 
 
 @router.put("/{invoice_id}", response_model=dict)
-async def update_invoice(invoice_id: str, invoice: InvoiceUpdate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("invoices"))):
+async def update_invoice(invoice_id: str, invoice: InvoiceUpdate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("invoices"))):
     """Update invoice"""
     from server import db
     
     if not ObjectId.is_valid(invoice_id):
         raise HTTPException(status_code=400, detail="Invalid invoice ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(invoice_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -117,31 +357,37 @@ async def update_invoice(invoice_id: str, invoice: InvoiceUpdate, authorization:
     
     update_data = {k: v for k, v in invoice.model_dump().items() if v is not None}
     update_data['updatedAt'] = datetime.now(timezone.utc)
+    if update_data.get('items'):
+        carry_line_costs(existing.get('items') or [], update_data['items'])
+        await snapshot_line_costs(db, existing.get('tenantId'), [update_data])
     
     await db.invoices.update_one(query, {"$set": update_data})
     
     updated_invoice = await db.invoices.find_one({"_id": ObjectId(invoice_id)})
+    await apply_rollups(db, "invoices", removed=[existing], added=[updated_invoice])
+    invalidate_dashboard(existing.get("tenantId"))
     updated_invoice['_id'] = str(updated_invoice['_id'])
     
     return updated_invoice
 
 
 @router.delete("/{invoice_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_invoice(invoice_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("invoices"))):
+async def delete_invoice(invoice_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("invoices"))):
     """Delete invoice"""
     from server import db
     
     if not ObjectId.is_valid(invoice_id):
         raise HTTPException(status_code=400, detail="Invalid invoice ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(invoice_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
     
-    result = await db.invoices.delete_one(query)
+    deleted = await db.invoices.find_one_and_delete(query)
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Invoice not found")
+    await apply_rollups(db, "invoices", removed=[deleted])
+    invalidate_dashboard(deleted.get("tenantId"))
     
     return None
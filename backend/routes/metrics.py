@@ -0,0 +1,22 @@
+"""
+Metrics Routes - in-process cache and pool counters (super admin only).
+Values are per worker process.
+"""
+from fastapi import APIRouter, Depends
+from utils.auth import require_super_admin, get_permission_cache_stats
+from utils.dashboard_cache import get_dashboard_cache_stats
+from utils.password_hashing import get_hashing_stats
+from utils.product_cache import get_product_cache_stats
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("")
+async def get_metrics(_: dict = Depends(require_super_admin)):
+    """Hit/miss counters of the in-process caches and pool usage for this worker."""
+    return {
+        "permissionCache": get_permission_cache_stats(),
+        "passwordHashing": get_hashing_stats(),
+        "productCache": get_product_cache_stats(),
+        "dashboardCache": get_dashboard_cache_stats(),
+    }
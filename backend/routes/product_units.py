@@ -1,18 +1,82 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
-from typing import List, Optional
+import csv
+import json
+import os
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
 from datetime import datetime
 from bson import ObjectId
-from models.product_unit import ProductUnitCreate, ProductUnitUpdate, ProductUnitBulkCreate
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from utils.database import run_in_transaction
+from utils.dashboard_cache import invalidate_dashboard
+from utils.product_cache import invalidate_products
+from utils.stock_state import stock_inc_pipeline
+from models.product_unit import ProductUnitCreate, ProductUnitUpdate, ProductUnitBulkCreate, ProductUnitResolve, ProductUnitBulkStatus
 from utils.auth import require_permission
-from middleware.tenant import get_tenant_from_token
+from middleware.tenant import get_tenant_id
 
 router = APIRouter(prefix="/api")
 
+# Units per insert_many call (purchase receipts and bulk tag registration)
+UNIT_INSERT_CHUNK = int(os.environ.get("UNIT_INSERT_CHUNK", "1000"))
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+CSV_TYPES = {"text/csv", "application/csv"}
+TAG_COLUMNS = {"rfidtag", "rfid_tag", "tag"}
+
+# Tags per streamed chunk of /product-units/resolve
+RESOLVE_CHUNK = int(os.environ.get("RESOLVE_CHUNK", "500"))
+UNIT_FIELDS = {"productId": 1, "rfidTag": 1, "status": 1, "warehouseId": 1, "location": 1}
+# Allowed transitions for bulk status changes: target -> statuses it can come from
+STATUS_TRANSITIONS = {
+    "sold": {"available", "reserved"},
+    "reserved": {"available"},
+    "damaged": {"available", "reserved"},
+    "available": {"reserved", "damaged", "sold"},
+}
+# Units in these statuses are no longer counted in product stock
+OUT_OF_STOCK = {"sold", "missing"}
+
+PRODUCT_FIELDS = {"name": 1, "nameEn": 1, "sku": 1, "barcode": 1, "rfidTag": 1, "salePrice": 1, "stock": 1, "category": 1}
+
 
 def _base_query(tenant_id: Optional[str]) -> dict:
     return {"tenantId": tenant_id} if tenant_id else {}
 
 
+async def existing_tags(db, tenant_id: Optional[str], tags: Iterable[str], session=None) -> Set[str]:
+    """Tags already registered for the tenant - one $in query."""
+    tags = list(tags)
+    if not tags:
+        return set()
+    cursor = db.product_units.find(
+        {**_base_query(tenant_id), "rfidTag": {"$in": tags}}, {"rfidTag": 1, "_id": 0}, session=session
+    )
+    return {doc["rfidTag"] async for doc in cursor}
+
+
+async def insert_units(db, units: List[dict], session=None) -> List[str]:
+    """
+    Insert unit documents with chunked insert_many(ordered=False).
+    Tags rejected by the (tenantId, rfidTag) unique index are returned instead of raised;
+    other write errors - and any error inside a transaction - propagate.
+    """
+    skipped: List[str] = []
+    for start in range(0, len(units), UNIT_INSERT_CHUNK):
+        chunk = units[start:start + UNIT_INSERT_CHUNK]
+        try:
+            await db.product_units.insert_many(chunk, ordered=False, session=session)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if session is not None or any(err.get("code") != 11000 for err in errors):
+                raise
+            skipped.extend(chunk[err["index"]]["rfidTag"] for err in errors)
+    return skipped
+
+
 def serialize_unit(unit):
     if unit:
         unit["_id"] = str(unit["_id"])
@@ -24,12 +88,11 @@ async def get_all_units(
     product_id: Optional[str] = None,
     status: Optional[str] = None,
     warehouse_id: Optional[str] = None,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     """جلب جميع الوحدات مع فلترة اختيارية"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     query = {**base}
     if product_id:
@@ -46,12 +109,11 @@ async def get_all_units(
 @router.get("/product-units/{unit_id}")
 async def get_unit(
     unit_id: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     """جلب وحدة واحدة"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     unit = await db.product_units.find_one({"_id": ObjectId(unit_id), **base})
     if not unit:
@@ -62,12 +124,11 @@ async def get_unit(
 @router.get("/product-units/rfid/{rfid_tag}")
 async def get_unit_by_rfid(
     rfid_tag: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     """جلب وحدة بواسطة RFID Tag"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     unit = await db.product_units.find_one({"rfidTag": rfid_tag, **base})
     if not unit:
@@ -84,12 +145,11 @@ async def get_unit_by_rfid(
 @router.post("/product-units")
 async def create_unit(
     unit: ProductUnitCreate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     """إنشاء وحدة جديدة"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
 
     existing = await db.product_units.find_one({"rfidTag": unit.rfidTag, **base})
@@ -109,75 +169,259 @@ async def create_unit(
 
     await db.products.update_one(
         {"_id": ObjectId(unit.productId), **base},
-        {"$inc": {"stock": 1}}
+        stock_inc_pipeline(1)
     )
+    invalidate_products(tenant_id, [unit.productId])
+    invalidate_dashboard(tenant_id)
 
     unit_data["_id"] = str(result.inserted_id)
     return unit_data
 
 
+async def _body_lines(request: Request) -> AsyncIterator[str]:
+    """Non-empty lines of a streamed request body, without buffering the whole body."""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for raw in lines:
+            line = raw.decode("utf-8-sig").strip()
+            if line:
+                yield line
+    line = pending.decode("utf-8-sig").strip()
+    if line:
+        yield line
+
+
+async def _stream_tags(request: Request, csv_body: bool) -> AsyncIterator[Optional[str]]:
+    """
+    Tags from an NDJSON body (a JSON string or {"rfidTag": ...} per line) or a CSV body
+    (first column, or the rfidTag/tag column when there is a header row).
+    Unparseable lines and non-string tags (null, numbers, {"rfidTag": 123}) yield None.
+    """
+    column = None
+    async for line in _body_lines(request):
+        if csv_body:
+            row = next(csv.reader([line]))
+            if column is None:
+                header = [cell.strip().lower() for cell in row]
+                column = next((i for i, cell in enumerate(header) if cell in TAG_COLUMNS), None)
+                if column is not None:
+                    continue
+                column = 0
+            yield row[column] if column < len(row) else None
+        else:
+            try:
+                value = json.loads(line)
+            except ValueError:
+                yield None
+                continue
+            if isinstance(value, dict):
+                value = value.get("rfidTag")
+            yield value if isinstance(value, str) else None
+
+
+async def _iterate(tags: List[str]) -> AsyncIterator[str]:
+    for tag in tags:
+        yield tag
+
+
+async def _insert_tag_batch(db, tenant_id: Optional[str], product_id: str, warehouse_id: Optional[str],
+                            tags: List[str]) -> Tuple[List[dict], List[str]]:
+    """One $in duplicate check and one chunked insert for a batch of new tags."""
+    taken = await existing_tags(db, tenant_id, tags)
+    now = datetime.utcnow()
+    units = [
+        {
+            "tenantId": tenant_id,
+            "productId": product_id,
+            "rfidTag": tag,
+            "status": "available",
+            "warehouseId": warehouse_id,
+            "createdAt": now,
+            "updatedAt": now
+        }
+        for tag in tags if tag not in taken
+    ]
+    # Tags registered concurrently since the $in check come back from the unique index
+    rejected = set(await insert_units(db, units))
+    skipped = [tag for tag in tags if tag in taken or tag in rejected]
+    return [u for u in units if u["rfidTag"] not in rejected], skipped
+
+
+async def register_tags(db, tenant_id: Optional[str], product_id: str, warehouse_id: Optional[str],
+                        tags: AsyncIterator[Optional[str]], keep_units: bool = True) -> dict:
+    """
+    Register tags for a product in batches of UNIT_INSERT_CHUNK and raise its stock once.
+    Tags repeated in the request or already registered are reported as skipped.
+    """
+    seen: Set[str] = set()
+    batch: List[str] = []
+    created: List[dict] = []
+    created_count = 0
+    skipped: List[str] = []
+    invalid = 0
+
+    async def flush():
+        nonlocal created_count
+        units, batch_skipped = await _insert_tag_batch(db, tenant_id, product_id, warehouse_id, batch)
+        created_count += len(units)
+        skipped.extend(batch_skipped)
+        if keep_units:
+            created.extend(serialize_unit(u) for u in units)
+        batch.clear()
+
+    async for tag in tags:
+        tag = tag.strip() if isinstance(tag, str) else ""
+        if not tag:
+            invalid += 1
+        elif tag in seen:
+            skipped.append(tag)
+        else:
+            seen.add(tag)
+            batch.append(tag)
+            if len(batch) >= UNIT_INSERT_CHUNK:
+                await flush()
+    if batch:
+        await flush()
+
+    if created_count:
+        await db.products.update_one(
+            {"_id": ObjectId(product_id), **_base_query(tenant_id)},
+            stock_inc_pipeline(created_count)
+        )
+        invalidate_products(tenant_id, [product_id])
+        invalidate_dashboard(tenant_id)
+
+    result = {
+        "created": created_count,
+        "skipped": len(skipped),
+        "skippedTags": skipped,
+        "invalid": invalid
+    }
+    if keep_units:
+        result["units"] = created
+    return result
+
+
 @router.post("/product-units/bulk")
 async def create_units_bulk(
-    data: ProductUnitBulkCreate,
-    authorization: Optional[str] = Header(None),
+    request: Request,
+    product_id: Optional[str] = None,
+    warehouse_id: Optional[str] = None,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
-    """إنشاء عدة وحدات دفعة واحدة"""
+    """
+    إنشاء عدة وحدات دفعة واحدة
+    JSON body: ProductUnitBulkCreate (units are returned).
+    application/x-ndjson or text/csv body: one tag per line, streamed;
+    productId/warehouseId come from ?product_id=&warehouse_id= and only counts are returned.
+    """
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
 
-    product = await db.products.find_one({"_id": ObjectId(data.productId), **base})
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    streamed = content_type in NDJSON_TYPES or content_type in CSV_TYPES
+    if streamed:
+        if not product_id:
+            raise HTTPException(status_code=400, detail="product_id is required for streamed bodies")
+        tags = _stream_tags(request, csv_body=content_type in CSV_TYPES)
+    else:
+        try:
+            data = ProductUnitBulkCreate.model_validate(await request.json())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        product_id, warehouse_id = data.productId, data.warehouseId
+        tags = _iterate(data.rfidTags)
+
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(status_code=400, detail="Invalid product ID")
+    product = await db.products.find_one({"_id": ObjectId(product_id), **base}, {"_id": 1})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    created = []
-    skipped = []
+    return await register_tags(db, tenant_id, product_id, warehouse_id, tags, keep_units=not streamed)
 
-    for tag in data.rfidTags:
-        existing = await db.product_units.find_one({"rfidTag": tag, **base})
-        if existing:
-            skipped.append(tag)
-            continue
 
-        unit_data = {
-            "tenantId": tenant_id,
-            "productId": data.productId,
-            "rfidTag": tag,
-            "status": "available",
-            "warehouseId": data.warehouseId,
-            "createdAt": datetime.utcnow(),
-            "updatedAt": datetime.utcnow()
-        }
+async def resolve_tags(db, tenant_id: Optional[str], tags: List[str]) -> dict:
+    """
+    Resolve a batch of tags: one $in on product_units, one $in on products for their
+    products, and one $in on products.rfidTag for tags that are not unit tags.
+    """
+    base = _base_query(tenant_id)
+    units = {
+        u["rfidTag"]: u
+        async for u in db.product_units.find({**base, "rfidTag": {"$in": tags}}, UNIT_FIELDS)
+    }
+    product_ids = {ObjectId(u["productId"]) for u in units.values() if ObjectId.is_valid(u.get("productId") or "")}
+    remaining = [tag for tag in tags if tag not in units]
+    products = {}
+    product_tags = {}
+    if product_ids or remaining:
+        clauses = []
+        if product_ids:
+            clauses.append({"_id": {"$in": list(product_ids)}})
+        if remaining:
+            clauses.append({"rfidTag": {"$in": remaining}})
+        async for p in db.products.find({**base, "$or": clauses}, PRODUCT_FIELDS):
+            p["_id"] = str(p["_id"])
+            products[p["_id"]] = p
+            if p.get("rfidTag"):
+                product_tags[p["rfidTag"]] = p
+
+    resolved = []
+    unknown = []
+    for tag in tags:
+        unit = units.get(tag)
+        if unit:
+            serialize_unit(unit)
+            resolved.append({"tag": tag, "status": unit["status"], "unit": unit, "product": products.get(unit["productId"])})
+        elif tag in product_tags:
+            resolved.append({"tag": tag, "status": "product", "unit": None, "product": product_tags[tag]})
+        else:
+            unknown.append(tag)
+    return {"resolved": resolved, "unknown": unknown}
+
+
+@router.post("/product-units/resolve")
+async def resolve_units(
+    data: ProductUnitResolve,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("products"))
+):
+    """
+    تحديد الوحدات والمنتجات لمجموعة Tags من القارئ اليدوي
+    Streams NDJSON: one {"resolved": [...], "unknown": [...]} line per RESOLVE_CHUNK tags,
+    then {"done": true, "resolved": n, "unknown": m}.
+    """
+    from server import db
 
-        result = await db.product_units.insert_one(unit_data)
-        unit_data["_id"] = str(result.inserted_id)
-        created.append(unit_data)
+    tags = list(dict.fromkeys(t.strip() for t in data.tags if t and t.strip()))
 
-    if created:
-        await db.products.update_one(
-            {"_id": ObjectId(data.productId), **base},
-            {"$inc": {"stock": len(created)}}
-        )
+    async def body():
+        resolved = unknown = 0
+        for start in range(0, len(tags), RESOLVE_CHUNK):
+            chunk = await resolve_tags(db, tenant_id, tags[start:start + RESOLVE_CHUNK])
+            resolved += len(chunk["resolved"])
+            unknown += len(chunk["unknown"])
+            yield json.dumps(chunk, default=str, ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "resolved": resolved, "unknown": unknown}) + "\n"
 
-    return {
-        "created": len(created),
-        "skipped": len(skipped),
-        "skippedTags": skipped,
-        "units": created
-    }
+    return StreamingResponse(body(), media_type="application/x-ndjson")
 
 
 @router.put("/product-units/{unit_id}")
 async def update_unit(
     unit_id: str,
     unit: ProductUnitUpdate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     """تحديث وحدة"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     query = {"_id": ObjectId(unit_id), **base}
 
@@ -207,12 +451,11 @@ async def update_unit(
 @router.delete("/product-units/{unit_id}")
 async def delete_unit(
     unit_id: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     """حذف وحدة"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     unit = await db.product_units.find_one({"_id": ObjectId(unit_id), **base})
     if not unit:
@@ -222,24 +465,141 @@ async def delete_unit(
 
     await db.products.update_one(
         {"_id": ObjectId(unit["productId"]), **base},
-        {"$inc": {"stock": -1}}
+        stock_inc_pipeline(-1)
     )
+    invalidate_products(tenant_id, [unit["productId"]])
+    invalidate_dashboard(tenant_id)
 
     return {"message": "Unit deleted"}
 
 
+def stock_delta(old_status: str, new_status: str) -> int:
+    """Change of product stock when a unit moves between statuses."""
+    return (old_status in OUT_OF_STOCK) - (new_status in OUT_OF_STOCK)
+
+
+async def change_units_status(db, tenant_id: Optional[str], units: List[dict], new_status: str,
+                              invoice_id: Optional[str] = None) -> Tuple[List[str], List[dict]]:
+    """
+    Move already-fetched units to new_status: one update_many per stock effect (guarded by
+    the current status, so concurrent changes are not overwritten) and one bulk_write of
+    per-product stock deltas. Returns (changed ids, failures).
+    """
+    base = _base_query(tenant_id)
+    allowed = STATUS_TRANSITIONS[new_status]
+    failures = []
+    groups: Dict[int, List[dict]] = {}
+    for unit in units:
+        if unit["status"] not in allowed:
+            failures.append({"unitId": str(unit["_id"]), "rfidTag": unit.get("rfidTag"),
+                             "reason": "invalid_status", "currentStatus": unit["status"]})
+        else:
+            groups.setdefault(stock_delta(unit["status"], new_status), []).append(unit)
+    if not groups:
+        return [], failures
+
+    now = datetime.utcnow()
+    update = {"$set": {"status": new_status, "updatedAt": now}}
+    if new_status == "sold":
+        update["$set"].update({"soldAt": now, "invoiceId": invoice_id})
+    elif new_status == "available":
+        update["$unset"] = {"soldAt": "", "invoiceId": ""}
+    marker = ObjectId()
+    update["$set"]["statusBatch"] = marker
+
+    async def write(session):
+        changed_ids = set()
+        for delta, group in groups.items():
+            group_ids = [u["_id"] for u in group]
+            result = await db.product_units.update_many(
+                {"_id": {"$in": group_ids}, "status": {"$in": sorted({u["status"] for u in group})}, **base},
+                update, session=session
+            )
+            if result.modified_count == len(group_ids):
+                changed_ids.update(group_ids)
+            else:
+                # Some units changed status since they were read - the marker tells which ones we moved
+                cursor = db.product_units.find({"_id": {"$in": group_ids}, "statusBatch": marker}, {"_id": 1}, session=session)
+                changed_ids.update([doc["_id"] async for doc in cursor])
+        stock: Dict[str, int] = {}
+        for delta, group in groups.items():
+            for unit in group:
+                if delta and unit["_id"] in changed_ids and ObjectId.is_valid(unit.get("productId") or ""):
+                    stock[unit["productId"]] = stock.get(unit["productId"], 0) + delta
+        ops = [
+            UpdateOne({"_id": ObjectId(pid), **base}, stock_inc_pipeline(n))
+            for pid, n in stock.items() if n
+        ]
+        if ops:
+            await db.products.bulk_write(ops, ordered=False, session=session)
+        return changed_ids
+
+    changed_ids = await run_in_transaction(db, write)
+    invalidate_products(tenant_id, {u["productId"] for u in units if u["_id"] in changed_ids})
+    invalidate_dashboard(tenant_id)
+    changed = []
+    for unit in units:
+        if unit["_id"] in changed_ids:
+            changed.append(str(unit["_id"]))
+        elif unit["status"] in allowed:
+            failures.append({"unitId": str(unit["_id"]), "rfidTag": unit.get("rfidTag"),
+                             "reason": "status_changed", "currentStatus": None})
+    return changed, failures
+
+
+@router.post("/product-units/status")
+async def change_status_bulk(
+    data: ProductUnitBulkStatus,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("products"))
+):
+    """تغيير حالة عدة وحدات (بيع سلة كاملة، حجز، تالف، إرجاع) مع تقرير لكل وحدة"""
+    from server import db
+    base = _base_query(tenant_id)
+    if not data.unitIds and not data.rfidTags:
+        raise HTTPException(status_code=400, detail="unitIds or rfidTags is required")
+
+    failures = [{"unitId": uid, "reason": "invalid_id"} for uid in data.unitIds if not ObjectId.is_valid(uid)]
+    ids = list(dict.fromkeys(ObjectId(uid) for uid in data.unitIds if ObjectId.is_valid(uid)))
+    tags = list(dict.fromkeys(t.strip() for t in data.rfidTags if t and t.strip()))
+    clauses = []
+    if ids:
+        clauses.append({"_id": {"$in": ids}})
+    if tags:
+        clauses.append({"rfidTag": {"$in": tags}})
+
+    units = []
+    if clauses:
+        units = await db.product_units.find(
+            {**base, "$or": clauses}, {"productId": 1, "rfidTag": 1, "status": 1}
+        ).to_list(None)
+    found_ids = {u["_id"] for u in units}
+    found_tags = {u.get("rfidTag") for u in units}
+    failures += [{"unitId": str(i), "reason": "not_found"} for i in ids if i not in found_ids]
+    failures += [{"rfidTag": t, "reason": "not_found"} for t in tags if t not in found_tags]
+
+    changed, status_failures = await change_units_status(db, tenant_id, units, data.status, data.invoiceId)
+    failures += status_failures
+    return {
+        "status": data.status,
+        "updated": len(changed),
+        "failed": len(failures),
+        "unitIds": changed,
+        "failures": failures
+    }
+
+
 @router.post("/product-units/{unit_id}/sell")
 async def sell_unit(
     unit_id: str,
     invoice_id: Optional[str] = None,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     """تسجيل بيع وحدة"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
-    result = await db.product_units.update_one(
+    unit = await db.product_units.find_one_and_update(
         {"_id": ObjectId(unit_id), "status": "available", **base},
         {
             "$set": {
@@ -248,18 +608,19 @@ async def sell_unit(
                 "invoiceId": invoice_id,
                 "updatedAt": datetime.utcnow()
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
 
-    if result.modified_count == 0:
+    if not unit:
         raise HTTPException(status_code=400, detail="Unit not available or not found")
 
-    unit = await db.product_units.find_one({"_id": ObjectId(unit_id)})
-
     await db.products.update_one(
         {"_id": ObjectId(unit["productId"]), **base},
-        {"$inc": {"stock": -1}}
+        stock_inc_pipeline(-1)
     )
+    invalidate_products(tenant_id, [unit["productId"]])
+    invalidate_dashboard(tenant_id)
 
     return serialize_unit(unit)
 
@@ -267,12 +628,11 @@ async def sell_unit(
 @router.get("/product-units/product/{product_id}/count")
 async def get_product_units_count(
     product_id: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("products"))
 ):
     """إحصائيات وحدات منتج معين"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     pipeline = [
         {"$match": {"productId": product_id, **base}},
@@ -1,16 +1,34 @@
 """
 Products Routes - Multi-Tenant Support
 """
-from fastapi import APIRouter, HTTPException, status, Header, Query, Depends
+from fastapi import APIRouter, HTTPException, status, Query, Depends, UploadFile, File
 from typing import List, Optional
-from models.product import ProductModel, ProductCreate, ProductUpdate
-from middleware.tenant import get_tenant_from_token
-from utils.auth import require_permission
+from models.product import ProductModel, ProductCreate, ProductUpdate, ProductBulkPrice
+from middleware.tenant import get_tenant_id
+from utils.auth import require_permission, get_auth_context
+from utils.dashboard_cache import invalidate_dashboard
+from utils.product_cache import find_product_by, invalidate_products, invalidate_product_values, invalidate_tenant_products
+from utils.search import product_search_keys, query_code, query_tokens, query_trigrams
+from utils.product_import import IMPORT_FORMATS, start_product_import
+from utils.stock_state import LOW, OUT, set_with_state_pipeline, stock_state_of
+from routes.esl import enqueue_device_refresh
 from bson import ObjectId
 from datetime import datetime, timezone
+import os
+import tempfile
 
 router = APIRouter(prefix="/api/products", tags=["products"])
 
+# Index matches ranked per search; pages are cut from this window so latency stays flat
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", "1000"))
+
+# Largest accepted import upload (bytes)
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+IMPORT_COPY_CHUNK = 1024 * 1024
+
+# searchKeys is internal to search; not sent to clients
+PUBLIC_FIELDS = {"searchKeys": 0}
+
 
 def build_tenant_query(tenant_id: Optional[str]) -> dict:
     """Build query filter based on tenant"""
@@ -19,9 +37,80 @@ def build_tenant_query(tenant_id: Optional[str]) -> dict:
     return {}  # Super admin sees all
 
 
+def new_price_expr(rule: str, value: float, decimals: int) -> dict:
+    """salePrice after a bulk price rule, rounded and never negative."""
+    current = {"$ifNull": ["$salePrice", 0]}
+    if rule == "percent":
+        price = {"$multiply": [current, 1 + value / 100]}
+    elif rule == "fixed":
+        price = {"$add": [current, value]}
+    else:  # margin on cost
+        price = {"$multiply": ["$costPrice", 1 + value / 100]}
+    return {"$max": [0, {"$round": [price, decimals]}]}
+
+
+async def reprice_query(db, tenant_id: str, payload: ProductBulkPrice) -> dict:
+    """
+    Products selected by a bulk price change (all given filters must match) whose salePrice
+    the rule actually changes. Products have no supplier field, so a supplier selects the
+    products received on its purchases.
+    """
+    query = {"tenantId": tenant_id}
+    if payload.categories:
+        query["$or"] = [{"category": {"$in": payload.categories}}, {"categoryEn": {"$in": payload.categories}}]
+    if payload.skus:
+        query["sku"] = {"$in": payload.skus}
+    if payload.supplierId:
+        product_ids = await db.purchases.distinct(
+            "items.productId", {"tenantId": tenant_id, "supplierId": payload.supplierId}
+        )
+        query["_id"] = {"$in": [ObjectId(pid) for pid in product_ids if pid and ObjectId.is_valid(pid)]}
+    if payload.rule == "margin":
+        query["costPrice"] = {"$gt": 0}
+    # A product already at the new price keeps its previousSalePrice and its ESL is not refreshed
+    query["$expr"] = {"$ne": ["$salePrice", new_price_expr(payload.rule, payload.value, payload.decimals)]}
+    return query
+
+
+async def reprice_products(db, tenant_id: str, payload: ProductBulkPrice) -> dict:
+    """
+    Apply a price rule with one pipeline update_many, then queue exactly the ESL devices of
+    the changed products. Changed products are tagged with the batch id (priceBatch) and keep
+    their previous salePrice.
+    """
+    query = await reprice_query(db, tenant_id, payload)
+    if payload.dryRun:
+        return {"matched": await db.products.count_documents(query), "dryRun": True}
+
+    batch = ObjectId()
+    now = datetime.now(timezone.utc)
+    result = await db.products.update_many(query, [{"$set": {
+        "previousSalePrice": "$salePrice",
+        "salePrice": new_price_expr(payload.rule, payload.value, payload.decimals),
+        "priceBatch": batch,
+        "priceChangedAt": {"$literal": now},
+        "updatedAt": {"$literal": now},
+    }}])
+
+    product_ids, device_ids = [], []
+    async for product in db.products.find({"tenantId": tenant_id, "priceBatch": batch}, {"eslDeviceId": 1}):
+        product_ids.append(str(product["_id"]))
+        if product.get("eslDeviceId"):
+            device_ids.append(product["eslDeviceId"])
+    queued = await enqueue_device_refresh(db, tenant_id, product_ids, device_ids, batch)
+    invalidate_tenant_products(tenant_id)
+    invalidate_dashboard(tenant_id)
+    return {
+        "matched": result.matched_count,
+        "modified": result.modified_count,
+        "batchId": str(batch),
+        "eslDevicesQueued": queued,
+    }
+
+
 @router.get("", response_model=List[dict])
 async def get_products(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     skip: int = Query(0, ge=0),
     limit: int = Query(1000, ge=1, le=5000),
     _: dict = Depends(require_permission("products")),
@@ -29,45 +118,196 @@ async def get_products(
     """Get products for tenant with optional pagination (skip, limit)"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
     query = build_tenant_query(tenant_id)
     
-    cursor = db.products.find(query).skip(skip).limit(limit)
+    cursor = db.products.find(query, PUBLIC_FIELDS).skip(skip).limit(limit)
     products = await cursor.to_list(limit)
     for product in products:
         product['_id'] = str(product['_id'])
     return products
 
 
+async def search_products(db, tenant_id: Optional[str], q: str, skip: int, limit: int) -> dict:
+    """
+    Prefix search on searchKeys ($all of the query words), ranked by exact code match,
+    whole-word matches, then name. Falls back to trigram (fuzzy) matching when no
+    product has every prefix; a fuzzy match must share at least half of the query
+    trigrams. Only the first SEARCH_CANDIDATES matching products are ranked, so with
+    more matches than that the best ones may be missed and paging stops there.
+    """
+    tokens = query_tokens(q) if skip < SEARCH_CANDIDATES else []
+    if not tokens:
+        return {"items": [], "skip": skip, "limit": limit, "hasMore": False, "fuzzy": False}
+    base = build_tenant_query(tenant_id)
+    score = {"$add": [
+        {"$cond": [{"$in": [query_code(q), "$searchKeys"]}, 100, 0]},
+        *[{"$cond": [{"$in": ["=" + t, "$searchKeys"]}, 10, 0]} for t in tokens],
+    ]}
+    match = {**base, "searchKeys": {"$all": tokens}}
+    fuzzy = False
+    if not await db.products.find_one(match, {"_id": 1}):
+        grams = query_trigrams(q)
+        if not grams:
+            return {"items": [], "skip": skip, "limit": limit, "hasMore": False, "fuzzy": False}
+        fuzzy = True
+        score = {"$add": [{"$cond": [{"$in": [g, "$searchKeys"]}, 1, 0]} for g in grams]}
+        # At least half of the query trigrams must be shared; checked before the
+        # candidate cap so it only counts products that can match
+        match = {**base, "searchKeys": {"$in": grams},
+                 "$expr": {"$gte": [score, max(1, len(grams) // 2)]}}
+
+    pipeline = [
+        {"$match": match},
+        {"$limit": SEARCH_CANDIDATES},
+        {"$addFields": {"_score": score}},
+        {"$sort": {"_score": -1, "name": 1}},
+        {"$skip": skip},
+        {"$limit": limit + 1},
+        {"$project": {"searchKeys": 0, "_score": 0}},
+    ]
+    products = await db.products.aggregate(pipeline).to_list(limit + 1)
+    for product in products:
+        product['_id'] = str(product['_id'])
+    return {
+        "items": products[:limit],
+        "skip": skip,
+        "limit": limit,
+        "hasMore": len(products) > limit,
+        "fuzzy": fuzzy,
+    }
+
+
+@router.get("/search", response_model=dict)
+async def search(
+    q: str = Query(..., min_length=1, max_length=100),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("products")),
+):
+    """
+    Search products by name, nameEn, sku, barcode or category (Arabic/English, prefix + fuzzy).
+    At most SEARCH_CANDIDATES (1000 by default) matching products are ranked per query.
+    """
+    from server import db
+    
+    return await search_products(db, tenant_id, q, skip, limit)
+
+
 @router.get("/search/low-stock", response_model=List[dict])
-async def get_low_stock_products(authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("products"))):
+async def get_low_stock_products(tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
     """Get products with low stock"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
     query = build_tenant_query(tenant_id)
-    query["$expr"] = {"$lte": ["$stock", "$reorderLevel"]}
+    query["stockState"] = {"$in": [LOW, OUT]}
     
-    products = await db.products.find(query).to_list(1000)
+    products = await db.products.find(query, PUBLIC_FIELDS).to_list(1000)
     for product in products:
         product['_id'] = str(product['_id'])
     return products
 
 
+@router.post("/reprice", response_model=dict)
+async def bulk_reprice(
+    payload: ProductBulkPrice,
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("products")),
+):
+    """
+    Change sale prices in bulk (percent / fixed amount / margin on cost) for products selected
+    by category, supplier or SKU list. Only products whose price changes are updated and counted
+    in matched / modified; their ESL devices are queued for refresh (GET /api/esl/refresh-queue).
+    """
+    from server import db
+
+    if not tenant_id:
+        raise HTTPException(status_code=400, detail="Bulk price change requires a tenant")
+    if not (payload.categories or payload.supplierId or payload.skus):
+        raise HTTPException(status_code=400, detail="Select products by categories, supplierId or skus")
+    return await reprice_products(db, tenant_id, payload)
+
+
+@router.post("/import", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def import_products(
+    file: UploadFile = File(...),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("products")),
+    context: dict = Depends(get_auth_context),
+):
+    """
+    Import products from a CSV or XLSX file (upsert by SKU) as a background job.
+    Returns the job id; follow progress and row errors with GET /api/products/import/{job_id}.
+    """
+    from server import db
+
+    if not tenant_id:
+        raise HTTPException(status_code=400, detail="Product import requires a tenant")
+    file_format = os.path.splitext(file.filename or "")[1].lstrip(".").lower()
+    if file_format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Only .csv and .xlsx files can be imported")
+
+    # Copy the upload in fixed-size chunks; the job reads it back from disk
+    size = 0
+    with tempfile.NamedTemporaryFile(suffix="." + file_format, delete=False) as target:
+        path = target.name
+        while chunk := await file.read(IMPORT_COPY_CHUNK):
+            size += len(chunk)
+            if size > IMPORT_MAX_BYTES:
+                break
+            target.write(chunk)
+    if size > IMPORT_MAX_BYTES:
+        os.remove(path)
+        raise HTTPException(status_code=413, detail=f"Import file exceeds {IMPORT_MAX_BYTES} bytes")
+
+    now = datetime.now(timezone.utc)
+    job = {
+        "tenantId": tenant_id,
+        "type": "products",
+        "fileName": file.filename,
+        "format": file_format,
+        "size": size,
+        "status": "queued",
+        "processed": 0,
+        "inserted": 0,
+        "updated": 0,
+        "failed": 0,
+        "errors": [],
+        "createdBy": context.get("userId"),
+        "createdAt": now,
+    }
+    result = await db.import_jobs.insert_one(job)
+    start_product_import(db, result.inserted_id, tenant_id, path, file_format)
+    return {"jobId": str(result.inserted_id), "status": "queued"}
+
+
+@router.get("/import/{job_id}", response_model=dict)
+async def get_import_job(job_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
+    """Progress and row errors of a product import"""
+    from server import db
+
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    job = await db.import_jobs.find_one({"_id": ObjectId(job_id), **build_tenant_query(tenant_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    job["_id"] = str(job["_id"])
+    return job
+
+
 @router.get("/{product_id}", response_model=dict)
-async def get_product(product_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("products"))):
+async def get_product(product_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
     """Get product by ID"""
     from server import db
     
     if not ObjectId.is_valid(product_id):
         raise HTTPException(status_code=400, detail="Invalid product ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(product_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
     
-    product = await db.products.find_one(query)
+    product = await db.products.find_one(query, PUBLIC_FIELDS)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -76,48 +316,46 @@ async def get_product(product_id: str, authorization: Optional[str] = Header(Non
 
 
 @router.get("/rfid/{tag}", response_model=dict)
-async def get_product_by_rfid(tag: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("products"))):
+async def get_product_by_rfid(tag: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
     """Get product by RFID tag"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
-    query = {"rfidTag": tag}
-    if tenant_id:
-        query["tenantId"] = tenant_id
-    
-    product = await db.products.find_one(query)
+    product = await find_product_by(db, tenant_id, "rfidTag", tag)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    product['_id'] = str(product['_id'])
     return product
 
 
 @router.get("/barcode/{code}", response_model=dict)
-async def get_product_by_barcode(code: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("products"))):
+async def get_product_by_barcode(code: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
     """Get product by barcode"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
-    query = {"barcode": code}
-    if tenant_id:
-        query["tenantId"] = tenant_id
+    product = await find_product_by(db, tenant_id, "barcode", code)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    return product
+
+
+@router.get("/sku/{sku}", response_model=dict)
+async def get_product_by_sku(sku: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
+    """Get product by SKU"""
+    from server import db
     
-    product = await db.products.find_one(query)
+    product = await find_product_by(db, tenant_id, "sku", sku)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    product['_id'] = str(product['_id'])
     return product
 
 
 @router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
-async def create_product(product: ProductCreate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("products"))):
+async def create_product(product: ProductCreate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
     """Create new product"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
-    
     # Check for duplicate SKU within tenant
     sku_query = {"sku": product.sku}
     if tenant_id:
@@ -129,26 +367,29 @@ async def create_product(product: ProductCreate, authorization: Optional[str] =
     
     product_dict = product.model_dump()
     product_dict["tenantId"] = tenant_id  # Add tenant ID
+    product_dict["searchKeys"] = product_search_keys(product_dict)
+    product_dict["stockState"] = stock_state_of(product_dict)
     product_dict["createdAt"] = datetime.now(timezone.utc)
     product_dict["updatedAt"] = datetime.now(timezone.utc)
     
     result = await db.products.insert_one(product_dict)
+    invalidate_product_values(tenant_id, product_dict)
+    invalidate_dashboard(tenant_id)
     
-    created_product = await db.products.find_one({"_id": result.inserted_id})
+    created_product = await db.products.find_one({"_id": result.inserted_id}, PUBLIC_FIELDS)
     created_product['_id'] = str(created_product['_id'])
     
     return created_product
 
 
 @router.put("/{product_id}", response_model=dict)
-async def update_product(product_id: str, product: ProductUpdate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("products"))):
+async def update_product(product_id: str, product: ProductUpdate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
     """Update product"""
     from server import db
     
     if not ObjectId.is_valid(product_id):
         raise HTTPException(status_code=400, detail="Invalid product ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(product_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -159,31 +400,37 @@ async def update_product(product_id: str, product: ProductUpdate, authorization:
     
     update_data = {k: v for k, v in product.model_dump().items() if v is not None}
     update_data["updatedAt"] = datetime.now(timezone.utc)
+    update_data["searchKeys"] = product_search_keys({**existing, **update_data})
     
-    await db.products.update_one(query, {"$set": update_data})
+    # Pipeline update so stockState follows a new stock / reorderLevel atomically
+    await db.products.update_one(query, set_with_state_pipeline(update_data))
+    invalidate_products(existing.get("tenantId"), [product_id])
+    invalidate_dashboard(existing.get("tenantId"))
     
-    updated_product = await db.products.find_one({"_id": ObjectId(product_id)})
+    updated_product = await db.products.find_one({"_id": ObjectId(product_id)}, PUBLIC_FIELDS)
     updated_product['_id'] = str(updated_product['_id'])
     
     return updated_product
 
 
 @router.delete("/{product_id}")
-async def delete_product(product_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("products"))):
+async def delete_product(product_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("products"))):
     """Delete product"""
     from server import db
     
     if not ObjectId.is_valid(product_id):
         raise HTTPException(status_code=400, detail="Invalid product ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(product_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
     
-    result = await db.products.delete_one(query)
+    deleted = await db.products.find_one_and_delete(query, projection={"tenantId": 1})
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    invalidate_products(deleted.get("tenantId"), [product_id])
+    invalidate_dashboard(deleted.get("tenantId"))
+    
     return {"message": "Product deleted successfully"}
@@ -1,32 +1,110 @@
 """
 Purchases Routes - Multi-Tenant Support
 """
-from fastapi import APIRouter, HTTPException, status, Header, Depends
-from typing import List, Optional
-from models.purchase import PurchaseModel, PurchaseCreate, PurchaseUpdate, PurchaseItem
-from middleware.tenant import get_tenant_from_token
+from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Dict, List, Optional, Tuple
+from models.purchase import PurchaseModel, PurchaseCreate, PurchaseUpdate, PurchaseItem, PurchaseItemCreate
+from middleware.tenant import get_tenant_id
 from utils.auth import require_permission
+from utils import counters
+from utils.database import run_in_transaction
+from utils.costing import received_avg_cost_expr
+from utils.dashboard_cache import invalidate_dashboard
+from utils.product_cache import invalidate_products
+from utils.rollups import apply_rollups
+from utils.search import product_search_keys
+from utils.stock_state import stock_inc_pipeline, stock_upsert_pipeline
+from routes.product_units import existing_tags, insert_units
 from bson import ObjectId
+from pymongo import UpdateOne
 from datetime import datetime, timezone
-import random
-import string
 
 router = APIRouter(prefix="/api/purchases", tags=["purchases"])
 
 
-def generate_purchase_number():
-    """Generate unique purchase number"""
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%d")
-    random_str = ''.join(random.choices(string.digits, k=4))
-    return f"PO-{timestamp}-{random_str}"
+def _base_query(tenant_id: Optional[str]) -> dict:
+    return {"tenantId": tenant_id} if tenant_id else {}
+
+
+def invalid_product_ids(items: List[PurchaseItemCreate]) -> List[str]:
+    """productIds on purchase lines that are not valid ObjectIds, in line order"""
+    return list(dict.fromkeys(
+        item.productId for item in items if item.productId and not ObjectId.is_valid(item.productId)
+    ))
+
+
+def purchase_stock_ops(items: List[PurchaseItemCreate], tenant_id: Optional[str],
+                       existing: Dict[str, str], now: datetime) -> Tuple[List[UpdateOne], List[Optional[str]]]:
+    """
+    Stock increments for a purchase as one bulk_write: one pipeline update per product (new
+    stock and stockState together), by _id when the line (or the SKU lookup in `existing`)
+    knows it, otherwise an upsert by (tenantId, sku) that creates the product. Returns the
+    ops and, per op, the SKU it upserts (None otherwise) so upserted ids can be mapped back.
+    The same update moves avgCost (utils/costing.py). Every productId must be a valid
+    ObjectId (see invalid_product_ids); an invalid one raises instead of dropping the line.
+    """
+    by_id: Dict[str, int] = {}
+    amounts: Dict[str, float] = {}
+    new_items: Dict[str, dict] = {}
+    for item in items:
+        product_id = item.productId or existing.get(item.sku)
+        if product_id:
+            by_id[product_id] = by_id.get(product_id, 0) + item.quantity
+            amounts[product_id] = amounts.get(product_id, 0) + item.quantity * item.unitCost
+        elif item.sku in new_items:
+            new_items[item.sku]["quantity"] += item.quantity
+            new_items[item.sku]["amount"] += item.quantity * item.unitCost
+        else:
+            new_items[item.sku] = {"item": item, "quantity": item.quantity, "amount": item.quantity * item.unitCost}
+    
+    base = _base_query(tenant_id)
+    ops: List[UpdateOne] = []
+    keys: List[Optional[str]] = []
+    for sku, entry in new_items.items():
+        item = entry["item"]
+        new_product = {
+            "name": item.name,
+            "nameEn": item.nameEn,
+            "barcode": None,
+            "rfidTag": None,
+            "category": "عام",
+            "categoryEn": "General",
+            "costPrice": item.unitCost,
+            "salePrice": item.unitCost * 1.2,
+            "reorderLevel": 10,
+            "warehouseId": None,
+            "eslDeviceId": None,
+            "createdAt": now
+        }
+        new_product["searchKeys"] = product_search_keys({**new_product, "sku": sku})
+        ops.append(UpdateOne(
+            {"tenantId": tenant_id, "sku": sku},
+            stock_upsert_pipeline(entry["quantity"], {"updatedAt": now}, new_product,
+                                  {"avgCost": received_avg_cost_expr(entry["quantity"], entry["amount"])}),
+            upsert=True
+        ))
+        keys.append(sku)
+    for product_id, quantity in by_id.items():
+        ops.append(UpdateOne(
+            {"_id": ObjectId(product_id), **base},
+            stock_inc_pipeline(quantity, {"updatedAt": now},
+                               {"avgCost": received_avg_cost_expr(quantity, amounts[product_id])})
+        ))
+        keys.append(None)
+    return ops, keys
+
+
+async def generate_purchase_number(db, tenant_id: Optional[str]) -> str:
+    """Generate unique purchase number from the tenant's purchase sequence"""
+    value = await counters.next_value(db, tenant_id, counters.PURCHASES)
+    return counters.format_purchase_number(value)
 
 
 @router.get("", response_model=List[dict])
-async def get_purchases(authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("purchases"))):
+async def get_purchases(tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("purchases"))):
     """Get all purchases for tenant"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"tenantId": tenant_id} if tenant_id else {}
     
     purchases = await db.purchases.find(query).sort("createdAt", -1).to_list(1000)
@@ -36,14 +114,13 @@ async def get_purchases(authorization: Optional[str] = Header(None), _: dict = D
 
 
 @router.get("/{purchase_id}", response_model=dict)
-async def get_purchase(purchase_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("purchases"))):
+async def get_purchase(purchase_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("purchases"))):
     """Get purchase by ID"""
     from server import db
     
     if not ObjectId.is_valid(purchase_id):
         raise HTTPException(status_code=400, detail="Invalid purchase ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(purchase_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -57,11 +134,13 @@ async def get_purchase(purchase_id: str, authorization: Optional[str] = Header(N
 
 
 @router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
-async def create_purchase(purchase: PurchaseCreate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("purchases"))):
+async def create_purchase(purchase: PurchaseCreate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("purchases"))):
     """Create new purchase and update inventory"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
+    invalid_ids = invalid_product_ids(purchase.items)
+    if invalid_ids:
+        raise HTTPException(status_code=400, detail=f"Invalid product ID: {', '.join(invalid_ids)}")
     
     # Calculate totals
     items_with_total = []
@@ -82,13 +161,14 @@ async def create_purchase(purchase: PurchaseCreate, authorization: Optional[str]
         })
     
     total = subtotal + purchase.tax - purchase.discount
+    now = datetime.now(timezone.utc)
     
     purchase_dict = {
         "tenantId": tenant_id,
-        "purchaseNumber": generate_purchase_number(),
+        "purchaseNumber": await generate_purchase_number(db, tenant_id),
         "supplierId": purchase.supplierId,
         "supplierName": purchase.supplierName,
-        "purchaseDate": purchase.purchaseDate or datetime.now(timezone.utc),
+        "purchaseDate": purchase.purchaseDate or now,
         "items": items_with_total,
         "subtotal": subtotal,
         "tax": purchase.tax,
@@ -96,104 +176,82 @@ async def create_purchase(purchase: PurchaseCreate, authorization: Optional[str]
         "total": total,
         "status": "received",
         "notes": purchase.notes,
-        "createdAt": datetime.now(timezone.utc),
-        "updatedAt": datetime.now(timezone.utc)
+        "createdAt": now,
+        "updatedAt": now
     }
     
-    result = await db.purchases.insert_one(purchase_dict)
+    # Resolve every SKU-only line with one $in query
+    skus = list({item.sku for item in purchase.items if not item.productId})
+    existing = {}
+    if skus:
+        cursor = db.products.find({**_base_query(tenant_id), "sku": {"$in": skus}}, {"sku": 1})
+        existing = {doc["sku"]: str(doc["_id"]) async for doc in cursor}
     
-    # Update inventory for each item
-    for item in purchase.items:
-        product_id = None
-        
-        if item.productId:
-            product_id = item.productId
-            await db.products.update_one(
-                {"_id": ObjectId(item.productId)},
-                {
-                    "$inc": {"stock": item.quantity},
-                    "$set": {"updatedAt": datetime.now(timezone.utc)}
-                }
-            )
-        else:
-            # Check if product exists by SKU within tenant
-            sku_query = {"sku": item.sku}
-            if tenant_id:
-                sku_query["tenantId"] = tenant_id
-            
-            existing_product = await db.products.find_one(sku_query)
-            if existing_product:
-                product_id = str(existing_product["_id"])
-                await db.products.update_one(
-                    {"_id": existing_product["_id"]},
-                    {
-                        "$inc": {"stock": item.quantity},
-                        "$set": {"updatedAt": datetime.now(timezone.utc)}
-                    }
-                )
-            else:
-                # Create new product with tenant ID
-                new_product = {
-                    "tenantId": tenant_id,
-                    "name": item.name,
-                    "nameEn": item.nameEn,
-                    "sku": item.sku,
-                    "barcode": None,
-                    "rfidTag": None,
-                    "category": "عام",
-                    "categoryEn": "General",
-                    "stock": item.quantity,
-                    "costPrice": item.unitCost,
-                    "salePrice": item.unitCost * 1.2,
-                    "reorderLevel": 10,
-                    "warehouseId": None,
-                    "eslDeviceId": None,
-                    "createdAt": datetime.now(timezone.utc),
-                    "updatedAt": datetime.now(timezone.utc)
-                }
-                new_product_result = await db.products.insert_one(new_product)
-                product_id = str(new_product_result.inserted_id)
+    ops, op_keys = purchase_stock_ops(purchase.items, tenant_id, existing, now)
+    supplier_valid = bool(purchase.supplierId and ObjectId.is_valid(purchase.supplierId))
+    
+    async def write(session):
+        product_ids = dict(existing)
+        if ops:
+            result = await db.products.bulk_write(ops, ordered=False, session=session)
+            for index, upserted_id in result.upserted_ids.items():
+                product_ids[op_keys[index]] = str(upserted_id)
         
-        # Create product units for each tag
-        if product_id and item.tags:
-            for tag in item.tags:
-                if tag and tag.strip():
-                    unit_doc = {
+        # Units for every tag, skipping tags the tenant already has
+        units = []
+        seen = set()
+        for item, line in zip(purchase.items, items_with_total):
+            product_id = item.productId or product_ids.get(item.sku)
+            line["productId"] = product_id
+            for tag in item.tags or []:
+                tag = tag.strip() if tag else ""
+                if tag and tag not in seen:
+                    seen.add(tag)
+                    units.append({
                         "tenantId": tenant_id,
                         "productId": product_id,
-                        "rfidTag": tag.strip(),
-                        "serialNumber": tag.strip(),
+                        "rfidTag": tag,
+                        "serialNumber": tag,
                         "status": "available",
-                        "createdAt": datetime.now(timezone.utc),
-                        "updatedAt": datetime.now(timezone.utc)
-                    }
-                    await db.product_units.insert_one(unit_doc)
+                        "createdAt": now,
+                        "updatedAt": now
+                    })
+        taken = await existing_tags(db, tenant_id, seen, session=session)
+        skipped = sorted(taken) + await insert_units(db, [u for u in units if u["rfidTag"] not in taken], session=session)
+        
+        if supplier_valid:
+            await db.suppliers.update_one(
+                {"_id": ObjectId(purchase.supplierId), **_base_query(tenant_id)},
+                {
+                    "$inc": {"balance": total},
+                    "$set": {"updatedAt": now}
+                },
+                session=session
+            )
+        
+        await db.purchases.insert_one(purchase_dict, session=session)
+        await apply_rollups(db, "purchases", added=[purchase_dict], session=session)
+        return skipped
     
-    # Update supplier balance
-    if purchase.supplierId and ObjectId.is_valid(purchase.supplierId):
-        await db.suppliers.update_one(
-            {"_id": ObjectId(purchase.supplierId)},
-            {
-                "$inc": {"balance": total},
-                "$set": {"updatedAt": datetime.now(timezone.utc)}
-            }
-        )
+    skipped_tags = await run_in_transaction(db, write)
+    invalidate_products(tenant_id, [op._filter["_id"] for op in ops if "_id" in op._filter])
+    invalidate_dashboard(tenant_id)
     
-    created_purchase = await db.purchases.find_one({"_id": result.inserted_id})
-    created_purchase['_id'] = str(created_purchase['_id'])
+    purchase_dict['_id'] = str(purchase_dict['_id'])
+    if skipped_tags:
+        purchase_dict['skippedTags'] = skipped_tags
     
-    return created_purchase
+    return purchase_dict
 
 
 @router.put("/{purchase_id}", response_model=dict)
-async def update_purchase(purchase_id: str, purchase: PurchaseUpdate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("purchases"))):
+async def update_purchase(purchase_id: str, purchase: PurchaseUpdate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("purchases"))):
     """Update purchase"""
     from server import db
     
     if not ObjectId.is_valid(purchase_id):
         raise HTTPException(status_code=400, detail="Invalid purchase ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(purchase_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -208,27 +266,30 @@ async def update_purchase(purchase_id: str, purchase: PurchaseUpdate, authorizat
     await db.purchases.update_one(query, {"$set": update_data})
     
     updated_purchase = await db.purchases.find_one({"_id": ObjectId(purchase_id)})
+    await apply_rollups(db, "purchases", removed=[existing], added=[updated_purchase])
+    invalidate_dashboard(existing.get("tenantId"))
     updated_purchase['_id'] = str(updated_purchase['_id'])
     
     return updated_purchase
 
 
 @router.delete("/{purchase_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_purchase(purchase_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("purchases"))):
+async def delete_purchase(purchase_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("purchases"))):
     """Delete purchase"""
     from server import db
     
     if not ObjectId.is_valid(purchase_id):
         raise HTTPException(status_code=400, detail="Invalid purchase ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(purchase_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
     
-    result = await db.purchases.delete_one(query)
+    deleted = await db.purchases.find_one_and_delete(query)
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Purchase not found")
+    await apply_rollups(db, "purchases", removed=[deleted])
+    invalidate_dashboard(deleted.get("tenantId"))
     
     return None
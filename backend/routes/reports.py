@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Query, Depends, Header
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Depends
 from datetime import datetime, timezone, timedelta
-from typing import Optional
+from typing import List, Literal, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from bson import ObjectId
 from utils.auth import require_permission
-from middleware.tenant import get_tenant_from_token
+from middleware.tenant import get_tenant_id
+from utils.rollups import rollup_totals
+from utils.stock_state import LOW, OK, OUT
 
 router = APIRouter(prefix="/api/reports", tags=["reports"])
 
@@ -12,20 +17,88 @@ def _base_query(tenant_id: Optional[str]) -> dict:
     return {"tenantId": tenant_id} if tenant_id else {}
 
 
+def sales_report_pipeline(tenant_id: Optional[str], start: datetime, end: datetime) -> list:
+    """
+    One pass over the period's invoices (served by the (tenantId, createdAt) index):
+    totals, status counts, top products, daily buckets and the latest invoices.
+    """
+    return [
+        {"$match": {**_base_query(tenant_id), "createdAt": {"$gte": start, "$lte": end}}},
+        {"$facet": {
+            "summary": [{"$group": {
+                "_id": None,
+                "totalSales": {"$sum": {"$ifNull": ["$total", 0]}},
+                "totalOrders": {"$sum": 1},
+                "totalItems": {"$sum": {"$size": {"$ifNull": ["$items", []]}}},
+                "paidOrders": {"$sum": {"$cond": [{"$eq": ["$status", "paid"]}, 1, 0]}},
+                "unpaidOrders": {"$sum": {"$cond": [{"$eq": ["$status", "unpaid"]}, 1, 0]}},
+            }}],
+            "topProducts": [
+                {"$unwind": "$items"},
+                {"$group": {
+                    "_id": {"$ifNull": ["$items.productName", "Unknown"]},
+                    "quantity": {"$sum": {"$ifNull": ["$items.quantity", 0]}},
+                    "revenue": {"$sum": {"$ifNull": ["$items.total", 0]}},
+                }},
+                {"$sort": {"revenue": -1}},
+                {"$limit": 20},
+                {"$project": {"_id": 0, "name": "$_id", "quantity": 1, "revenue": 1}},
+            ],
+            "dailyBreakdown": [
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}},
+                    "sales": {"$sum": {"$ifNull": ["$total", 0]}},
+                    "orders": {"$sum": 1},
+                }},
+                {"$sort": {"_id": 1}},
+                {"$project": {"_id": 0, "date": "$_id", "sales": 1, "orders": 1}},
+            ],
+            "invoices": [
+                {"$sort": {"createdAt": -1}},
+                {"$limit": 50},
+            ],
+        }},
+    ]
+
+
+async def sales_report(db, tenant_id: Optional[str], start: datetime, end: datetime) -> dict:
+    [result] = await db.invoices.aggregate(sales_report_pipeline(tenant_id, start, end)).to_list(1)
+    summary = result["summary"][0] if result["summary"] else {}
+    total_sales = summary.get("totalSales", 0)
+    total_orders = summary.get("totalOrders", 0)
+
+    # Last 50 invoices, oldest first
+    invoices = result["invoices"][::-1]
+    for inv in invoices:
+        inv['_id'] = str(inv['_id'])
+
+    return {
+        "period": {"start": start.isoformat(), "end": end.isoformat()},
+        "summary": {
+            "totalSales": total_sales,
+            "totalOrders": total_orders,
+            "totalItems": summary.get("totalItems", 0),
+            "averageOrderValue": total_sales / total_orders if total_orders > 0 else 0,
+            "paidOrders": summary.get("paidOrders", 0),
+            "unpaidOrders": summary.get("unpaidOrders", 0)
+        },
+        "topProducts": result["topProducts"],
+        "dailyBreakdown": result["dailyBreakdown"],
+        "invoices": invoices
+    }
+
+
 @router.get("/sales")
 async def get_sales_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     period: str = Query(default="month", regex="^(day|week|month|year)$"),
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("reports"))
 ):
     """Get sales report"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
-    base = _base_query(tenant_id)
-
     now = datetime.now(timezone.utc)
 
     # Parse dates or use defaults
@@ -46,138 +119,123 @@ async def get_sales_report(
     else:
         end = now
 
-    # Get invoices in period (tenant-scoped)
-    invoices = await db.invoices.find({
-        **base,
-        "createdAt": {"$gte": start, "$lte": end}
-    }).to_list(10000)
-    
-    total_sales = sum(inv.get('total', 0) for inv in invoices)
-    total_orders = len(invoices)
-    total_items = sum(len(inv.get('items', [])) for inv in invoices)
-    
-    # Sales by status
-    paid = sum(1 for inv in invoices if inv.get('status') == 'paid')
-    unpaid = sum(1 for inv in invoices if inv.get('status') == 'unpaid')
-    
-    # Product breakdown
-    product_sales = {}
-    for inv in invoices:
-        for item in inv.get('items', []):
-            pname = item.get('productName', 'Unknown')
-            if pname not in product_sales:
-                product_sales[pname] = {'quantity': 0, 'revenue': 0}
-            product_sales[pname]['quantity'] += item.get('quantity', 0)
-            product_sales[pname]['revenue'] += item.get('total', 0)
-    
-    top_products = sorted(
-        [{'name': k, **v} for k, v in product_sales.items()],
-        key=lambda x: x['revenue'],
-        reverse=True
-    )[:20]
-    
-    # Daily breakdown
-    daily_data = {}
-    for inv in invoices:
-        day = inv.get('createdAt', now).strftime('%Y-%m-%d')
-        if day not in daily_data:
-            daily_data[day] = {'sales': 0, 'orders': 0}
-        daily_data[day]['sales'] += inv.get('total', 0)
-        daily_data[day]['orders'] += 1
-    
-    daily_breakdown = [{'date': k, **v} for k, v in sorted(daily_data.items())]
-    
-    # Format invoices for response
-    for inv in invoices:
-        inv['_id'] = str(inv['_id'])
-    
-    return {
-        "period": {"start": start.isoformat(), "end": end.isoformat()},
-        "summary": {
-            "totalSales": total_sales,
-            "totalOrders": total_orders,
-            "totalItems": total_items,
-            "averageOrderValue": total_sales / total_orders if total_orders > 0 else 0,
-            "paidOrders": paid,
-            "unpaidOrders": unpaid
-        },
-        "topProducts": top_products,
-        "dailyBreakdown": daily_breakdown,
-        "invoices": invoices[-50:]  # Last 50 invoices
-    }
+    return await sales_report(db, tenant_id, start, end)
+
+
+INVENTORY_SECTIONS = {"all": None, "healthy": OK, "low": LOW, "out": OUT}
+INVENTORY_PAGE_SIZE = 100
+
+
+def inventory_report_pipeline(tenant_id: Optional[str]) -> list:
+    """Totals, stock states and the category breakdown in one pass - nothing per product is returned."""
+    stock = {"$ifNull": ["$stock", 0]}
+    cost_value = {"$multiply": [stock, {"$ifNull": ["$costPrice", 0]}]}
+    retail_value = {"$multiply": [stock, {"$ifNull": ["$salePrice", 0]}]}
+    return [
+        {"$match": _base_query(tenant_id)},
+        {"$facet": {
+            "summary": [{"$group": {
+                "_id": None,
+                "totalProducts": {"$sum": 1},
+                "totalStock": {"$sum": stock},
+                "totalValue": {"$sum": cost_value},
+                "totalRetailValue": {"$sum": retail_value},
+                "healthy": {"$sum": {"$cond": [{"$eq": ["$stockState", OK]}, 1, 0]}},
+                "lowStock": {"$sum": {"$cond": [{"$eq": ["$stockState", LOW]}, 1, 0]}},
+                "outOfStock": {"$sum": {"$cond": [{"$eq": ["$stockState", OUT]}, 1, 0]}},
+            }}],
+            "categories": [
+                {"$group": {
+                    "_id": {"$ifNull": ["$category", "عام"]},
+                    "count": {"$sum": 1},
+                    "stock": {"$sum": stock},
+                    "value": {"$sum": cost_value},
+                }},
+                {"$sort": {"value": -1}},
+                {"$project": {"_id": 0, "category": "$_id", "count": 1, "stock": 1, "value": 1}},
+            ],
+        }},
+    ]
+
 
 @router.get("/inventory")
 async def get_inventory_report(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("reports"))
 ):
-    """Get inventory report"""
+    """
+    Get inventory report: summary + stock status + category breakdown.
+    Product lists: GET /api/reports/inventory/{section}
+    """
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
-    base = _base_query(tenant_id)
+    rows = await db.products.aggregate(inventory_report_pipeline(tenant_id)).to_list(1)
+    facet = rows[0] if rows else {}
+    summary = (facet.get("summary") or [{}])[0]
+    total_value = summary.get("totalValue", 0)
+    total_retail = summary.get("totalRetailValue", 0)
 
-    products = await db.products.find(base).to_list(10000)
-    
-    total_products = len(products)
-    total_stock = sum(p.get('stock', 0) for p in products)
-    total_value = sum(p.get('stock', 0) * p.get('costPrice', 0) for p in products)
-    total_retail = sum(p.get('stock', 0) * p.get('salePrice', 0) for p in products)
-    
-    low_stock = [p for p in products if p.get('stock', 0) <= p.get('reorderLevel', 10) and p.get('stock', 0) > 0]
-    out_of_stock = [p for p in products if p.get('stock', 0) <= 0]
-    healthy_stock = [p for p in products if p.get('stock', 0) > p.get('reorderLevel', 10)]
-    
-    # By category
-    categories = {}
-    for p in products:
-        cat = p.get('category', 'عام')
-        if cat not in categories:
-            categories[cat] = {'count': 0, 'stock': 0, 'value': 0}
-        categories[cat]['count'] += 1
-        categories[cat]['stock'] += p.get('stock', 0)
-        categories[cat]['value'] += p.get('stock', 0) * p.get('costPrice', 0)
-    
-    category_breakdown = [{'category': k, **v} for k, v in categories.items()]
-    
-    # Format products
-    for p in products:
-        p['_id'] = str(p['_id'])
-    for p in low_stock:
-        p['_id'] = str(p['_id'])
-    for p in out_of_stock:
-        p['_id'] = str(p['_id'])
-    
     return {
         "summary": {
-            "totalProducts": total_products,
-            "totalStock": total_stock,
+            "totalProducts": summary.get("totalProducts", 0),
+            "totalStock": summary.get("totalStock", 0),
             "totalValue": total_value,
             "totalRetailValue": total_retail,
             "potentialProfit": total_retail - total_value
         },
         "stockStatus": {
-            "healthy": len(healthy_stock),
-            "lowStock": len(low_stock),
-            "outOfStock": len(out_of_stock)
+            "healthy": summary.get("healthy", 0),
+            "lowStock": summary.get("lowStock", 0),
+            "outOfStock": summary.get("outOfStock", 0)
         },
-        "categoryBreakdown": category_breakdown,
-        "lowStockItems": low_stock,
-        "outOfStockItems": out_of_stock,
-        "allProducts": products
+        "categoryBreakdown": facet.get("categories") or [],
     }
 
+
+async def inventory_section(db, tenant_id: Optional[str], section: str, cursor: Optional[str], limit: int) -> dict:
+    """
+    One page of a section's products in _id order (keyset pagination on the
+    (tenantId, stockState, _id) index). nextCursor is None on the last page.
+    """
+    query = _base_query(tenant_id)
+    state = INVENTORY_SECTIONS[section]
+    if state is not None:
+        query["stockState"] = state
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$gt": ObjectId(cursor)}
+    items = await db.products.find(query, {"searchKeys": 0}).sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+    next_cursor = str(items[limit - 1]["_id"]) if len(items) > limit else None
+    items = items[:limit]
+    for p in items:
+        p['_id'] = str(p['_id'])
+    return {"section": section, "items": items, "nextCursor": next_cursor}
+
+
+@router.get("/inventory/{section}")
+async def get_inventory_section(
+    section: Literal["all", "healthy", "low", "out"],
+    cursor: Optional[str] = None,
+    limit: int = Query(default=INVENTORY_PAGE_SIZE, ge=1, le=1000),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
+    _: dict = Depends(require_permission("reports"))
+):
+    """صفحة من منتجات تقرير المخزون (all / healthy / low / out) - مرّر nextCursor لجلب الصفحة التالية"""
+    from server import db
+
+    return await inventory_section(db, tenant_id, section, cursor, limit)
+
 @router.get("/purchases")
 async def get_purchases_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("reports"))
 ):
     """Get purchases report"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
 
     now = datetime.now(timezone.utc)
@@ -222,196 +280,338 @@ async def get_purchases_report(
         "purchases": purchases
     }
 
+def _line_totals() -> dict:
+    """$group accumulators of the unwound invoice lines."""
+    return {
+        "quantity": {"$sum": {"$ifNull": ["$items.quantity", 0]}},
+        "revenue": {"$sum": {"$ifNull": ["$items.total", 0]}},
+        "cost": {"$sum": {"$ifNull": ["$items.costTotal", 0]}},
+    }
+
+
+_PROFIT_FIELDS = {
+    "profit": {"$subtract": ["$revenue", "$cost"]},
+    "margin": {"$cond": [
+        {"$gt": ["$revenue", 0]},
+        {"$round": [{"$multiply": [{"$divide": [{"$subtract": ["$revenue", "$cost"]}, "$revenue"]}, 100]}, 2]},
+        0,
+    ]},
+}
+
+
+def profit_report_pipeline(tenant_id: Optional[str], start: datetime, end: datetime,
+                           top: int, breakdown: List[str], tz_name: str = "UTC") -> list:
+    """
+    Revenue, cost of goods sold and margin from the cost snapshot on invoice lines
+    (utils/costing.py) in one pass: totals, per product, and optionally per category / day.
+    Lines without a cost snapshot are counted under uncosted* and add no cost.
+    Product names are the current ones, looked up for the top `top` products only.
+    """
+    facet = {
+        "summary": [{"$group": {
+            "_id": None,
+            **_line_totals(),
+            "uncostedLines": {"$sum": {"$cond": [{"$gt": ["$items.unitCost", None]}, 0, 1]}},
+            "uncostedRevenue": {"$sum": {"$cond": [
+                {"$gt": ["$items.unitCost", None]}, 0, {"$ifNull": ["$items.total", 0]},
+            ]}},
+        }}],
+        "byProduct": [
+            {"$group": {
+                "_id": {"$ifNull": ["$items.productId", "$items.productName"]},
+                # Only used when the product no longer exists (or for free-text lines)
+                "lineName": {"$max": "$items.productName"},
+                **_line_totals(),
+            }},
+            {"$addFields": _PROFIT_FIELDS},
+            {"$sort": {"profit": -1, "_id": 1}},
+            {"$limit": top},
+            {"$addFields": {"productOid": {"$convert": {"input": "$_id", "to": "objectId", "onError": None}}}},
+            {"$lookup": {"from": "products", "localField": "productOid", "foreignField": "_id", "as": "product"}},
+            *([{"$addFields": {"product": {"$filter": {
+                "input": "$product", "cond": {"$eq": ["$$this.tenantId", tenant_id]},
+            }}}}] if tenant_id else []),
+            {"$project": {
+                "_id": 0,
+                "productId": "$_id",
+                "name": {"$ifNull": [{"$arrayElemAt": ["$product.name", 0]}, "$lineName"]},
+                "quantity": 1, "revenue": 1, "cost": 1, "profit": 1, "margin": 1,
+            }},
+        ],
+    }
+    if "category" in breakdown:
+        facet["byCategory"] = [
+            {"$group": {"_id": {"$ifNull": ["$items.category", "عام"]}, **_line_totals()}},
+            {"$addFields": _PROFIT_FIELDS},
+            {"$sort": {"profit": -1, "_id": 1}},
+            {"$project": {"_id": 0, "category": "$_id", "quantity": 1, "revenue": 1, "cost": 1, "profit": 1, "margin": 1}},
+        ]
+    if "day" in breakdown:
+        facet["byDay"] = [
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt", "timezone": tz_name}},
+                **_line_totals(),
+            }},
+            {"$addFields": _PROFIT_FIELDS},
+            {"$sort": {"_id": 1}},
+            {"$project": {"_id": 0, "date": "$_id", "quantity": 1, "revenue": 1, "cost": 1, "profit": 1, "margin": 1}},
+        ]
+    return [
+        {"$match": {**_base_query(tenant_id), "createdAt": {"$gte": start, "$lte": end}}},
+        {"$unwind": "$items"},
+        {"$facet": facet},
+    ]
+
+
+def utc_day_bounds(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    """
+    [start, end] widened to whole UTC days (00:00 of the first day to the last millisecond
+    of the last one), the granularity of the daily rollups. Naive datetimes are taken as UTC.
+    """
+    def utc(value: datetime) -> datetime:
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+    first = utc(start).replace(hour=0, minute=0, second=0, microsecond=0)
+    last = utc(end).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1, milliseconds=-1)
+    return first, last
+
+
+async def profit_report(db, tenant_id: Optional[str], start: datetime, end: datetime,
+                        top: int = 20, breakdown: Optional[List[str]] = None) -> dict:
+    """
+    The period is snapped to whole UTC days so sales, cost of goods and the expenses
+    taken from the daily rollups cover the same days; the snapped period is returned.
+    """
+    breakdown = breakdown or []
+    start, end = utc_day_bounds(start, end)
+    tz_name = await tenant_timezone(db, tenant_id) if "day" in breakdown else "UTC"
+    rows, totals = await asyncio.gather(
+        db.invoices.aggregate(profit_report_pipeline(tenant_id, start, end, top, breakdown, tz_name)).to_list(1),
+        # Expenses and purchases of the period from the daily rollups
+        rollup_totals(db, tenant_id, start, end),
+    )
+    facet = rows[0] if rows else {}
+    summary = (facet.get("summary") or [{}])[0]
+    revenue = summary.get("revenue", 0)
+    cost = summary.get("cost", 0)
+    gross_profit = revenue - cost
+    expenses = totals["expenses.total"]
+
+    report = {
+        "period": {"start": start.isoformat(), "end": end.isoformat()},
+        "revenue": revenue,
+        "costOfGoods": cost,
+        "grossProfit": gross_profit,
+        "expenses": expenses,
+        "netProfit": gross_profit - expenses,
+        "profitMargin": (gross_profit / revenue * 100) if revenue > 0 else 0,
+        "purchases": totals["purchases.total"],
+        "uncosted": {
+            "lines": summary.get("uncostedLines", 0),
+            "revenue": summary.get("uncostedRevenue", 0),
+        },
+        "byProduct": facet.get("byProduct") or [],
+    }
+    if "category" in breakdown:
+        report["byCategory"] = facet.get("byCategory") or []
+    if "day" in breakdown:
+        report["timezone"] = tz_name
+        report["byDay"] = facet.get("byDay") or []
+    return report
+
+
 @router.get("/profit")
 async def get_profit_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    authorization: Optional[str] = Header(None),
+    top: int = Query(default=20, ge=1, le=500),
+    breakdown: List[Literal["category", "day"]] = Query(default=[]),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("reports"))
 ):
-    """Get profit report"""
+    """
+    Get profit report: margin on goods sold from the line cost snapshots, top products by
+    profit and optional ?breakdown=category&breakdown=day
+    """
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
-    base = _base_query(tenant_id)
-
     now = datetime.now(timezone.utc)
     start = datetime.fromisoformat(start_date.replace('Z', '+00:00')) if start_date else now - timedelta(days=30)
     end = datetime.fromisoformat(end_date.replace('Z', '+00:00')) if end_date else now
 
-    # Get sales (tenant-scoped)
-    invoices = await db.invoices.find({
-        **base,
-        "createdAt": {"$gte": start, "$lte": end}
-    }).to_list(10000)
-    total_sales = sum(inv.get('total', 0) for inv in invoices)
+    return await profit_report(db, tenant_id, start, end, top, list(breakdown))
 
-    # Get purchases (tenant-scoped)
-    purchases = await db.purchases.find({
-        **base,
-        "createdAt": {"$gte": start, "$lte": end}
-    }).to_list(10000)
-    total_purchases = sum(p.get('total', 0) for p in purchases)
 
-    # Get expenses (tenant-scoped)
-    expense_query = {**base, "date": {"$gte": start, "$lte": end}}
-    colls = await db.list_collection_names()
-    expenses = await db.expenses.find(expense_query).to_list(10000) if colls and 'expenses' in colls else []
-    total_expenses = sum(e.get('amount', 0) for e in expenses)
-    
-    gross_profit = total_sales - total_purchases
-    net_profit = gross_profit - total_expenses
-    
-    return {
-        "period": {"start": start.isoformat(), "end": end.isoformat()},
-        "revenue": total_sales,
-        "costOfGoods": total_purchases,
-        "grossProfit": gross_profit,
-        "expenses": total_expenses,
-        "netProfit": net_profit,
-        "profitMargin": (gross_profit / total_sales * 100) if total_sales > 0 else 0
-    }
+def _growth(current: float, previous: float) -> float:
+    return round((current - previous) / previous * 100, 1) if previous else (100 if current else 0)
+
+
+def month_starts(now: datetime, tz: ZoneInfo, count: int) -> List[datetime]:
+    """Local midnight of the 1st of the last `count` months (oldest first) plus the next month's."""
+    local = now.astimezone(tz)
+    y, m = local.year, local.month
+    starts = [datetime(y + (m == 12), m % 12 + 1, 1, tzinfo=tz)]
+    for _ in range(count):
+        starts.insert(0, datetime(y, m, 1, tzinfo=tz))
+        y, m = (y - 1, 12) if m == 1 else (y, m - 1)
+    return starts
+
+
+async def tenant_timezone(db, tenant_id: Optional[str]) -> str:
+    """IANA timezone from the tenant's settings.timezone (UTC when unset, invalid or super admin)."""
+    if tenant_id and ObjectId.is_valid(tenant_id):
+        tenant = await db.tenants.find_one({"_id": ObjectId(tenant_id)}, {"settings.timezone": 1})
+        name = ((tenant or {}).get("settings") or {}).get("timezone")
+        if name:
+            try:
+                ZoneInfo(name)
+                return name
+            except (ZoneInfoNotFoundError, ValueError):
+                pass
+    return "UTC"
+
+
+def monthly_sales_pipeline(tenant_id: Optional[str], start: datetime, end: datetime, tz_name: str) -> list:
+    """Sales and orders per local month of [start, end) - one $group on the (tenantId, createdAt) index."""
+    return [
+        {"$match": {**_base_query(tenant_id), "createdAt": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m", "date": "$createdAt", "timezone": tz_name}},
+            "sales": {"$sum": {"$ifNull": ["$total", 0]}},
+            "orders": {"$sum": 1},
+        }},
+    ]
 
 
 @router.get("/analytics")
 async def get_analytics_report(
-    authorization: Optional[str] = Header(None),
+    months: int = Query(default=12, ge=2, le=120),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("reports"))
 ):
-    """تحليلات متقدمة: مقارنة الفترات + اتجاه المبيعات الشهري (آخر 12 شهر)"""
+    """
+    تحليلات متقدمة: مقارنة الشهر الحالي بالماضي + اتجاه المبيعات الشهري (آخر `months` شهر)
+    الأشهر حسب المنطقة الزمنية للشركة (settings.timezone) - تجميع واحد على الفواتير
+    """
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
-    base = _base_query(tenant_id)
-    now = datetime.now(timezone.utc)
-
-    # الشهر الحالي والماضي
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    if month_start.month == 1:
-        prev_month_start = month_start.replace(year=month_start.year - 1, month=12)
-    else:
-        prev_month_start = month_start.replace(month=month_start.month - 1)
-    next_month = month_start + timedelta(days=32)
-    current_month_end = next_month.replace(day=1) - timedelta(seconds=1)
-    prev_month_end = month_start - timedelta(seconds=1)
-
-    # مبيعات الشهر الحالي
-    current_invoices = await db.invoices.find({
-        **base,
-        "createdAt": {"$gte": month_start, "$lte": current_month_end}
-    }).to_list(10000)
-    current_sales = sum(inv.get("total", 0) for inv in current_invoices)
-    current_orders = len(current_invoices)
-
-    # مبيعات الشهر الماضي
-    prev_invoices = await db.invoices.find({
-        **base,
-        "createdAt": {"$gte": prev_month_start, "$lte": prev_month_end}
-    }).to_list(10000)
-    prev_sales = sum(inv.get("total", 0) for inv in prev_invoices)
-    prev_orders = len(prev_invoices)
-
-    # نسب النمو
-    sales_growth = ((current_sales - prev_sales) / prev_sales * 100) if prev_sales else (100 if current_sales else 0)
-    orders_growth = ((current_orders - prev_orders) / prev_orders * 100) if prev_orders else (100 if current_orders else 0)
-
-    # اتجاه شهري لآخر 12 شهر
-    monthly_trend = []
-    for i in range(11, -1, -1):
-        # أول يوم من الشهر (i أشهر قبل الشهر الحالي)
-        y, m = month_start.year, month_start.month
-        m -= i
-        while m < 1:
-            m += 12
-            y -= 1
-        start_m = datetime(y, m, 1, 0, 0, 0, 0, timezone.utc)
-        if m == 12:
-            end_m = datetime(y + 1, 1, 1, 0, 0, 0, 0, timezone.utc) - timedelta(seconds=1)
-        else:
-            end_m = datetime(y, m + 1, 1, 0, 0, 0, 0, timezone.utc) - timedelta(seconds=1)
-        invs = await db.invoices.find({
-            **base,
-            "createdAt": {"$gte": start_m, "$lte": end_m}
-        }).to_list(5000)
-        total = sum(inv.get("total", 0) for inv in invs)
-        monthly_trend.append({
+    tz_name = await tenant_timezone(db, tenant_id)
+    # شهر إضافي قبل بداية الاتجاه لحساب نمو الشهر الأول
+    starts = month_starts(datetime.now(timezone.utc), ZoneInfo(tz_name), months + 1)
+    rows = await db.invoices.aggregate(monthly_sales_pipeline(
+        tenant_id, starts[0].astimezone(timezone.utc), starts[-1].astimezone(timezone.utc), tz_name
+    )).to_list(None)
+    by_month = {row["_id"]: row for row in rows}
+
+    series = []
+    for start_m in starts[:-1]:
+        row = by_month.get(start_m.strftime("%Y-%m"), {})
+        series.append({
             "month": start_m.strftime("%Y-%m"),
             "label": start_m.strftime("%b %Y"),
-            "sales": total,
-            "orders": len(invs),
+            "sales": row.get("sales", 0),
+            "orders": row.get("orders", 0),
         })
+    for previous, entry in zip(series, series[1:]):
+        entry["salesGrowth"] = _growth(entry["sales"], previous["sales"])
+    monthly_trend = series[1:]
+    current, previous = series[-1], series[-2]
 
     return {
+        "timezone": tz_name,
         "currentMonth": {
-            "sales": current_sales,
-            "orders": current_orders,
-            "label": month_start.strftime("%b %Y"),
+            "sales": current["sales"],
+            "orders": current["orders"],
+            "label": current["label"],
         },
         "previousMonth": {
-            "sales": prev_sales,
-            "orders": prev_orders,
-            "label": prev_month_start.strftime("%b %Y"),
+            "sales": previous["sales"],
+            "orders": previous["orders"],
+            "label": previous["label"],
         },
         "growth": {
-            "salesPercent": round(sales_growth, 1),
-            "ordersPercent": round(orders_growth, 1),
+            "salesPercent": _growth(current["sales"], previous["sales"]),
+            "ordersPercent": _growth(current["orders"], previous["orders"]),
         },
         "monthlyTrend": monthly_trend,
     }
 
 
+CUSTOMER_SORTS = {
+    "revenue": {"totalRevenue": -1, "_id": 1},
+    "orders": {"orderCount": -1, "totalRevenue": -1, "_id": 1},
+    "recent": {"lastOrderAt": -1, "_id": 1},
+}
+_DAY_MS = 24 * 60 * 60 * 1000
+
+
+def customers_report_pipeline(tenant_id: Optional[str], start: datetime, end: datetime,
+                              limit: int, sort: str = "revenue") -> list:
+    """
+    Invoices of the period grouped by customer, ranked, then only the top `limit`
+    joined to customers. RFM values come from the same $group:
+    recency = days from the last order to `end`, frequency = orders, monetary = revenue.
+    """
+    return [
+        {"$match": {**_base_query(tenant_id), "createdAt": {"$gte": start, "$lte": end}}},
+        {"$group": {
+            # Walk-in sales (no customerId) are grouped under ""
+            "_id": {"$ifNull": ["$customerId", ""]},
+            "totalRevenue": {"$sum": {"$ifNull": ["$total", 0]}},
+            "orderCount": {"$sum": 1},
+            "firstOrderAt": {"$min": "$createdAt"},
+            "lastOrderAt": {"$max": "$createdAt"},
+        }},
+        {"$sort": CUSTOMER_SORTS[sort]},
+        {"$limit": limit},
+        {"$addFields": {"customerOid": {
+            "$convert": {"input": "$_id", "to": "objectId", "onError": None}
+        }}},
+        {"$lookup": {"from": "customers", "localField": "customerOid", "foreignField": "_id", "as": "customer"}},
+        # Customer ids are only resolved inside the tenant
+        *([{"$addFields": {"customer": {"$filter": {
+            "input": "$customer", "cond": {"$eq": ["$$this.tenantId", tenant_id]},
+        }}}}] if tenant_id else []),
+        {"$project": {
+            "_id": 0,
+            "customerId": {"$cond": [{"$eq": ["$_id", ""]}, "unknown", {"$toString": "$_id"}]},
+            "customerName": {"$ifNull": [
+                {"$arrayElemAt": ["$customer.name", 0]},
+                {"$ifNull": [{"$arrayElemAt": ["$customer.nameEn", 0]}, "Unknown"]},
+            ]},
+            "totalRevenue": 1,
+            "orderCount": 1,
+            "averageOrderValue": {"$round": [{"$divide": ["$totalRevenue", "$orderCount"]}, 2]},
+            "firstOrderAt": 1,
+            "lastOrderAt": 1,
+            "rfm": {
+                "recencyDays": {"$floor": {"$divide": [{"$subtract": [end, "$lastOrderAt"]}, _DAY_MS]}},
+                "frequency": "$orderCount",
+                "monetary": "$totalRevenue",
+            },
+        }},
+    ]
+
+
 @router.get("/customers")
 async def get_customers_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     limit: int = Query(default=20, ge=1, le=100),
-    authorization: Optional[str] = Header(None),
+    sort: Literal["revenue", "orders", "recent"] = "revenue",
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("reports"))
 ):
-    """تقرير العملاء: أفضل العملاء حسب الإيراد وعدد الطلبات"""
+    """تقرير العملاء: أفضل العملاء حسب الإيراد أو عدد الطلبات أو آخر شراء، مع قيم RFM - تجميع واحد"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
-    base = _base_query(tenant_id)
     now = datetime.now(timezone.utc)
     start = datetime.fromisoformat(start_date.replace("Z", "+00:00")) if start_date else now - timedelta(days=365)
     end = datetime.fromisoformat(end_date.replace("Z", "+00:00")) if end_date else now
 
-    invoices = await db.invoices.find({
-        **base,
-        "createdAt": {"$gte": start, "$lte": end},
-    }).to_list(10000)
-
-    # تجميع حسب العميل
-    customer_ids = set()
-    for inv in invoices:
-        cid = inv.get("customerId")
-        if cid:
-            customer_ids.add(cid)
-    customers_map = {}
-    if customer_ids:
-        from bson import ObjectId
-        ids = [ObjectId(x) for x in customer_ids if ObjectId.is_valid(x)]
-        if ids:
-            cursor = db.customers.find({"_id": {"$in": ids}, **base})
-            async for c in cursor:
-                customers_map[str(c["_id"])] = c.get("name") or c.get("nameEn") or str(c["_id"])
-
-    by_customer = {}
-    for inv in invoices:
-        cid = inv.get("customerId") or "unknown"
-        cid_str = str(cid) if cid != "unknown" else "unknown"
-        name = customers_map.get(cid_str) if cid_str != "unknown" else None
-        key = cid_str if cid_str != "unknown" else "unknown"
-        if key not in by_customer:
-            by_customer[key] = {"customerId": cid_str, "customerName": name or "Unknown", "totalRevenue": 0, "orderCount": 0}
-        by_customer[key]["totalRevenue"] += inv.get("total", 0)
-        by_customer[key]["orderCount"] += 1
-
-    # ترتيب حسب الإيراد
-    top = sorted(by_customer.values(), key=lambda x: x["totalRevenue"], reverse=True)[:limit]
-    for c in top:
-        c["averageOrderValue"] = round(c["totalRevenue"] / c["orderCount"], 2) if c["orderCount"] else 0
+    top = await db.invoices.aggregate(
+        customers_report_pipeline(tenant_id, start, end, limit, sort)
+    ).to_list(limit)
 
     return {
         "period": {"start": start.isoformat(), "end": end.isoformat()},
@@ -1,10 +1,10 @@
 """
 Suppliers Routes - Multi-Tenant Support
 """
-from fastapi import APIRouter, HTTPException, status, Header, Depends
+from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List, Optional
 from models.supplier import SupplierModel, SupplierCreate, SupplierUpdate
-from middleware.tenant import get_tenant_from_token
+from middleware.tenant import get_tenant_id
 from utils.auth import require_permission
 from bson import ObjectId
 from datetime import datetime, timezone
@@ -13,11 +13,10 @@ router = APIRouter(prefix="/api/suppliers", tags=["suppliers"])
 
 
 @router.get("", response_model=List[dict])
-async def get_suppliers(authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("suppliers"))):
+async def get_suppliers(tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("suppliers"))):
     """Get all suppliers for tenant"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"tenantId": tenant_id} if tenant_id else {}
     
     suppliers = await db.suppliers.find(query).to_list(1000)
@@ -27,14 +26,13 @@ async def get_suppliers(authorization: Optional[str] = Header(None), _: dict = D
 
 
 @router.get("/{supplier_id}", response_model=dict)
-async def get_supplier(supplier_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("suppliers"))):
+async def get_supplier(supplier_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("suppliers"))):
     """Get supplier by ID"""
     from server import db
     
     if not ObjectId.is_valid(supplier_id):
         raise HTTPException(status_code=400, detail="Invalid supplier ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(supplier_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -48,12 +46,10 @@ async def get_supplier(supplier_id: str, authorization: Optional[str] = Header(N
 
 
 @router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
-async def create_supplier(supplier: SupplierCreate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("suppliers"))):
+async def create_supplier(supplier: SupplierCreate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("suppliers"))):
     """Create new supplier"""
     from server import db
     
-    tenant_id = get_tenant_from_token(authorization)
-    
     supplier_dict = supplier.model_dump()
     supplier_dict['tenantId'] = tenant_id
     supplier_dict['createdAt'] = datetime.now(timezone.utc)
@@ -67,14 +63,13 @@ async def create_supplier(supplier: SupplierCreate, authorization: Optional[str]
 
 
 @router.put("/{supplier_id}", response_model=dict)
-async def update_supplier(supplier_id: str, supplier: SupplierUpdate, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("suppliers"))):
+async def update_supplier(supplier_id: str, supplier: SupplierUpdate, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("suppliers"))):
     """Update supplier"""
     from server import db
     
     if not ObjectId.is_valid(supplier_id):
         raise HTTPException(status_code=400, detail="Invalid supplier ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(supplier_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
@@ -95,14 +90,13 @@ async def update_supplier(supplier_id: str, supplier: SupplierUpdate, authorizat
 
 
 @router.delete("/{supplier_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_supplier(supplier_id: str, authorization: Optional[str] = Header(None), _: dict = Depends(require_permission("suppliers"))):
+async def delete_supplier(supplier_id: str, tenant_id: Optional[str] = Depends(get_tenant_id), _: dict = Depends(require_permission("suppliers"))):
     """Delete supplier"""
     from server import db
     
     if not ObjectId.is_valid(supplier_id):
         raise HTTPException(status_code=400, detail="Invalid supplier ID")
     
-    tenant_id = get_tenant_from_token(authorization)
     query = {"_id": ObjectId(supplier_id)}
     if tenant_id:
         query["tenantId"] = tenant_id
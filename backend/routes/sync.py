@@ -13,7 +13,13 @@ from typing import Dict, List, Literal, Optional, Any
 from datetime import datetime, timezone
 from bson import ObjectId
 
-from utils.auth import require_tenant
+from utils.auth import require_tenant, invalidate_user_permissions
+from utils.costing import carry_line_costs, snapshot_line_costs
+from utils.dashboard_cache import invalidate_dashboard
+from utils.product_cache import invalidate_tenant_products
+from utils.rollups import ROLLUP_SOURCES, apply_rollups
+from utils.search import product_search_keys
+from utils.stock_state import set_with_state_pipeline, stock_state_of
 
 router = APIRouter(prefix="/api/sync", tags=["sync"])
 
@@ -167,6 +173,10 @@ async def upload_changes(
             )
             continue
 
+        # Invoices / purchases / expenses: documents before and after the applied changes
+        rollup_removed: List[Dict[str, Any]] = []
+        rollup_added: List[Dict[str, Any]] = []
+
         for change in collection.changes:
             item_result = SyncItemResult(
                 id=change.id,
@@ -234,10 +244,16 @@ async def upload_changes(
                     data["updatedAt"] = server_now
                     if "createdAt" not in data:
                         data["createdAt"] = server_now
+                    if collection.name == "products":
+                        data["searchKeys"] = product_search_keys(data)
+                        data["stockState"] = stock_state_of(data)
+                    if collection.name == "invoices":
+                        await snapshot_line_costs(db, data.get("tenantId"), [data])
 
                     insert_result = await coll.insert_one(data)
                     item_result.id = str(insert_result.inserted_id)
                     item_result.status = "applied"
+                    rollup_added.append(data)
 
                 # ----- UPDATE -----
                 elif change.action == "update":
@@ -267,17 +283,25 @@ async def upload_changes(
                             data["tenantId"] = tenant_id
 
                         data["updatedAt"] = server_now
+                        if collection.name == "products":
+                            data["searchKeys"] = product_search_keys({**existing_doc, **data})
+                        if collection.name == "invoices" and isinstance(data.get("items"), list):
+                            carry_line_costs(existing_doc.get("items") or [], data["items"])
+                            await snapshot_line_costs(db, existing_doc.get("tenantId"), [data])
 
                         await coll.update_one(
                             {"_id": existing_doc["_id"]},
-                            {"$set": data},
+                            set_with_state_pipeline(data) if collection.name == "products" else {"$set": data},
                         )
                         item_result.status = "applied"
+                        rollup_removed.append(existing_doc)
+                        rollup_added.append({**existing_doc, **data})
 
                 # ----- DELETE -----
                 elif change.action == "delete":
                     await coll.delete_one({"_id": existing_doc["_id"]})
                     item_result.status = "applied"
+                    rollup_removed.append(existing_doc)
 
             except Exception as e:  # noqa: BLE001
                 item_result.status = "error"
@@ -285,6 +309,16 @@ async def upload_changes(
 
             results.append(item_result)
 
+        if collection.name in ROLLUP_SOURCES:
+            await apply_rollups(db, collection.name, removed=rollup_removed, added=rollup_added)
+        if collection.name == "users" and collection.changes:
+            # Uploaded user documents may carry new permissions
+            invalidate_user_permissions()
+        if collection.name in ("products", "product_units") and collection.changes:
+            invalidate_tenant_products(tenant_id)
+        if collection.name in ("invoices", "purchases", "products", "product_units") and collection.changes:
+            invalidate_dashboard(tenant_id)
+
         collection_results.append(
             SyncCollectionUploadResult(name=collection.name, results=results)
         )
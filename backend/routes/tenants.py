@@ -14,11 +14,10 @@ from utils.password_policy import validate_password, validate_password_en
 router = APIRouter(prefix="/api/tenants", tags=["Tenants"])
 
 
-# Helper function for password hashing
-def get_password_hash(password: str) -> str:
-    from passlib.context import CryptContext
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    return pwd_context.hash(password)
+# Helper function for password hashing (runs on the bounded hashing pool)
+async def get_password_hash(password: str) -> str:
+    from utils.password_hashing import hash_password
+    return await hash_password(password)
 
 
 def generate_tenant_code(name: str) -> str:
@@ -305,7 +304,7 @@ async def create_tenant(tenant_data: dict):
             "pos": True, "inventory_count": True, "reports": True, "accounting": True, "settings": True, "users": True, "warehouses": True
         },
         "tenantId": tenant_id,
-        "passwordHash": get_password_hash(admin_password),
+        "passwordHash": await get_password_hash(admin_password),
         "createdAt": datetime.now(timezone.utc),
         "updatedAt": datetime.now(timezone.utc),
     }
@@ -419,12 +418,17 @@ async def delete_tenant(tenant_id: str):
         raise HTTPException(status_code=404, detail="Tenant not found")
     
     await db.users.delete_many({"tenantId": tenant_id})
+    from utils.auth import invalidate_user_permissions
+    invalidate_user_permissions()
     await db.products.delete_many({"tenantId": tenant_id})
+    from utils.product_cache import invalidate_tenant_products
+    invalidate_tenant_products(tenant_id)
     await db.product_units.delete_many({"tenantId": tenant_id})
     await db.customers.delete_many({"tenantId": tenant_id})
     await db.suppliers.delete_many({"tenantId": tenant_id})
     await db.invoices.delete_many({"tenantId": tenant_id})
     await db.purchases.delete_many({"tenantId": tenant_id})
+    await db.daily_rollups.delete_many({"tenantId": tenant_id})
     await db.warehouses.delete_many({"tenantId": tenant_id})
     
     await db.tenants.delete_one({"_id": ObjectId(tenant_id)})
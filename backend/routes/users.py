@@ -4,7 +4,8 @@ from pydantic import BaseModel
 from models.user import UserModel, UserCreate, UserUpdate
 from bson import ObjectId
 from datetime import datetime, timezone
-from utils.auth import require_permission, require_tenant, get_current_user, get_password_hash
+from utils.auth import require_permission, require_tenant, get_current_user, invalidate_user_permissions
+from utils.password_hashing import hash_password
 from utils.password_policy import validate_password, validate_password_en
 from utils.audit import log_audit
 from utils.rbac import get_permissions_for_role
@@ -103,7 +104,7 @@ async def create_user(
     # Map name/nameEn to fullName/fullNameEn for consistency with auth
     user_dict["fullName"] = user_dict.get("name", "")
     user_dict["fullNameEn"] = user_dict.get("nameEn", "")
-    user_dict["passwordHash"] = get_password_hash(user.password)
+    user_dict["passwordHash"] = await hash_password(user.password)
     user_dict["tenantId"] = tenant_id
     user_dict["createdAt"] = datetime.now(timezone.utc)
     user_dict["updatedAt"] = datetime.now(timezone.utc)
@@ -142,6 +143,7 @@ async def update_user(user_id: str, user: UserUpdate, current_user: dict = Depen
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_permissions(user_id)
 
     updated_user = await db.users.find_one({"_id": ObjectId(user_id)})
     updated_user['_id'] = str(updated_user['_id'])
@@ -158,5 +160,6 @@ async def delete_user(user_id: str, current_user: dict = Depends(require_permiss
     result = await db.users.delete_one({"_id": ObjectId(user_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_permissions(user_id)
     await log_audit(db, current_user.get("userId", ""), "delete", "user", user_id, {})
     return None
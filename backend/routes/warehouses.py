@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Header
+from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List, Optional
 from models.warehouse import WarehouseModel, WarehouseCreate, WarehouseUpdate
 from utils.auth import require_permission
-from middleware.tenant import get_tenant_from_token
+from middleware.tenant import get_tenant_id
 from bson import ObjectId
 from datetime import datetime, timezone
 
@@ -15,12 +15,11 @@ def _base_query(tenant_id: Optional[str]) -> dict:
 
 @router.get("", response_model=List[dict])
 async def get_warehouses(
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("warehouses"))
 ):
     """Get all warehouses"""
     from server import db
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     warehouses = await db.warehouses.find(base).to_list(1000)
     for warehouse in warehouses:
@@ -31,7 +30,7 @@ async def get_warehouses(
 @router.get("/{warehouse_id}", response_model=dict)
 async def get_warehouse(
     warehouse_id: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("warehouses"))
 ):
     """Get warehouse by ID"""
@@ -39,7 +38,6 @@ async def get_warehouse(
     if not ObjectId.is_valid(warehouse_id):
         raise HTTPException(status_code=400, detail="Invalid warehouse ID")
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     warehouse = await db.warehouses.find_one({"_id": ObjectId(warehouse_id), **base})
     if not warehouse:
@@ -52,13 +50,12 @@ async def get_warehouse(
 @router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_warehouse(
     warehouse: WarehouseCreate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("warehouses"))
 ):
     """Create new warehouse"""
     from server import db
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     existing = await db.warehouses.find_one({"code": warehouse.code, **base})
     if existing:
@@ -80,7 +77,7 @@ async def create_warehouse(
 async def update_warehouse(
     warehouse_id: str,
     warehouse: WarehouseUpdate,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("warehouses"))
 ):
     """Update warehouse"""
@@ -88,7 +85,6 @@ async def update_warehouse(
     if not ObjectId.is_valid(warehouse_id):
         raise HTTPException(status_code=400, detail="Invalid warehouse ID")
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     query = {"_id": ObjectId(warehouse_id), **base}
 
@@ -112,7 +108,7 @@ async def update_warehouse(
 @router.delete("/{warehouse_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_warehouse(
     warehouse_id: str,
-    authorization: Optional[str] = Header(None),
+    tenant_id: Optional[str] = Depends(get_tenant_id),
     _: dict = Depends(require_permission("warehouses"))
 ):
     """Delete warehouse"""
@@ -120,7 +116,6 @@ async def delete_warehouse(
     if not ObjectId.is_valid(warehouse_id):
         raise HTTPException(status_code=400, detail="Invalid warehouse ID")
 
-    tenant_id = get_tenant_from_token(authorization)
     base = _base_query(tenant_id)
     result = await db.warehouses.delete_one({"_id": ObjectId(warehouse_id), **base})
 
@@ -0,0 +1,43 @@
+"""
+Backfill derived product fields for products written before they existed.
+Run from backend directory:
+    python scripts/backfill_product_fields.py        # products missing the fields
+    python scripts/backfill_product_fields.py --all  # recompute for every product
+Fields: searchKeys (utils/search.py), stockState (utils/stock_state.py).
+Uses MONGO_URL and DB_NAME like the server.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Run from backend directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(Path(__file__).resolve().parent.parent)
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from utils.search import backfill_search_keys
+from utils.stock_state import backfill_stock_state
+
+load_dotenv(Path.cwd() / ".env")
+mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+db_name = os.environ.get("DB_NAME", "erp_local")
+
+
+async def main(recompute_all: bool) -> int:
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    try:
+        updated = await backfill_search_keys(db, only_missing=not recompute_all)
+        print(f"searchKeys  {updated} products updated")
+        updated = await backfill_stock_state(db, only_missing=not recompute_all)
+        print(f"stockState  {updated} products updated")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main("--all" in sys.argv[1:])))
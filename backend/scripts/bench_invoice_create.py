@@ -0,0 +1,92 @@
+"""
+Benchmark: per-invoice write latency as the basket grows.
+Compares the old sequential path (one update_one per line + customer update + insert + re-read)
+with routes.invoices.insert_invoice (one bulk_write, no re-read, transaction when available).
+
+Run from backend directory against a disposable database:
+    python scripts/bench_invoice_create.py [invoices_per_size]
+Uses MONGO_URL and BENCH_DB_NAME (default erp_bench - dropped at the end).
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Run from backend directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(Path(__file__).resolve().parent.parent)
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from routes.invoices import insert_invoice
+
+mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+db_name = os.environ.get("BENCH_DB_NAME", "erp_bench")
+TENANT = "bench-tenant"
+LINE_COUNTS = [1, 5, 10, 20, 40, 80]
+
+
+def make_invoice(product_ids, customer_id, lines):
+    now = datetime.now(timezone.utc)
+    items = [
+        {"productId": str(product_ids[i % len(product_ids)]), "productName": f"P{i}", "quantity": 1, "price": 10.0, "total": 10.0}
+        for i in range(lines)
+    ]
+    return {
+        "tenantId": TENANT, "customerId": str(customer_id), "customerName": "Bench", "items": items,
+        "subtotal": 10.0 * lines, "tax": 0.0, "discount": 0.0, "total": 10.0 * lines, "status": "unpaid",
+        "date": now, "dueDate": now, "createdAt": now, "updatedAt": now,
+    }
+
+
+async def sequential_path(db, invoice):
+    """The pre-bulk create_invoice: ~lines + 3 sequential round trips."""
+    await db.customers.update_one({"_id": ObjectId(invoice["customerId"])}, {"$inc": {"balance": -invoice["total"]}})
+    for item in invoice["items"]:
+        await db.products.update_one({"_id": ObjectId(item["productId"])}, {"$inc": {"stock": -item["quantity"]}})
+    result = await db.invoices.insert_one(invoice)
+    return await db.invoices.find_one({"_id": result.inserted_id})
+
+
+async def bulk_path(db, invoice):
+    return await insert_invoice(db, TENANT, invoice)
+
+
+async def measure(db, fn, product_ids, customer_id, lines, runs):
+    samples = []
+    for _ in range(runs):
+        invoice = make_invoice(product_ids, customer_id, lines)
+        start = time.perf_counter()
+        await fn(db, invoice)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+async def main(runs: int):
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    try:
+        await db.products.create_index([("tenantId", 1), ("sku", 1)])
+        product_ids = (await db.products.insert_many([
+            {"tenantId": TENANT, "sku": f"SKU-{i}", "name": f"P{i}", "stock": 1_000_000}
+            for i in range(max(LINE_COUNTS))
+        ])).inserted_ids
+        customer_id = (await db.customers.insert_one({"tenantId": TENANT, "name": "Bench", "balance": 0})).inserted_id
+
+        print(f"{'lines':>6} | {'sequential p50 ms':>18} | {'bulk p50 ms':>12} | {'speedup':>7}")
+        print("-" * 55)
+        for lines in LINE_COUNTS:
+            seq_p50, _ = await measure(db, sequential_path, product_ids, customer_id, lines, runs)
+            bulk_p50, _ = await measure(db, bulk_path, product_ids, customer_id, lines, runs)
+            print(f"{lines:>6} | {seq_p50:>18.2f} | {bulk_p50:>12.2f} | {seq_p50 / bulk_p50:>6.1f}x")
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
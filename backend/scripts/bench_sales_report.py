@@ -0,0 +1,104 @@
+"""
+Benchmark: GET /api/reports/sales - the old Python loop over find().to_list(10000) versus
+routes.reports.sales_report (one $match/$facet aggregation).
+Also shows the old path's silent truncation once a period has more than 10,000 invoices.
+
+Run from backend directory against a disposable database:
+    python scripts/bench_sales_report.py [runs]
+Uses MONGO_URL and BENCH_DB_NAME (default erp_bench - dropped at the end).
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+# Run from backend directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(Path(__file__).resolve().parent.parent)
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from routes.reports import sales_report
+
+mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+db_name = os.environ.get("BENCH_DB_NAME", "erp_bench")
+TENANT = "bench-tenant"
+INVOICE_COUNTS = [1_000, 10_000, 50_000]
+INSERT_CHUNK = 5_000
+
+
+async def legacy_sales_report(db, tenant_id, start, end):
+    """The pre-aggregation implementation (Python loops over at most 10,000 invoices)."""
+    invoices = await db.invoices.find({"tenantId": tenant_id, "createdAt": {"$gte": start, "$lte": end}}).to_list(10000)
+    total_sales = sum(inv.get('total', 0) for inv in invoices)
+    total_orders = len(invoices)
+    product_sales = {}
+    for inv in invoices:
+        for item in inv.get('items', []):
+            entry = product_sales.setdefault(item.get('productName', 'Unknown'), {'quantity': 0, 'revenue': 0})
+            entry['quantity'] += item.get('quantity', 0)
+            entry['revenue'] += item.get('total', 0)
+    daily_data = {}
+    for inv in invoices:
+        entry = daily_data.setdefault(inv['createdAt'].strftime('%Y-%m-%d'), {'sales': 0, 'orders': 0})
+        entry['sales'] += inv.get('total', 0)
+        entry['orders'] += 1
+    return {"summary": {"totalSales": total_sales, "totalOrders": total_orders}}
+
+
+async def seed(db, count, start):
+    docs = []
+    for i in range(count):
+        lines = random.randint(1, 5)
+        items = [
+            {"productName": f"P{random.randint(0, 199)}", "quantity": 1, "price": 10.0, "total": 10.0}
+            for _ in range(lines)
+        ]
+        docs.append({
+            "tenantId": TENANT, "items": items, "total": 10.0 * lines,
+            "status": random.choice(["paid", "unpaid"]),
+            "createdAt": start + timedelta(seconds=random.randint(0, 29 * 86400)),
+        })
+        if len(docs) >= INSERT_CHUNK:
+            await db.invoices.insert_many(docs)
+            docs = []
+    if docs:
+        await db.invoices.insert_many(docs)
+
+
+async def measure(fn, db, start, end, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = await fn(db, TENANT, start, end)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), result["summary"]["totalOrders"]
+
+
+async def main(runs: int):
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=30)
+    try:
+        await db.invoices.create_index([("tenantId", 1), ("createdAt", -1)])
+        print(f"{'invoices':>9} | {'old p50 ms':>10} | {'old orders':>10} | {'new p50 ms':>10} | {'new orders':>10} | {'speedup':>7}")
+        print("-" * 72)
+        seeded = 0
+        for count in INVOICE_COUNTS:
+            await seed(db, count - seeded, start)
+            seeded = count
+            old_ms, old_orders = await measure(legacy_sales_report, db, start, end, runs)
+            new_ms, new_orders = await measure(sales_report, db, start, end, runs)
+            print(f"{count:>9} | {old_ms:>10.1f} | {old_orders:>10} | {new_ms:>10.1f} | {new_orders:>10} | {old_ms / new_ms:>6.1f}x")
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
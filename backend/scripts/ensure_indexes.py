@@ -0,0 +1,52 @@
+"""
+Build the indexes declared in utils/indexes.py, or report drift only.
+Run from backend directory:
+    python scripts/ensure_indexes.py          # create missing indexes, then report drift
+    python scripts/ensure_indexes.py --check  # report drift only (exit code 1 if missing/mismatched)
+Uses MONGO_URL and DB_NAME like the server.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Run from backend directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(Path(__file__).resolve().parent.parent)
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from utils.indexes import ensure_indexes, index_drift
+
+load_dotenv(Path.cwd() / ".env")
+mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+db_name = os.environ.get("DB_NAME", "erp_local")
+
+
+async def main(check_only: bool) -> int:
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    try:
+        if not check_only:
+            result = await ensure_indexes(db)
+            for name in result["created"]:
+                print(f"created    {name}")
+            for name in result["failed"]:
+                print(f"FAILED     {name}", file=sys.stderr)
+        drift = await index_drift(db)
+        for name in drift["missing"]:
+            print(f"missing    {name}")
+        for name in drift["mismatched"]:
+            print(f"mismatched {name}")
+        for name in drift["undeclared"]:
+            print(f"undeclared {name}")
+        if not any(drift.values()):
+            print("OK: indexes match utils/indexes.py")
+        return 1 if drift["missing"] or drift["mismatched"] else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main("--check" in sys.argv[1:])))
@@ -0,0 +1,41 @@
+"""
+Rebuild the daily_rollups collection from invoices, purchases and expenses.
+Run from backend directory (preferably while the tenant is idle):
+    python scripts/rebuild_rollups.py                 # every tenant
+    python scripts/rebuild_rollups.py --tenant <id>   # one tenant
+Uses MONGO_URL and DB_NAME like the server.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Run from backend directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(Path(__file__).resolve().parent.parent)
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from utils.rollups import rebuild_rollups
+
+load_dotenv(Path.cwd() / ".env")
+mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+db_name = os.environ.get("DB_NAME", "erp_local")
+
+
+async def main(tenant_id) -> int:
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    try:
+        written = await rebuild_rollups(db, tenant_id)
+        print(f"daily_rollups  {written} tenant-days written")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    tenant = args[args.index("--tenant") + 1] if "--tenant" in args[:-1] else None
+    sys.exit(asyncio.run(main(tenant)))
@@ -19,6 +19,10 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from passlib.context import CryptContext
 from bson import ObjectId
 
+from utils.costing import backfill_line_costs
+from utils.rollups import rebuild_rollups
+from utils.stock_state import stock_inc_pipeline, stock_state_of
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 db_name = os.environ.get("DB_NAME", "erp_local")
@@ -203,6 +207,7 @@ async def run():
             p["eslDeviceId"] = None
             p["createdAt"] = now
             p["updatedAt"] = now
+            p["stockState"] = stock_state_of(p)
         await db.products.insert_many(PRODUCTS)
         print(f"Inserted {len(PRODUCTS)} products")
     else:
@@ -262,7 +267,7 @@ async def run():
             for it in items:
                 await db.products.update_one(
                     {"_id": ObjectId(it["productId"]), **base},
-                    {"$inc": {"stock": it["quantity"]}, "$set": {"updatedAt": now}}
+                    stock_inc_pipeline(it["quantity"], {"updatedAt": now})
                 )
         print("Inserted 25 purchases (last 30 days)")
     else:
@@ -315,7 +320,7 @@ async def run():
             for it in items:
                 await db.products.update_one(
                     {"_id": ObjectId(it["productId"]), **base},
-                    {"$inc": {"stock": -it["quantity"]}, "$set": {"updatedAt": now}}
+                    stock_inc_pipeline(-it["quantity"], {"updatedAt": now})
                 )
             if status != "paid" and cust.get("_id"):
                 await db.customers.update_one(
@@ -337,6 +342,13 @@ async def run():
         ])
         print("Inserted default settings for demo tenant")
 
+    # ملخصات يومية للوحة التحكم والتقارير
+    days = await rebuild_rollups(db, tenant_id)
+    print(f"Rebuilt {days} daily rollups")
+    # تكلفة البنود لتقرير الأرباح
+    costed = await backfill_line_costs(db, tenant_id)
+    print(f"Snapshot line costs on {costed} invoices")
+
     print("\nDone. Login with: tenant code = DEMO, username = demo, password = Demo@123")
     client.close()
 
@@ -26,6 +26,7 @@ from routes import (
     accounting,
     auth,
     product_units,
+    inventory_counts,
     tenants,
     auth_v2,
     subscriptions,
@@ -34,6 +35,7 @@ from routes import (
     audit,
     backup,
     support,
+    metrics,
 )
 
 ROOT_DIR = Path(__file__).parent
@@ -131,6 +133,7 @@ app.include_router(accounting.router)
 app.include_router(auth_v2.router)  # login first (same /api/auth prefix)
 app.include_router(auth.router)
 app.include_router(product_units.router)
+app.include_router(inventory_counts.router)
 app.include_router(tenants.router)
 app.include_router(subscriptions.router)
 app.include_router(licenses.router)
@@ -138,6 +141,7 @@ app.include_router(sync.router)
 app.include_router(audit.router)
 app.include_router(backup.router)
 app.include_router(support.router)
+app.include_router(metrics.router)
 
 # Include the basic api router
 app.include_router(api_router)
@@ -285,10 +289,6 @@ async def _do_seed_database():
         })
         logger.info("✅ Demo user created: DEMO / demo / Demo@123")
     
-    # Create indexes for tenants
-    await db.tenants.create_index("code", unique=True, sparse=True)
-    await db.tenants.create_index("email", unique=True, sparse=True)
-    
     # Check if products collection is empty
     product_count = await db.products.count_documents({})
     if product_count == 0:
@@ -382,6 +382,11 @@ async def _do_seed_database():
             }
         ]
         
+        from utils.search import product_search_keys
+        from utils.stock_state import stock_state_of
+        for product in initial_products:
+            product["searchKeys"] = product_search_keys(product)
+            product["stockState"] = stock_state_of(product)
         await db.products.insert_many(initial_products)
         logger.info(f"Seeded {len(initial_products)} products")
     
@@ -416,6 +421,31 @@ async def _do_seed_database():
         logger.info(f"Seeded {len(initial_settings)} settings")
 
 
+@app.on_event("startup")
+async def build_indexes():
+    """
+    Build the indexes declared in utils/indexes.py and log any drift.
+    Disable with INDEX_AUTO_BUILD=false and run scripts/ensure_indexes.py instead
+    (useful when building large indexes should happen outside a deploy).
+    """
+    from utils.indexes import ensure_indexes, index_drift
+
+    if os.environ.get("INDEX_AUTO_BUILD", "true").lower() in ("false", "0", "no"):
+        logger.info("Index build on startup: disabled (INDEX_AUTO_BUILD=false).")
+        return
+    try:
+        result = await ensure_indexes(db)
+        if result["created"]:
+            logger.info("Created %s index(es): %s", len(result["created"]), ", ".join(result["created"]))
+        drift = await index_drift(db)
+        if drift["missing"] or drift["mismatched"]:
+            logger.warning("Index drift - missing: %s, mismatched: %s", drift["missing"], drift["mismatched"])
+        if drift["undeclared"]:
+            logger.info("Undeclared indexes (not in utils/indexes.py): %s", drift["undeclared"])
+    except Exception as e:
+        logger.error("Index build failed (app will start anyway): %s", e, exc_info=True)
+
+
 @app.on_event("startup")
 async def schedule_subscription_checker():
     """
@@ -36,3 +36,30 @@ class TestRBAC:
 
     def test_admin_alias_matches_tenant_admin(self):
         assert ROLE_PERMISSIONS["admin"] == ROLE_PERMISSIONS["tenant_admin"]
+
+
+class TestAuthContext:
+    """Token claims are decoded once per request and shared by every dependency"""
+
+    def _request(self, authorization=None):
+        from starlette.requests import Request
+        headers = [(b"authorization", authorization.encode())] if authorization else []
+        return Request({"type": "http", "headers": headers})
+
+    def test_claims_decoded_once_and_cached_on_request_state(self, monkeypatch):
+        from utils import auth
+        from middleware.tenant import get_tenant_id
+        token = auth.create_access_token({"userId": "u1", "tenantId": "t1", "role": "cashier"})
+        request = self._request(f"Bearer {token}")
+        calls = []
+        real_decode = auth.jwt.decode
+        monkeypatch.setattr(auth.jwt, "decode", lambda *a, **k: calls.append(1) or real_decode(*a, **k))
+        assert auth.get_token_claims(request)["userId"] == "u1"
+        assert get_tenant_id(request) == "t1"
+        assert request.state.auth_claims["role"] == "cashier"
+        assert len(calls) == 1
+
+    def test_invalid_or_missing_token_gives_no_claims(self):
+        from utils import auth
+        assert auth.get_token_claims(self._request("Bearer not-a-jwt")) is None
+        assert auth.get_token_claims(self._request()) is None
@@ -0,0 +1,70 @@
+"""
+Unit tests for the in-process TTL/LRU cache and the permission cache
+"""
+from utils.cache import TTLCache
+from utils import auth
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hitRate"] == 0.5
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+        cache.set("a", 1)
+        clock.now = 4.9
+        assert cache.get("a") == 1
+        clock.now = 5.0
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_cached_none_is_distinguishable(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        marker = object()
+        cache.set("gone", None)
+        assert cache.get("gone", marker) is None
+
+    def test_delete_where(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set(("t1", "x"), 1)
+        cache.set(("t1", "y"), 2)
+        cache.set(("t2", "x"), 3)
+        assert cache.delete_where(lambda k: k[0] == "t1") == 2
+        assert cache.get(("t2", "x")) == 3
+
+
+class TestPermissionCache:
+    def test_invalidate_single_user_and_all(self):
+        auth._permission_cache.set("u1", {"pos": True})
+        auth._permission_cache.set("u2", {"pos": True})
+        auth.invalidate_user_permissions("u1")
+        assert auth._permission_cache.get("u1") is None
+        assert auth._permission_cache.get("u2") == {"pos": True}
+        auth.invalidate_user_permissions()
+        assert len(auth._permission_cache) == 0
@@ -0,0 +1,91 @@
+"""
+Unit tests for weighted average cost and invoice line cost snapshots (utils/costing.py)
+"""
+import asyncio
+from datetime import datetime, timezone
+from bson import ObjectId
+from models.purchase import PurchaseItemCreate
+from routes.purchases import purchase_stock_ops
+from utils.costing import carry_line_costs, received_avg_cost_expr, snapshot_line_costs, unit_cost_of
+
+
+class _Products:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    async def _iter(self, query):
+        ids = set(query["_id"]["$in"])
+        for doc in self.docs:
+            if doc["_id"] in ids and doc.get("tenantId") == query.get("tenantId"):
+                yield doc
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return self._iter(query)
+
+
+class _DB:
+    def __init__(self, products):
+        self.products = _Products(products)
+
+
+P1, P2 = ObjectId(), ObjectId()
+
+
+class TestLineCosts:
+    def test_unit_cost_prefers_average(self):
+        assert unit_cost_of({"avgCost": 5.5, "costPrice": 4}) == 5.5
+        assert unit_cost_of({"costPrice": 4}) == 4
+        assert unit_cost_of({}) == 0
+
+    def test_snapshot_uses_one_query_for_the_batch(self):
+        db = _DB([
+            {"_id": P1, "tenantId": "t1", "avgCost": 5.0, "costPrice": 4.0, "category": "Drinks"},
+            {"_id": P2, "tenantId": "t1", "costPrice": 2.0},
+        ])
+        invoices = [
+            {"items": [{"productId": str(P1), "quantity": 2, "total": 20}]},
+            {"items": [{"productId": str(P2), "quantity": 3, "total": 9}, {"productName": "Service", "quantity": 1}]},
+        ]
+        asyncio.run(snapshot_line_costs(db, "t1", invoices))
+        assert len(db.products.queries) == 1
+        assert invoices[0]["items"][0] == {
+            "productId": str(P1), "quantity": 2, "total": 20, "unitCost": 5.0, "category": "Drinks", "costTotal": 10.0,
+        }
+        assert invoices[1]["items"][0]["costTotal"] == 6.0
+        assert "unitCost" not in invoices[1]["items"][1]
+
+    def test_other_tenant_products_are_not_used(self):
+        db = _DB([{"_id": P1, "tenantId": "t2", "costPrice": 4.0}])
+        invoice = {"items": [{"productId": str(P1), "quantity": 1}]}
+        asyncio.run(snapshot_line_costs(db, "t1", [invoice]))
+        assert "unitCost" not in invoice["items"][0]
+
+    def test_edited_lines_keep_their_snapshot(self):
+        previous = [{"productId": "p1", "unitCost": 3.0, "category": "Food"}]
+        items = [{"productId": "p1", "quantity": 4}, {"productId": "p2", "quantity": 1}]
+        carry_line_costs(previous, items)
+        assert items[0]["unitCost"] == 3.0 and items[0]["category"] == "Food"
+        assert "unitCost" not in items[1]
+        db = _DB([])
+        asyncio.run(snapshot_line_costs(db, "t1", [{"items": items}]))
+        assert items[0]["costTotal"] == 12.0
+
+
+class TestAverageCost:
+    def test_receipt_moves_average_in_the_stock_update(self):
+        known = str(ObjectId())
+        items = [
+            PurchaseItemCreate(productId=known, sku="A", name="A", nameEn="A", quantity=2, unitCost=10.0),
+            PurchaseItemCreate(productId=known, sku="A", name="A", nameEn="A", quantity=3, unitCost=5.0),
+        ]
+        ops, _ = purchase_stock_ops(items, "t1", {}, datetime.now(timezone.utc))
+        first = ops[0]._doc[0]["$set"]
+        assert first["avgCost"] == received_avg_cost_expr(5, 35.0)
+        assert "stock" in first
+
+    def test_average_falls_back_to_receipt_cost(self):
+        expr = received_avg_cost_expr(4, 28.0)
+        assert expr["$cond"][2] == 7.0
+        assert expr["$cond"][1]["$divide"][0]["$add"][1] == 28.0
@@ -0,0 +1,85 @@
+"""
+Unit tests for atomic per-tenant number sequences (utils/counters.py)
+"""
+import asyncio
+from datetime import datetime, timezone
+from utils import counters
+
+
+class FakeCounters:
+    """Just enough of a Mongo collection for $inc / $max upserts keyed by _id."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        return self.docs.get(query["_id"])
+
+    def _apply(self, key, update):
+        doc = self.docs.setdefault(key, {"_id": key, "value": 0})
+        for field, value in update.get("$setOnInsert", {}).items():
+            doc.setdefault(field, value)
+        for field, value in update.get("$max", {}).items():
+            doc[field] = max(doc.get(field, value), value)
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        return doc
+
+    async def update_one(self, query, update, upsert=False):
+        self._apply(query["_id"], update)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        return dict(self._apply(query["_id"], update))
+
+
+class FakeDB:
+    def __init__(self):
+        self.counters = FakeCounters()
+
+
+class TestCounters:
+    def setup_method(self):
+        counters._initialized.clear()
+
+    def test_sequences_are_per_tenant(self):
+        db = FakeDB()
+
+        async def run():
+            a1 = await counters.next_value(db, "t1", counters.INVOICES)
+            a2 = await counters.next_value(db, "t1", counters.INVOICES)
+            b1 = await counters.next_value(db, "t2", counters.INVOICES)
+            return a1, a2, b1
+
+        assert asyncio.run(run()) == (1, 2, 1)
+
+    def test_block_reservation_is_contiguous(self):
+        db = FakeDB()
+
+        async def run():
+            await counters.next_value(db, "t1", counters.PURCHASES)
+            block = await counters.reserve(db, "t1", counters.PURCHASES, 50)
+            after = await counters.next_value(db, "t1", counters.PURCHASES)
+            return block, after
+
+        block, after = asyncio.run(run())
+        assert list(block) == list(range(2, 52))
+        assert after == 52
+
+    def test_baseline_continues_existing_numbering(self):
+        db = FakeDB()
+
+        async def baseline():
+            return 420
+
+        value = asyncio.run(counters.next_value(db, "t1", counters.INVOICES, baseline))
+        assert counters.format_invoice_number(value) == "INV-0421"
+
+    def test_number_formats(self):
+        when = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        assert counters.format_invoice_number(7) == "INV-0007"
+        assert counters.parse_invoice_number("INV-0007") == 7
+        assert counters.parse_invoice_number("INV-12345") == 12345
+        assert counters.parse_invoice_number("INV-007") is None
+        assert counters.parse_invoice_number("X-0007") is None
+        assert counters.format_purchase_number(7, when) == "PO-20260301-00007"
+        assert counters.format_entry_number(12, when) == "JE-20260301-00012"
@@ -0,0 +1,100 @@
+"""
+Unit tests for the dashboard statistics (routes/dashboard.py)
+"""
+import asyncio
+from datetime import datetime, timezone
+from routes.dashboard import dashboard_stats, inventory_overview_pipeline, sales_overview_pipeline
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class _Collection:
+    def __init__(self, docs=(), count=0):
+        self.docs = list(docs)
+        self.count = count
+        self.calls = 0
+
+    def aggregate(self, pipeline):
+        self.calls += 1
+        return _Cursor(self.docs)
+
+    def find(self, *args):
+        self.calls += 1
+        return _Cursor(self.docs)
+
+    async def count_documents(self, query):
+        self.calls += 1
+        return self.count
+
+
+class _DB:
+    def __init__(self, **collections):
+        for name in ("products", "daily_rollups", "invoices", "customers", "suppliers", "users", "warehouses"):
+            setattr(self, name, collections.get(name, _Collection()))
+
+
+NOW = datetime(2026, 3, 10, 15, 30, tzinfo=timezone.utc)
+TODAY = NOW.replace(hour=0, minute=0)
+
+
+class TestDashboardPipelines:
+    def test_sales_overview_is_one_facet(self):
+        pipeline = sales_overview_pipeline("t1", TODAY)
+        assert pipeline[0] == {"$match": {"tenantId": "t1"}}
+        assert set(pipeline[1]["$facet"]) == {"windows", "chart", "topProducts"}
+        assert pipeline[1]["$facet"]["windows"][0] == {"$match": {"day": {"$gte": "2026-02-08"}}}
+        assert pipeline[1]["$facet"]["chart"][0] == {"$match": {"day": {"$gte": "2026-03-04"}}}
+
+    def test_inventory_overview_is_one_facet(self):
+        pipeline = inventory_overview_pipeline(None)
+        assert pipeline[0] == {"$match": {}}
+        assert set(pipeline[1]["$facet"]) == {"totals", "lowStockItems"}
+
+
+class TestDashboardStats:
+    def test_empty_tenant(self):
+        stats = asyncio.run(dashboard_stats(_DB(), "t1", NOW))
+        assert stats["counts"]["products"] == 0
+        assert stats["sales"] == {"today": 0, "todayOrders": 0, "weekly": 0, "monthly": 0}
+        assert [d["date"] for d in stats["dailySales"]] == [f"2026-03-{d:02d}" for d in range(4, 11)]
+        assert stats["topProducts"] == []
+
+    def test_assembles_facets_and_counts(self):
+        db = _DB(
+            products=_Collection([{
+                "totals": [{"products": 12, "lowStock": 3, "outOfStock": 1, "totalValue": 50.0, "retailValue": 80.0}],
+                "lowStockItems": [{"_id": 7, "name": "A"}],
+            }]),
+            daily_rollups=_Collection([{
+                "windows": [{"todaySales": 10.0, "todayOrders": 1, "weekSales": 40.0, "monthSales": 90.0,
+                             "todayPurchases": 5.0, "weekPurchases": 15.0}],
+                "chart": [{"_id": "2026-03-10", "sales": 10.0, "orders": 1}],
+                "topProducts": [{"name": "A", "quantity": 2, "revenue": 10.0}],
+            }]),
+            invoices=_Collection([{"_id": 1}]),
+            customers=_Collection(count=4),
+        )
+        stats = asyncio.run(dashboard_stats(db, "t1", NOW))
+        assert stats["counts"]["products"] == 12
+        assert stats["counts"]["customers"] == 4
+        assert stats["inventory"]["lowStock"] == 3
+        assert stats["inventory"]["lowStockItems"] == [{"_id": "7", "name": "A"}]
+        assert stats["sales"]["monthly"] == 90.0
+        assert stats["purchases"] == {"today": 5.0, "weekly": 15.0}
+        assert stats["dailySales"][-1]["sales"] == 10.0
+        assert stats["dailySales"][0]["sales"] == 0
+        assert stats["recentInvoices"] == [{"_id": "1"}]
+        # one request per collection
+        assert db.products.calls == 1 and db.daily_rollups.calls == 1
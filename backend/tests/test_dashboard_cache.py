@@ -0,0 +1,112 @@
+"""
+Unit tests for the stale-while-revalidate dashboard cache (utils/dashboard_cache.py)
+"""
+import asyncio
+from utils.dashboard_cache import DashboardCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Counter:
+    """compute() stand-in returning 1, 2, 3... (optionally waiting on an event)."""
+
+    def __init__(self, gate=None):
+        self.calls = 0
+        self.gate = gate
+
+    async def __call__(self):
+        self.calls += 1
+        value = self.calls
+        if self.gate is not None:
+            await self.gate.wait()
+        return value
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestDashboardCache:
+    def test_fresh_entry_is_served_without_compute(self):
+        async def scenario():
+            cache = DashboardCache(ttl=10, stale=60, clock=FakeClock())
+            compute = Counter()
+            assert await cache.get("t1", "stats", compute) == 1
+            assert await cache.get("t1", "stats", compute) == 1
+            assert await cache.get("t2", "stats", compute) == 2
+            return cache.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["hits"] == 1 and stats["misses"] == 2
+
+    def test_expired_entry_is_served_stale_and_refreshed_in_background(self):
+        async def scenario():
+            clock = FakeClock()
+            cache = DashboardCache(ttl=10, stale=60, clock=clock)
+            compute = Counter()
+            await cache.get("t1", "stats", compute)
+            clock.now = 11
+            assert await cache.get("t1", "stats", compute) == 1
+            await _settle()
+            assert await cache.get("t1", "stats", compute) == 2
+            clock.now = 200  # past the stale window: the caller waits
+            assert await cache.get("t1", "stats", compute) == 3
+            return cache.stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["staleHits"] == 1 and stats["misses"] == 2
+
+    def test_invalidate_marks_tenant_and_all_tenant_view_stale(self):
+        async def scenario():
+            cache = DashboardCache(ttl=10, stale=60, clock=FakeClock())
+            for tenant in ("t1", "t2", None):
+                await cache.get(tenant, "stats", Counter())
+            cache.invalidate("t1")
+            return [cache.stats()["invalidations"], cache._versions]
+
+        invalidations, versions = asyncio.run(scenario())
+        assert invalidations == 2
+        assert set(versions) == {("t1", "stats"), (None, "stats")}
+
+    def test_write_during_compute_keeps_result_stale(self):
+        async def scenario():
+            cache = DashboardCache(ttl=10, stale=60, clock=FakeClock())
+            gate = asyncio.Event()
+            compute = Counter(gate)
+            first = asyncio.create_task(cache.get("t1", "stats", compute))
+            second = asyncio.create_task(cache.get("t1", "stats", compute))
+            await _settle()
+            cache.invalidate("t1")
+            gate.set()
+            results = await asyncio.gather(first, second)
+            # stored before the write finished: served stale once, then recomputed
+            assert await cache.get("t1", "stats", compute) == 1
+            await _settle()
+            return results, compute.calls
+
+        results, calls = asyncio.run(scenario())
+        assert results == [1, 1]
+        assert calls == 2
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        async def scenario():
+            clock = FakeClock()
+            cache = DashboardCache(ttl=10, stale=60, clock=clock)
+            await cache.get("t1", "alerts", Counter())
+
+            async def broken():
+                raise RuntimeError("mongo down")
+
+            clock.now = 11
+            assert await cache.get("t1", "alerts", broken) == 1
+            await _settle()
+            return await cache.get("t1", "alerts", broken)
+
+        assert asyncio.run(scenario()) == 1
@@ -0,0 +1,103 @@
+"""
+Unit tests for transaction retries (utils/database.py)
+"""
+import asyncio
+import pytest
+from pymongo.errors import OperationFailure
+from utils.database import run_in_transaction
+
+
+def _error(label):
+    return OperationFailure("WriteConflict", code=112, details={"errorLabels": [label]})
+
+
+class _Session:
+    def __init__(self, commit_errors=()):
+        self.in_transaction = False
+        self.commit_errors = list(commit_errors)
+        self.log = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def start_transaction(self):
+        self.in_transaction = True
+        self.log.append("start")
+
+    async def abort_transaction(self):
+        self.in_transaction = False
+        self.log.append("abort")
+
+    async def commit_transaction(self):
+        self.log.append("commit")
+        if self.commit_errors:
+            raise self.commit_errors.pop(0)
+        self.in_transaction = False
+
+
+class _Client:
+    def __init__(self, session):
+        self.session = session
+
+    async def start_session(self):
+        return self.session
+
+
+class _DB:
+    def __init__(self, session):
+        self.client = _Client(session)
+
+
+class TestRunInTransaction:
+    @pytest.fixture(autouse=True)
+    def _transactions(self, monkeypatch):
+        monkeypatch.setenv("MONGO_TRANSACTIONS", "true")
+
+    def test_transient_error_retries_the_whole_transaction(self):
+        session = _Session()
+        attempts = []
+
+        async def work(s):
+            attempts.append(s)
+            if len(attempts) == 1:
+                raise _error("TransientTransactionError")
+            return "ok"
+
+        assert asyncio.run(run_in_transaction(_DB(session), work)) == "ok"
+        assert len(attempts) == 2
+        assert session.log == ["start", "abort", "start", "commit"]
+
+    def test_unknown_commit_result_retries_only_the_commit(self):
+        session = _Session([_error("UnknownTransactionCommitResult")])
+        attempts = []
+
+        async def work(s):
+            attempts.append(s)
+            return "ok"
+
+        assert asyncio.run(run_in_transaction(_DB(session), work)) == "ok"
+        assert len(attempts) == 1
+        assert session.log == ["start", "commit", "commit"]
+
+    def test_other_errors_abort_and_propagate(self):
+        session = _Session()
+
+        async def work(s):
+            raise ValueError("bad item")
+
+        with pytest.raises(ValueError):
+            asyncio.run(run_in_transaction(_DB(session), work))
+        assert session.log == ["start", "abort"]
+
+    def test_without_transactions_work_runs_once_without_session(self, monkeypatch):
+        monkeypatch.setenv("MONGO_TRANSACTIONS", "false")
+        calls = []
+
+        async def work(s):
+            calls.append(s)
+
+        asyncio.run(run_in_transaction(_DB(_Session()), work))
+        assert calls == [None]
@@ -0,0 +1,68 @@
+"""
+Unit tests for the declarative index registry (utils/indexes.py)
+"""
+import asyncio
+from utils.indexes import INDEX_REGISTRY, ensure_indexes, index_drift, index_name
+
+
+class FakeCollection:
+    def __init__(self, info=None):
+        self.info = info or {"_id_": {"key": [("_id", 1)]}}
+
+    async def index_information(self):
+        return dict(self.info)
+
+    async def create_index(self, keys, name, **options):
+        self.info[name] = {"key": list(keys), **options}
+        return name
+
+
+class FakeDB(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+
+class TestIndexRegistry:
+    def test_index_name_matches_mongo_default(self):
+        assert index_name([("tenantId", 1), ("createdAt", -1)]) == "tenantId_1_createdAt_-1"
+
+    def test_tenant_collections_lead_with_tenant_id(self):
+        for collection in ("products", "invoices", "purchases", "product_units"):
+            for spec in INDEX_REGISTRY[collection]:
+                assert spec["keys"][0][0] == "tenantId"
+
+    def test_product_units_rfid_is_unique(self):
+        spec = next(s for s in INDEX_REGISTRY["product_units"] if s["keys"] == [("tenantId", 1), ("rfidTag", 1)])
+        assert spec.get("unique") is True
+
+    def test_invoice_numbers_are_unique_per_tenant(self):
+        spec = next(s for s in INDEX_REGISTRY["invoices"] if s["keys"] == [("tenantId", 1), ("invoiceNumber", 1)])
+        assert spec["unique"] is True
+        assert spec["partialFilterExpression"] == {"invoiceNumber": {"$type": "string"}}
+
+    def test_batch_client_refs_are_unique_per_tenant(self):
+        spec = next(s for s in INDEX_REGISTRY["invoices"] if s["keys"] == [("tenantId", 1), ("clientRef", 1)])
+        assert spec["unique"] is True
+        assert spec["partialFilterExpression"] == {"clientRef": {"$type": "string"}}
+
+    def test_ensure_then_no_drift(self):
+        db = FakeDB()
+        result = asyncio.run(ensure_indexes(db))
+        assert "invoices.tenantId_1_createdAt_-1" in result["created"]
+        assert result["failed"] == []
+        drift = asyncio.run(index_drift(db))
+        assert drift == {"missing": [], "mismatched": [], "undeclared": []}
+
+    def test_drift_reports_missing_mismatched_and_undeclared(self):
+        registry = {"product_units": [{"keys": [("tenantId", 1), ("rfidTag", 1)], "unique": True}]}
+        db = FakeDB()
+        db["product_units"] = FakeCollection({
+            "_id_": {"key": [("_id", 1)]},
+            "tenantId_1_rfidTag_1": {"key": [("tenantId", 1), ("rfidTag", 1)]},
+            "rfidTag_1": {"key": [("rfidTag", 1)]},
+        })
+        drift = asyncio.run(index_drift(db, registry))
+        assert drift["mismatched"] == ["product_units.tenantId_1_rfidTag_1"]
+        assert drift["undeclared"] == ["product_units.rfidTag_1"]
+        assert drift["missing"] == []
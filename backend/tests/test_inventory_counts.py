@@ -0,0 +1,173 @@
+"""
+Unit tests for inventory count reconciliation (routes/inventory_counts.py)
+"""
+import asyncio
+import pytest
+from bson import ObjectId
+from routes.inventory_counts import classify_scan, close_count, iter_missing, MATCHED, UNEXPECTED, WRONG_WAREHOUSE
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def __aiter__(self):
+        self._it = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        docs = self.docs
+        if "rfidTag" in query:
+            wanted = set(query["rfidTag"]["$in"])
+            docs = [d for d in docs if d["rfidTag"] in wanted]
+        return FakeCursor(docs)
+
+
+class FakeDB:
+    def __init__(self, units, scanned):
+        self.product_units = FakeCollection(units)
+        self.inventory_count_scans = FakeCollection([{"rfidTag": t} for t in scanned])
+
+
+class TestClassifyScan:
+    def test_results(self):
+        assert classify_scan(None, "w1") == UNEXPECTED
+        assert classify_scan({"status": "sold", "warehouseId": "w1"}, "w1") == UNEXPECTED
+        assert classify_scan({"status": "available", "warehouseId": "w2"}, "w1") == WRONG_WAREHOUSE
+        assert classify_scan({"status": "available", "warehouseId": None}, "w1") == WRONG_WAREHOUSE
+        assert classify_scan({"status": "available", "warehouseId": "w1"}, "w1") == MATCHED
+
+
+class TestIterMissing:
+    def test_missing_units_in_batches(self):
+        units = [{"_id": i, "rfidTag": f"T{i}", "productId": "p1"} for i in range(7)]
+        db = FakeDB(units, scanned=["T0", "T2", "T3", "T4", "T5"])
+        count = {"_id": "c1", "tenantId": "t1", "warehouseId": "w1"}
+
+        async def run():
+            return [[u["rfidTag"] for u in batch] async for batch in iter_missing(db, count, batch_size=3)]
+
+        assert asyncio.run(run()) == [["T1"], ["T6"]]
+        # One $in against the scans per batch of expected units
+        assert db.inventory_count_scans.queries == 3
+
+
+def _matches(doc, query):
+    for field, cond in query.items():
+        value = doc.get(field)
+        if isinstance(cond, dict) and "$in" in cond:
+            if value not in cond["$in"]:
+                return False
+        elif isinstance(cond, dict) and "$ne" in cond:
+            if value == cond["$ne"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class _Store:
+    """find / aggregate($match + $group count) / bulk_write / update_one over dicts in a list."""
+
+    def __init__(self, docs, fail_writes=0):
+        self.docs = docs
+        self.fail_writes = fail_writes
+        self.writes = []
+
+    def find(self, query, projection=None):
+        return FakeCursor([d for d in self.docs if _matches(d, query)])
+
+    async def count_documents(self, query):
+        return sum(1 for d in self.docs if _matches(d, query))
+
+    async def _groups(self, pipeline):
+        counts = {}
+        for doc in self.docs:
+            if _matches(doc, pipeline[0]["$match"]):
+                key = doc.get(pipeline[1]["$group"]["_id"][1:])
+                counts[key] = counts.get(key, 0) + 1
+        for key, n in counts.items():
+            yield {"_id": key, "count": n}
+
+    def aggregate(self, pipeline, session=None):
+        return self._groups(pipeline)
+
+    async def bulk_write(self, ops, ordered=True, session=None):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise RuntimeError("connection reset")
+        for op in ops:
+            for doc in self.docs:
+                if _matches(doc, op._filter):
+                    self.writes.append((doc["_id"], op._doc))
+                    if isinstance(op._doc, dict):
+                        doc.update(op._doc["$set"])
+                    else:  # pipeline update: only the $literal values of the first $set
+                        doc.update({k: v["$literal"] for k, v in op._doc[0]["$set"].items() if "$literal" in v})
+
+
+class _Counts:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one_and_update(self, query, pipeline, return_document=None):
+        if self.doc["status"] not in query["status"]["$in"]:
+            return None
+        self.doc["status"] = "closing"
+        self.doc.setdefault("closeApply", pipeline[0]["$set"]["closeApply"]["$ifNull"][1])
+        return dict(self.doc)
+
+    async def update_one(self, query, update, session=None):
+        if _matches(self.doc, query):
+            self.doc.update(update.get("$set", {}))
+            for field in update.get("$unset", {}):
+                self.doc.pop(field, None)
+
+
+class TestCloseCount:
+    def test_failed_close_without_transactions_is_finished_once(self, monkeypatch):
+        monkeypatch.setenv("MONGO_TRANSACTIONS", "false")
+        pid = str(ObjectId())
+        count = {"_id": ObjectId(), "tenantId": "t1", "warehouseId": "w1", "status": "open"}
+        db = type("DB", (), {})()
+        db.inventory_counts = _Counts(dict(count))
+        db.product_units = _Store([
+            {"_id": i, "tenantId": "t1", "rfidTag": f"T{i}", "productId": pid, "warehouseId": "w1", "status": "available"}
+            for i in range(4)
+        ])
+        db.inventory_count_scans = _Store([{"sessionId": str(count["_id"]), "rfidTag": "T0", "result": MATCHED}])
+        db.products = _Store([{"_id": ObjectId(pid), "tenantId": "t1"}], fail_writes=1)
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(close_count(db, count, apply=True))
+        assert db.inventory_counts.doc["status"] == "failed"
+        assert db.inventory_counts.doc["summary"]["missing"] == 3
+
+        # The retry keeps apply=True and lowers stock from the units marked by the first attempt
+        closed = asyncio.run(close_count(db, count, apply=False))
+        assert closed["status"] == "closed" and closed["applied"] is True
+        assert closed["adjustments"]["markedMissing"] == 3
+        assert closed["summary"]["expected"] == 4
+        assert len(db.products.writes) == 1
+        assert "closeError" not in db.inventory_counts.doc
+
+        # A product already lowered by this session is not lowered again
+        db.inventory_counts.doc["status"] = "failed"
+        asyncio.run(close_count(db, count, apply=True))
+        assert len(db.products.writes) == 1
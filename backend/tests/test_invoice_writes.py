@@ -0,0 +1,123 @@
+"""
+Unit tests for invoice write batching (routes/invoices.py)
+"""
+import asyncio
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from routes.invoices import (
+    DUPLICATE_CLIENT_REF, DUPLICATE_NUMBER, NUMBER_NOT_RESERVED, _duplicate_key, check_client_numbers,
+    customer_charge_ops, invoices_by_client_ref, stock_decrement_ops,
+)
+from utils.stock_state import stock_inc_pipeline
+
+
+class TestStockDecrementOps:
+    def test_repeated_products_are_summed_into_one_update(self):
+        pid = str(ObjectId())
+        other = str(ObjectId())
+        items = [
+            {"productId": pid, "quantity": 2},
+            {"productId": other, "quantity": 1},
+            {"productId": pid, "quantity": 3},
+        ]
+        ops = stock_decrement_ops(items, "t1")
+        assert len(ops) == 2
+        first = ops[0]._doc
+        assert ops[0]._filter == {"_id": ObjectId(pid), "tenantId": "t1"}
+        assert first == stock_inc_pipeline(-5)
+
+    def test_lines_without_valid_product_are_skipped(self):
+        items = [{"productId": None, "quantity": 1}, {"productId": "local_123", "quantity": 1}]
+        assert stock_decrement_ops(items, None) == []
+
+
+class TestCustomerChargeOps:
+    def test_unpaid_invoices_are_summed_per_customer(self):
+        cid = str(ObjectId())
+        invoices = [
+            {"customerId": cid, "total": 10.0, "status": "unpaid"},
+            {"customerId": cid, "total": 5.0, "status": "paid"},
+            {"customerId": cid, "total": 2.5, "status": "partial"},
+            {"customerId": None, "total": 99.0, "status": "unpaid"},
+        ]
+        ops = customer_charge_ops(invoices, "t1")
+        assert len(ops) == 1
+        assert ops[0]._filter == {"_id": ObjectId(cid), "tenantId": "t1"}
+        assert ops[0]._doc == {"$inc": {"balance": -12.5}}
+
+
+class _Counters:
+    def __init__(self, value):
+        self.value = value
+
+    async def find_one(self, query, projection=None):
+        return {"_id": query["_id"], "value": self.value} if self.value else None
+
+
+class _Invoices:
+    def __init__(self, numbers, docs=()):
+        self.numbers = numbers
+        self.docs = list(docs)
+        self.queries = []
+
+    async def _iter(self, query):
+        if "clientRef" in query:
+            for doc in self.docs:
+                if doc["clientRef"] in query["clientRef"]["$in"] and doc["tenantId"] == query.get("tenantId"):
+                    yield doc
+            return
+        for number in self.numbers:
+            if number in query["invoiceNumber"]["$in"]:
+                yield {"invoiceNumber": number}
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return self._iter(query)
+
+
+class _NumbersDB:
+    def __init__(self, issued, used=()):
+        self.counters = _Counters(issued)
+        self.invoices = _Invoices(list(used))
+
+
+class TestClientNumbers:
+    def test_only_reserved_unused_numbers_are_accepted(self):
+        db = _NumbersDB(issued=10, used=["INV-0003"])
+        invoices = [
+            {"invoiceNumber": "INV-0004"},
+            {"invoiceNumber": "INV-0003"},  # already stored
+            {"invoiceNumber": "INV-0004"},  # twice in the batch
+            {"invoiceNumber": "INV-0011"},  # beyond what the counter handed out
+            {"invoiceNumber": "INV-04"},    # not the canonical form of 4
+            {"invoiceNumber": None},        # numbered by the server
+        ]
+        errors = asyncio.run(check_client_numbers(db, "t1", invoices))
+        assert errors == {
+            1: DUPLICATE_NUMBER, 2: DUPLICATE_NUMBER, 3: NUMBER_NOT_RESERVED, 4: NUMBER_NOT_RESERVED,
+        }
+
+    def test_tenant_without_reservations_rejects_client_numbers(self):
+        errors = asyncio.run(check_client_numbers(_NumbersDB(issued=0), "t1", [{"invoiceNumber": "INV-0001"}]))
+        assert errors == {0: NUMBER_NOT_RESERVED}
+
+
+class TestClientRefs:
+    def test_stored_invoices_are_found_by_client_ref(self):
+        db = _NumbersDB(issued=0)
+        db.invoices = _Invoices([], [
+            {"_id": 1, "tenantId": "t1", "clientRef": "pos-1", "invoiceNumber": "INV-0001"},
+            {"_id": 2, "tenantId": "t2", "clientRef": "pos-2", "invoiceNumber": "INV-0001"},
+        ])
+        found = asyncio.run(invoices_by_client_ref(db, "t1", ["pos-1", "pos-2", None, "pos-1"]))
+        assert list(found) == ["pos-1"]
+        assert len(db.invoices.queries) == 1
+        assert asyncio.run(invoices_by_client_ref(db, "t1", [None])) == {}
+
+    def test_duplicate_key_errors_become_conflicts(self):
+        def error(*messages):
+            return BulkWriteError({"writeErrors": [{"index": i, "code": 11000, "errmsg": m} for i, m in enumerate(messages)]})
+
+        assert _duplicate_key(error("E11000 index: tenantId_1_clientRef_1")) == DUPLICATE_CLIENT_REF
+        assert _duplicate_key(error("E11000 index: tenantId_1_invoiceNumber_1")) == DUPLICATE_NUMBER
+        assert _duplicate_key(BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "invalid"}]})) is None
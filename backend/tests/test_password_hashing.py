@@ -0,0 +1,77 @@
+"""
+Unit tests for the bounded password hashing pool
+"""
+import asyncio
+import hashlib
+import threading
+import pytest
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+from utils.password_hashing import (
+    HashingPool, hash_password, password_hash_update, stored_password_of, verify_password, verify_stored_password,
+    get_hashing_stats,
+)
+
+
+class TestPasswordHashing:
+    def test_hash_and_verify_roundtrip(self):
+        async def run():
+            hashed = await hash_password("Secret@123")
+            return hashed, await verify_password("Secret@123", hashed), await verify_password("wrong", hashed)
+
+        hashed, ok, bad = asyncio.run(run())
+        assert hashed.startswith("$2b$")
+        assert ok is True
+        assert bad is False
+        assert get_hashing_stats()["completed"] >= 3
+
+    def test_malformed_hash_is_rejected_not_raised(self):
+        assert asyncio.run(verify_password("x", "not-a-hash")) is False
+
+    def test_legacy_hashes_are_accepted_and_flagged_for_rehash(self):
+        sha256 = hashlib.sha256(b"Secret@123").hexdigest()
+        bcrypt_2y = bcrypt.using(ident="2y", rounds=4).hash("Secret@123")
+        assert bcrypt_2y.startswith("$2y$")
+
+        async def run():
+            return [
+                await verify_stored_password("Secret@123", sha256),
+                await verify_stored_password("wrong", sha256),
+                await verify_stored_password("Secret@123", bcrypt_2y),
+                await verify_stored_password("wrong", bcrypt_2y),
+                await verify_stored_password("Secret@123", await hash_password("Secret@123")),
+                await verify_stored_password("Secret@123", None),
+            ]
+
+        assert asyncio.run(run()) == [
+            (True, True), (False, False), (True, True), (False, False), (True, False), (False, False),
+        ]
+
+    def test_password_fields_are_read_in_login_order_and_replaced_together(self):
+        assert stored_password_of({"hashedPassword": "old", "passwordHash": "new"}) == "new"
+        assert stored_password_of({"passwordHash": "", "hashed_password": "oldest"}) == "oldest"
+        assert stored_password_of({}) is None
+        assert password_hash_update("$2b$x") == {
+            "$set": {"passwordHash": "$2b$x"},
+            "$unset": {"hashedPassword": "", "hashed_password": ""},
+        }
+
+    def test_pool_rejects_when_full(self):
+        pool = HashingPool(workers=1, max_pending=1)
+        release = threading.Event()
+
+        async def run():
+            first = asyncio.ensure_future(pool.run(release.wait))
+            await asyncio.sleep(0.05)
+            with pytest.raises(HTTPException) as exc:
+                await pool.run(lambda: None)
+            assert exc.value.status_code == 503
+            assert pool.stats()["running"] == 1
+            release.set()
+            await first
+
+        asyncio.run(run())
+        stats = pool.stats()
+        assert stats["rejected"] == 1
+        assert stats["completed"] == 1
+        assert stats["queueDepth"] == 0
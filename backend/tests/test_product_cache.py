@@ -0,0 +1,63 @@
+"""
+Unit tests for the per-tenant product lookup cache (utils/product_cache.py)
+"""
+from utils.product_cache import ProductLookupCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _product(pid, barcode, sku="S"):
+    return {"_id": pid, "barcode": barcode, "sku": sku, "stock": 5}
+
+
+class TestProductLookupCache:
+    def test_hit_returns_copy_and_counts(self):
+        cache = ProductLookupCache(maxsize=10)
+        cache.put("t1", "barcode", "111", _product("p1", "111"))
+        first = cache.get("t1", "barcode", "111")
+        first["stock"] = 0
+        assert cache.get("t1", "barcode", "111")["stock"] == 5
+        assert cache.get("t2", "barcode", "111") is None
+        stats = cache.stats()
+        assert stats["hits"] == 2 and stats["misses"] == 1
+
+    def test_invalidate_product_drops_all_its_keys(self):
+        cache = ProductLookupCache(maxsize=10)
+        doc = _product("p1", "111", sku="A")
+        cache.put("t1", "barcode", "111", doc)
+        cache.put("t1", "sku", "A", doc)
+        cache.put("t1", "barcode", "222", _product("p2", "222"))
+        assert cache.invalidate_products("t1", ["p1"]) == 2
+        assert cache.get("t1", "sku", "A") is None
+        assert cache.get("t1", "barcode", "222") is not None
+
+    def test_invalidate_without_tenant_checks_every_tenant(self):
+        cache = ProductLookupCache(maxsize=10)
+        cache.put("t1", "barcode", "111", _product("p1", "111"))
+        cache.put("t2", "barcode", "111", _product("p9", "111"))
+        assert cache.invalidate_products(None, ["p1"]) == 1
+        assert cache.get("t2", "barcode", "111") is not None
+
+    def test_lru_and_tenant_bounds(self):
+        cache = ProductLookupCache(maxsize=2, max_tenants=2)
+        for code in ("1", "2", "3"):
+            cache.put("t1", "barcode", code, _product("p" + code, code))
+        assert cache.get("t1", "barcode", "1") is None
+        cache.put("t2", "barcode", "1", _product("x", "1"))
+        cache.put("t3", "barcode", "1", _product("y", "1"))
+        assert cache.stats()["tenants"] == 2
+        assert cache.get("t1", "barcode", "3") is None
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = ProductLookupCache(maxsize=10, ttl=5, clock=clock)
+        cache.put("t1", "rfidTag", "R1", _product("p1", None))
+        clock.now = 6
+        assert cache.get("t1", "rfidTag", "R1") is None
+        assert cache.stats()["size"] == 0
@@ -0,0 +1,46 @@
+"""
+Unit tests for CSV/XLSX product import (utils/product_import.py)
+"""
+from datetime import datetime, timezone
+from utils.product_import import read_chunks, upsert_ops, validate_rows
+
+
+def _row(sku, **extra):
+    return {"name": sku, "nameEn": sku, "sku": sku, "category": "c", "categoryEn": "c",
+            "costPrice": "1", "salePrice": "2", **extra}
+
+
+class TestReadChunks:
+    def test_csv_headers_are_matched_and_empty_cells_dropped(self, tmp_path):
+        path = tmp_path / "p.csv"
+        path.write_text("Name,SKU,stock,unknown\nA,S1,,x\nB,S2,4,\nC,S3,5,\n", encoding="utf-8")
+        chunks = list(read_chunks(str(path), "csv", chunk=2))
+        assert [len(c) for c in chunks] == [2, 1]
+        assert chunks[0][0] == {"name": "A", "sku": "S1"}
+        assert chunks[0][1] == {"name": "B", "sku": "S2", "stock": "4"}
+
+
+class TestValidateRows:
+    def test_errors_carry_spreadsheet_row_numbers(self):
+        valid, errors = validate_rows([_row("A"), _row("B", costPrice="x"), {}, _row("C")], first_row=2)
+        assert list(valid) == ["A", "C"]
+        assert errors == [{"row": 3, "sku": "B", "message": "costPrice: Input should be a valid number, unable to parse string as a number"}]
+
+    def test_only_given_columns_are_kept_and_last_duplicate_wins(self):
+        valid, _ = validate_rows([_row("A", stock="1"), _row("A", salePrice="5")], first_row=2)
+        assert valid["A"]["salePrice"] == 5.0
+        assert "stock" not in valid["A"]
+
+
+class TestUpsertOps:
+    def test_upsert_by_sku_sets_row_and_defaults_only_on_insert(self):
+        now = datetime.now(timezone.utc)
+        valid, _ = validate_rows([_row("A")], first_row=2)
+        [op] = upsert_ops("t1", valid, {"A": {"barcode": "BC9"}}, now)
+        assert op._filter == {"tenantId": "t1", "sku": "A"}
+        assert op._upsert is True
+        fields = op._doc[0]["$set"]
+        assert fields["salePrice"] == {"$literal": 2.0}
+        assert fields["stock"] == {"$ifNull": ["$stock", {"$literal": 0}]}
+        assert "#bc9" in fields["searchKeys"]["$literal"]
+        assert "stockState" in op._doc[-1]["$set"]
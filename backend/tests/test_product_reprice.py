@@ -0,0 +1,134 @@
+"""
+Unit tests for bulk price changes (routes/products.py)
+"""
+import asyncio
+from bson import ObjectId
+from models.product import ProductBulkPrice
+from routes import products as products_routes
+from routes.products import new_price_expr, reprice_products, reprice_query
+
+
+class _Purchases:
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        self.calls = []
+
+    async def distinct(self, field, query):
+        self.calls.append((field, query))
+        return self.product_ids
+
+
+class _DB:
+    def __init__(self, product_ids=()):
+        self.purchases = _Purchases(list(product_ids))
+
+
+class TestNewPriceExpr:
+    def test_rules(self):
+        assert new_price_expr("percent", 10, 2) == {"$max": [0, {"$round": [{"$multiply": [{"$ifNull": ["$salePrice", 0]}, 1.1]}, 2]}]}
+        assert new_price_expr("fixed", -5, 0)["$max"][1] == {"$round": [{"$add": [{"$ifNull": ["$salePrice", 0]}, -5]}, 0]}
+        assert new_price_expr("margin", 25, 2)["$max"][1]["$round"][0] == {"$multiply": ["$costPrice", 1.25]}
+
+
+class TestRepriceQuery:
+    def test_filters_are_combined(self):
+        pid = ObjectId()
+        db = _DB([str(pid), None, "local_1"])
+        payload = ProductBulkPrice(rule="margin", value=20, categories=["phones"], skus=["A"], supplierId="s1")
+        query = asyncio.run(reprice_query(db, "t1", payload))
+        assert query == {
+            "tenantId": "t1",
+            "$or": [{"category": {"$in": ["phones"]}}, {"categoryEn": {"$in": ["phones"]}}],
+            "sku": {"$in": ["A"]},
+            "_id": {"$in": [pid]},
+            "costPrice": {"$gt": 0},
+            "$expr": {"$ne": ["$salePrice", new_price_expr("margin", 20, 2)]},
+        }
+        assert db.purchases.calls == [("items.productId", {"tenantId": "t1", "supplierId": "s1"})]
+
+
+def _evaluate(expr, doc):
+    """The aggregation operators new_price_expr uses, evaluated against a product dict."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:])
+    if not isinstance(expr, dict):
+        return expr
+    (op, args), = expr.items()
+    if op == "$literal":
+        return args
+    values = [_evaluate(arg, doc) for arg in args]
+    if op == "$ifNull":
+        return values[0] if values[0] is not None else values[1]
+    if op == "$multiply":
+        return values[0] * values[1]
+    if op == "$add":
+        return values[0] + values[1]
+    if op == "$round":
+        return round(values[0], values[1])
+    if op == "$max":
+        return max(values)
+    if op == "$ne":
+        return values[0] != values[1]
+    raise NotImplementedError(op)
+
+
+class _UpdateResult:
+    def __init__(self, count):
+        self.matched_count = self.modified_count = count
+
+
+class _Products:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _matches(self, doc, query):
+        for field, cond in query.items():
+            if field == "$expr":
+                ok = _evaluate(cond, doc)
+            elif isinstance(cond, dict) and "$gt" in cond:
+                ok = (doc.get(field) or 0) > cond["$gt"]
+            else:
+                ok = doc.get(field) == cond
+            if not ok:
+                return False
+        return True
+
+    async def update_many(self, query, pipeline):
+        matched = [doc for doc in self.docs if self._matches(doc, query)]
+        for doc in matched:
+            doc.update({field: _evaluate(expr, doc) for field, expr in pipeline[0]["$set"].items()})
+        return _UpdateResult(len(matched))
+
+    async def _iter(self, query):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                yield doc
+
+    def find(self, query, projection=None):
+        return self._iter(query)
+
+
+class TestRepriceProducts:
+    def test_products_already_at_the_new_price_are_not_touched_or_queued(self, monkeypatch):
+        queued = []
+
+        async def enqueue(db, tenant_id, product_ids, device_ids, batch):
+            queued.append((sorted(product_ids), sorted(device_ids)))
+            return len(device_ids)
+
+        monkeypatch.setattr(products_routes, "enqueue_device_refresh", enqueue)
+        changed, unchanged = ObjectId(), ObjectId()
+        db = _DB()
+        db.products = _Products([
+            {"_id": changed, "tenantId": "t1", "costPrice": 8.0, "salePrice": 9.0, "eslDeviceId": "esl-1"},
+            {"_id": unchanged, "tenantId": "t1", "costPrice": 8.0, "salePrice": 10.0,
+             "previousSalePrice": 12.0, "eslDeviceId": "esl-2"},
+        ])
+        payload = ProductBulkPrice(rule="margin", value=25, decimals=2)
+        result = asyncio.run(reprice_products(db, "t1", payload))
+
+        assert result["modified"] == 1
+        assert queued == [([str(changed)], ["esl-1"])]
+        first, second = db.products.docs
+        assert first["salePrice"] == 10.0 and first["previousSalePrice"] == 9.0
+        assert second["previousSalePrice"] == 12.0 and "priceBatch" not in second
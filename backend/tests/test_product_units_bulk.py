@@ -0,0 +1,109 @@
+"""
+Unit tests for bulk RFID unit registration (routes/product_units.py)
+"""
+import asyncio
+from pymongo.errors import BulkWriteError
+from routes import product_units
+from bson import ObjectId
+from routes.product_units import _stream_tags, insert_units, register_tags
+
+
+class FakeRequest:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class FakeUnits:
+    """insert_many that rejects tags already present, like the (tenantId, rfidTag) unique index."""
+
+    def __init__(self, taken):
+        self.taken = set(taken)
+        self.calls = 0
+
+    async def insert_many(self, docs, ordered=True, session=None):
+        self.calls += 1
+        errors = [{"index": i, "code": 11000, "errmsg": "E11000"} for i, d in enumerate(docs) if d["rfidTag"] in self.taken]
+        self.taken.update(d["rfidTag"] for d in docs)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def _found(self, tags):
+        for tag in tags:
+            if tag in self.taken:
+                yield {"rfidTag": tag}
+
+    def find(self, query, projection=None, session=None):
+        return self._found(query["rfidTag"]["$in"])
+
+
+class FakeProducts:
+    def __init__(self):
+        self.updates = []
+
+    async def update_one(self, query, update):
+        self.updates.append(update)
+
+
+class FakeDB:
+    def __init__(self, taken=()):
+        self.product_units = FakeUnits(taken)
+        self.products = FakeProducts()
+
+
+async def _collect(request, csv_body):
+    return [tag async for tag in _stream_tags(request, csv_body)]
+
+
+class TestStreamTags:
+    def test_ndjson_lines_split_across_chunks(self):
+        request = FakeRequest([b'"A"\n{"rfid', b'Tag": "B"}\nnot json\n"C"'])
+        assert asyncio.run(_collect(request, csv_body=False)) == ["A", "B", None, "C"]
+
+    def test_ndjson_non_string_tags_are_invalid(self):
+        request = FakeRequest([b'null\n123\ntrue\n{"rfidTag": 123}\n{"rfidTag": true}\n{"rfidTag": null}\n{"rfidTag": "D"}\n'])
+        assert asyncio.run(_collect(request, csv_body=False)) == [None, None, None, None, None, None, "D"]
+
+    def test_csv_with_header_uses_tag_column(self):
+        request = FakeRequest([b"sku,rfidTag\nx,T1\n", b"y,T2\n"])
+        assert asyncio.run(_collect(request, csv_body=True)) == ["T1", "T2"]
+
+    def test_csv_without_header_uses_first_column(self):
+        request = FakeRequest([b"T1\nT2,extra\n"])
+        assert asyncio.run(_collect(request, csv_body=True)) == ["T1", "T2"]
+
+
+class TestRegisterTags:
+    def test_non_string_tags_count_as_invalid(self):
+        async def tags():
+            for tag in [None, "A", 123, True, " ", "A"]:
+                yield tag
+
+        db = FakeDB()
+        result = asyncio.run(register_tags(db, "t1", str(ObjectId()), None, tags(), keep_units=False))
+        assert result["created"] == 1
+        assert result["invalid"] == 4
+        assert result["skippedTags"] == ["A"]
+
+
+class TestInsertUnits:
+    def test_duplicate_key_errors_become_skipped_tags(self, monkeypatch):
+        monkeypatch.setattr(product_units, "UNIT_INSERT_CHUNK", 2)
+        db = FakeDB(taken={"B"})
+        units = [{"rfidTag": tag} for tag in ["A", "B", "C", "D", "E"]]
+        skipped = asyncio.run(insert_units(db, units))
+        assert skipped == ["B"]
+        assert db.product_units.calls == 3
+
+
+class TestStockDelta:
+    def test_only_sold_and_missing_leave_stock(self):
+        from routes.product_units import stock_delta
+        assert stock_delta("available", "sold") == -1
+        assert stock_delta("reserved", "sold") == -1
+        assert stock_delta("sold", "available") == 1
+        assert stock_delta("available", "damaged") == 0
+        assert stock_delta("reserved", "available") == 0
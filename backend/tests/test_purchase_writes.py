@@ -0,0 +1,48 @@
+"""
+Unit tests for purchase receipt batching (routes/purchases.py)
+"""
+from datetime import datetime, timezone
+import pytest
+from bson import ObjectId
+from bson.errors import InvalidId
+from models.purchase import PurchaseItemCreate
+from routes.purchases import invalid_product_ids, purchase_stock_ops
+
+
+def _item(sku, quantity, product_id=None):
+    return PurchaseItemCreate(productId=product_id, sku=sku, name=sku, nameEn=sku, quantity=quantity, unitCost=10.0)
+
+
+class TestPurchaseStockOps:
+    def test_known_and_new_products_in_one_batch(self):
+        known = str(ObjectId())
+        now = datetime.now(timezone.utc)
+        items = [_item("A", 2), _item("NEW", 3), _item("NEW", 1), _item("A", 5, product_id=known)]
+        ops, keys = purchase_stock_ops(items, "t1", {"A": known}, now)
+
+        assert keys == ["NEW", None]
+        upsert, update = ops
+        assert upsert._filter == {"tenantId": "t1", "sku": "NEW"}
+        assert upsert._upsert is True
+        upsert_set = upsert._doc[0]["$set"]
+        assert upsert_set["stock"] == {"$add": [{"$ifNull": ["$stock", 0]}, 4]}
+        assert upsert_set["salePrice"] == {"$ifNull": ["$salePrice", {"$literal": 12.0}]}
+        assert "stockState" in upsert._doc[-1]["$set"]
+        assert update._filter == {"_id": ObjectId(known), "tenantId": "t1"}
+        assert update._doc[0]["$set"]["stock"] == {"$add": [{"$ifNull": ["$stock", 0]}, 7]}
+
+    def test_invalid_product_id_is_not_silently_dropped(self):
+        now = datetime.now(timezone.utc)
+        with pytest.raises(InvalidId):
+            purchase_stock_ops([_item("A", 2, product_id="not-an-id")], "t1", {}, now)
+
+
+class TestInvalidProductIds:
+    def test_lists_each_invalid_id_once(self):
+        known = str(ObjectId())
+        items = [_item("A", 1, product_id="bad"), _item("B", 1, product_id=known),
+                 _item("C", 1), _item("D", 1, product_id="bad")]
+        assert invalid_product_ids(items) == ["bad"]
+
+    def test_valid_and_sku_only_lines_pass(self):
+        assert invalid_product_ids([_item("A", 1, product_id=str(ObjectId())), _item("B", 1)]) == []
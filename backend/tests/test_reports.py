@@ -0,0 +1,201 @@
+"""
+Unit tests for aggregation-based reports (routes/reports.py)
+"""
+import asyncio
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+from bson import ObjectId
+import pytest
+from fastapi import HTTPException
+from routes.reports import (
+    customers_report_pipeline, inventory_report_pipeline, inventory_section, profit_report, profit_report_pipeline, month_starts,
+    monthly_sales_pipeline, sales_report, sales_report_pipeline, tenant_timezone, utc_day_bounds,
+)
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class _FindCursor(_Cursor):
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+
+class _Collection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.pipelines = []
+        self.queries = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return _Cursor(self.docs)
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return _FindCursor(self.docs)
+
+
+class _Tenants:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one(self, query, projection=None):
+        return next((d for d in self.docs if d["_id"] == query["_id"]), None)
+
+
+class _DB:
+    def __init__(self, **collections):
+        for name, docs in collections.items():
+            setattr(self, name, _Collection(docs))
+
+
+END = datetime(2026, 1, 31, tzinfo=timezone.utc)
+START = END - timedelta(days=30)
+
+
+class TestSalesReport:
+    def test_match_uses_tenant_and_period(self):
+        pipeline = sales_report_pipeline("t1", START, END)
+        assert pipeline[0] == {"$match": {"tenantId": "t1", "createdAt": {"$gte": START, "$lte": END}}}
+        assert set(pipeline[1]["$facet"]) == {"summary", "topProducts", "dailyBreakdown", "invoices"}
+
+    def test_empty_period(self):
+        db = _DB(invoices=[{"summary": [], "topProducts": [], "dailyBreakdown": [], "invoices": []}])
+        report = asyncio.run(sales_report(db, "t1", START, END))
+        assert report["summary"]["totalOrders"] == 0
+        assert report["summary"]["averageOrderValue"] == 0
+
+    def test_summary_and_latest_invoices_oldest_first(self):
+        facet = {
+            "summary": [{"_id": None, "totalSales": 90.0, "totalOrders": 3, "totalItems": 5, "paidOrders": 2, "unpaidOrders": 1}],
+            "topProducts": [{"name": "A", "quantity": 3, "revenue": 60.0}],
+            "dailyBreakdown": [{"date": "2026-01-30", "sales": 90.0, "orders": 3}],
+            "invoices": [{"_id": 3}, {"_id": 2}, {"_id": 1}],
+        }
+        report = asyncio.run(sales_report(_DB(invoices=[facet]), "t1", START, END))
+        assert report["summary"]["averageOrderValue"] == 30.0
+        assert [inv["_id"] for inv in report["invoices"]] == ["1", "2", "3"]
+        assert report["topProducts"] == facet["topProducts"]
+
+
+TENANT_ID = ObjectId()
+
+
+class TestAnalytics:
+    def test_month_starts_are_local_midnights(self):
+        # 2026-01-31 22:30 UTC is already February in Riyadh (UTC+3)
+        now = datetime(2026, 1, 31, 22, 30, tzinfo=timezone.utc)
+        starts = month_starts(now, ZoneInfo("Asia/Riyadh"), 13)
+        assert len(starts) == 14
+        assert starts[-2].strftime("%Y-%m") == "2026-02"
+        assert starts[0].strftime("%Y-%m") == "2025-02"
+        assert starts[-1].astimezone(timezone.utc) == datetime(2026, 2, 28, 21, tzinfo=timezone.utc)
+
+    def test_one_group_in_tenant_timezone(self):
+        pipeline = monthly_sales_pipeline("t1", START, END, "Asia/Riyadh")
+        assert pipeline[0] == {"$match": {"tenantId": "t1", "createdAt": {"$gte": START, "$lt": END}}}
+        assert pipeline[1]["$group"]["_id"]["$dateToString"]["timezone"] == "Asia/Riyadh"
+        assert len(pipeline) == 2
+
+    def test_tenant_timezone_falls_back_to_utc(self):
+        db = _DB()
+        db.tenants = _Tenants([
+            {"_id": TENANT_ID, "settings": {"timezone": "Asia/Damascus"}},
+        ])
+        assert asyncio.run(tenant_timezone(db, str(TENANT_ID))) == "Asia/Damascus"
+        assert asyncio.run(tenant_timezone(db, None)) == "UTC"
+        assert asyncio.run(tenant_timezone(db, str(ObjectId()))) == "UTC"
+        db.tenants.docs[0]["settings"]["timezone"] = "Mars/Olympus"
+        assert asyncio.run(tenant_timezone(db, str(TENANT_ID))) == "UTC"
+
+
+class TestInventoryReport:
+    def test_summary_is_one_facet_without_product_lists(self):
+        pipeline = inventory_report_pipeline("t1")
+        assert pipeline[0] == {"$match": {"tenantId": "t1"}}
+        assert set(pipeline[1]["$facet"]) == {"summary", "categories"}
+
+    def test_section_pages_follow_the_cursor(self):
+        ids = [ObjectId() for _ in range(3)]
+        db = _DB(products=[{"_id": i, "stockState": "low"} for i in ids])
+        page = asyncio.run(inventory_section(db, "t1", "low", None, 2))
+        assert [p["_id"] for p in page["items"]] == [str(ids[0]), str(ids[1])]
+        assert page["nextCursor"] == str(ids[1])
+        assert db.products.queries[0] == {"tenantId": "t1", "stockState": "low"}
+
+        page = asyncio.run(inventory_section(db, "t1", "all", page["nextCursor"], 5))
+        assert page["nextCursor"] is None
+        assert db.products.queries[1] == {"tenantId": "t1", "_id": {"$gt": ids[1]}}
+
+    def test_invalid_cursor(self):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(inventory_section(_DB(products=[]), "t1", "out", "nope", 10))
+        assert exc.value.status_code == 400
+
+
+class TestCustomersReport:
+    def test_ranks_before_joining_customers(self):
+        pipeline = customers_report_pipeline("t1", START, END, 20)
+        stages = [next(iter(stage)) for stage in pipeline]
+        assert stages[:4] == ["$match", "$group", "$sort", "$limit"]
+        assert stages.index("$lookup") > stages.index("$limit")
+        assert pipeline[3] == {"$limit": 20}
+        assert set(pipeline[-1]["$project"]["rfm"]) == {"recencyDays", "frequency", "monetary"}
+
+    def test_sort_keys_and_tenant_filter(self):
+        pipeline = customers_report_pipeline("t1", START, END, 5, "recent")
+        assert pipeline[2] == {"$sort": {"lastOrderAt": -1, "_id": 1}}
+        assert any("$filter" in str(stage) for stage in pipeline)
+        # super admin: no tenant restriction on the customer lookup
+        assert not any("$filter" in str(stage) for stage in customers_report_pipeline(None, START, END, 5))
+
+
+class TestProfitReport:
+    def test_one_pass_over_invoice_lines(self):
+        pipeline = profit_report_pipeline("t1", START, END, 10, [])
+        assert pipeline[0] == {"$match": {"tenantId": "t1", "createdAt": {"$gte": START, "$lte": END}}}
+        assert pipeline[1] == {"$unwind": "$items"}
+        assert set(pipeline[2]["$facet"]) == {"summary", "byProduct"}
+        assert {"$limit": 10} in pipeline[2]["$facet"]["byProduct"]
+
+    def test_optional_breakdowns(self):
+        facet = profit_report_pipeline("t1", START, END, 10, ["category", "day"], "Asia/Riyadh")[2]["$facet"]
+        assert set(facet) == {"summary", "byProduct", "byCategory", "byDay"}
+        assert facet["byDay"][0]["$group"]["_id"]["$dateToString"]["timezone"] == "Asia/Riyadh"
+
+    def test_product_names_come_from_products_after_the_limit(self):
+        stages = profit_report_pipeline("t1", START, END, 10, [])[2]["$facet"]["byProduct"]
+        names = [next(iter(stage)) for stage in stages]
+        assert names.index("$lookup") > names.index("$limit")
+        assert stages[0]["$group"]["lineName"] == {"$max": "$items.productName"}
+        assert stages[-1]["$project"]["name"] == {"$ifNull": [{"$arrayElemAt": ["$product.name", 0]}, "$lineName"]}
+
+    def test_period_is_snapped_to_the_rollup_days(self):
+        start, end = utc_day_bounds(
+            datetime(2026, 3, 1, 14, 30, tzinfo=timezone.utc),
+            datetime(2026, 3, 5, 2, 0, tzinfo=timezone(timedelta(hours=3))),  # 4 March 23:00 UTC
+        )
+        assert start == datetime(2026, 3, 1, tzinfo=timezone.utc)
+        assert end == datetime(2026, 3, 4, 23, 59, 59, 999000, tzinfo=timezone.utc)
+
+    def test_sales_and_expenses_cover_the_same_days(self):
+        invoices = _Collection([{"summary": [{"revenue": 100.0, "cost": 60.0}]}])
+        rollups = _Collection([{"expenses_total": 15.0, "purchases_total": 40.0}])
+        db = type("DB", (), {"invoices": invoices, "daily_rollups": rollups})()
+        report = asyncio.run(profit_report(db, "t1", datetime(2026, 3, 1, 14, 30), datetime(2026, 3, 4, 9, 0)))
+        match = invoices.pipelines[0][0]["$match"]["createdAt"]
+        assert match == {"$gte": datetime(2026, 3, 1, tzinfo=timezone.utc),
+                         "$lte": datetime(2026, 3, 4, 23, 59, 59, 999000, tzinfo=timezone.utc)}
+        assert rollups.pipelines[0][0]["$match"]["day"] == {"$gte": "2026-03-01", "$lte": "2026-03-04"}
+        assert report["period"]["start"] == "2026-03-01T00:00:00+00:00"
+        assert report["netProfit"] == 25.0
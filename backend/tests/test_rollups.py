@@ -0,0 +1,53 @@
+"""
+Unit tests for daily rollups (utils/rollups.py)
+"""
+from datetime import datetime, timezone, timedelta
+from utils.rollups import collect, day_key, rollup_ops
+
+NOW = datetime(2026, 3, 1, 23, 30, tzinfo=timezone.utc)
+
+
+def _invoice(total, status="paid", created=NOW, **extra):
+    return {"tenantId": "t1", "createdAt": created, "status": status, "total": total,
+            "items": [{"productId": "p1", "productName": "A", "quantity": 2, "total": total}], **extra}
+
+
+class TestDayKey:
+    def test_utc_day_of_aware_naive_and_iso_values(self):
+        plus3 = timezone(timedelta(hours=3))
+        assert day_key(datetime(2026, 3, 2, 1, 0, tzinfo=plus3)) == "2026-03-01"
+        assert day_key(datetime(2026, 3, 2, 1, 0)) == "2026-03-02"
+        assert day_key("2026-03-02T10:00:00Z") == "2026-03-02"
+        assert day_key("not a date") is None
+        assert day_key(None) is None
+
+
+class TestCollect:
+    def test_invoices_are_summed_per_tenant_day(self):
+        acc = collect({}, "invoices", [_invoice(10), _invoice(5, "unpaid"), _invoice(1, created=NOW + timedelta(hours=1))])
+        day = acc[("t1", "2026-03-01")]["inc"]
+        assert day["sales.revenue"] == 15
+        assert day["sales.orders"] == 2
+        assert day["sales.paidRevenue"] == 10
+        assert day["sales.unpaidOrders"] == 1
+        assert day["products.p1.quantity"] == 4
+        assert acc[("t1", "2026-03-02")]["inc"]["sales.revenue"] == 1
+
+    def test_update_moves_contribution_between_statuses(self):
+        acc = {}
+        collect(acc, "invoices", [_invoice(10, "unpaid")], -1)
+        collect(acc, "invoices", [_invoice(10, "paid")], 1)
+        [op] = rollup_ops(acc, NOW)
+        assert op._filter == {"tenantId": "t1", "day": "2026-03-01"}
+        assert op._upsert is True
+        assert op._doc["$inc"] == {"sales.paidRevenue": 10, "sales.paidOrders": 1, "sales.unpaidOrders": -1}
+
+    def test_expense_categories_are_safe_field_names(self):
+        acc = collect({}, "expenses", [{"tenantId": "t1", "date": NOW, "amount": 7, "category": "$util.ities"}])
+        assert acc[("t1", "2026-03-01")]["inc"]["expenses.byCategory.util_ities"] == 7
+
+    def test_unchanged_documents_write_nothing(self):
+        acc = {}
+        collect(acc, "purchases", [{"tenantId": "t1", "createdAt": NOW, "total": 9}], -1)
+        collect(acc, "purchases", [{"tenantId": "t1", "createdAt": NOW, "total": 9}], 1)
+        assert rollup_ops(acc, NOW) == []
@@ -0,0 +1,69 @@
+"""
+Unit tests for Arabic/English product search keys (utils/search.py)
+"""
+import asyncio
+from routes.products import SEARCH_CANDIDATES, search_products
+from utils.search import normalize_text, product_search_keys, query_tokens, query_code, query_trigrams
+
+
+class TestNormalize:
+    def test_arabic_diacritics_and_letter_variants_fold(self):
+        assert normalize_text("إِسْمَاعِيل") == normalize_text("اسماعيل")
+        assert normalize_text("مستشفى") == normalize_text("مستشفي")
+        assert normalize_text("مدرسة") == normalize_text("مدرسه")
+        assert normalize_text("آلة") == normalize_text("الة")
+        assert normalize_text("كـــتاب") == "كتاب"
+
+    def test_case_digits_and_separators(self):
+        assert normalize_text("ABC-١٢٣_x") == "abc 123 x"
+        assert normalize_text(None) == ""
+
+
+class TestProductSearchKeys:
+    def test_prefixes_words_codes_and_trigrams(self):
+        keys = set(product_search_keys({"name": "لابتوب", "nameEn": "Dell", "sku": "DL-15", "category": None}))
+        assert {"ل", "لاب", "لابتوب", "=لابتوب", "d", "del", "=dell"} <= keys
+        assert {"#dl15", "dl1", "=15"} <= keys
+        assert "~ابت" in keys
+
+    def test_query_matches_stored_keys(self):
+        keys = set(product_search_keys({"name": "مُسْتَشْفَى الأمل", "sku": "HK-1"}))
+        assert set(query_tokens("مستشفي امل")) <= keys
+        assert query_code("hk 1") in keys
+        assert set(query_trigrams("مستشفا")) & keys
+
+
+class _Cursor:
+    async def to_list(self, length):
+        return []
+
+
+class _Products:
+    def __init__(self):
+        self.pipelines = []
+
+    async def find_one(self, query, projection=None):
+        return None
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return _Cursor()
+
+
+class _DB:
+    def __init__(self):
+        self.products = _Products()
+
+
+class TestSearchProducts:
+    def test_fuzzy_threshold_is_applied_before_the_candidate_cap(self):
+        db = _DB()
+        result = asyncio.run(search_products(db, "t1", "مستشفا", 0, 20))
+
+        assert result["fuzzy"] is True
+        (pipeline,) = db.products.pipelines
+        match, cap = pipeline[0]["$match"], pipeline[1]["$limit"]
+        grams = query_trigrams("مستشفا")
+        assert match["searchKeys"] == {"$in": grams}
+        assert match["$expr"]["$gte"][1] == max(1, len(grams) // 2)
+        assert cap == SEARCH_CANDIDATES
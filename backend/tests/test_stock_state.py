@@ -0,0 +1,42 @@
+"""
+Unit tests for the maintained product stock state (utils/stock_state.py)
+"""
+from datetime import datetime, timezone
+from utils.stock_state import (
+    LOW, OK, OUT, set_with_state_pipeline, stock_inc_pipeline, stock_state, stock_state_of,
+    stock_upsert_pipeline,
+)
+
+
+class TestStockState:
+    def test_thresholds(self):
+        assert stock_state(0, 10) == OUT
+        assert stock_state(-3, 10) == OUT
+        assert stock_state(10, 10) == LOW
+        assert stock_state(11, 10) == OK
+
+    def test_missing_fields_use_defaults(self):
+        assert stock_state_of({}) == OUT
+        assert stock_state_of({"stock": 5}) == LOW
+        assert stock_state_of({"stock": 5, "reorderLevel": 0}) == OK
+
+
+class TestPipelines:
+    def test_increment_recomputes_state_after_stock(self):
+        now = datetime.now(timezone.utc)
+        pipeline = stock_inc_pipeline(-2, {"updatedAt": now})
+        assert pipeline[0]["$set"] == {
+            "stock": {"$add": [{"$ifNull": ["$stock", 0]}, -2]},
+            "updatedAt": {"$literal": now},
+        }
+        assert list(pipeline[1]["$set"]) == ["stockState"]
+
+    def test_upsert_keeps_existing_insert_fields(self):
+        pipeline = stock_upsert_pipeline(3, {"updatedAt": 1}, {"name": "$not-a-field"})
+        assert pipeline[0]["$set"]["name"] == {"$ifNull": ["$name", {"$literal": "$not-a-field"}]}
+        assert pipeline[0]["$set"]["updatedAt"] == {"$literal": 1}
+
+    def test_set_fields_are_literal(self):
+        pipeline = set_with_state_pipeline({"reorderLevel": 4, "notes": "$x"})
+        assert pipeline[0]["$set"] == {"reorderLevel": {"$literal": 4}, "notes": {"$literal": "$x"}}
+        assert "stockState" in pipeline[1]["$set"]
@@ -5,28 +5,35 @@ import os
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from utils.cache import TTLCache
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (request handlers should await utils.password_hashing instead)
+from utils.password_hashing import pwd_context
 
-# JWT Settings
-SECRET_KEY = os.environ.get("SECRET_KEY", "super-secret-key-change-in-production")
+# JWT Settings - single source for every module that signs or decodes tokens
+SECRET_KEY = os.environ.get("SECRET_KEY", "super-secret-key-change-in-production-123")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
 security = HTTPBearer()
 
+# Permission cache: userId -> permissions dict (None = user not found).
+# Invalidated by routes/users.py on update/delete; TTL bounds staleness across workers.
+PERMISSION_CACHE_TTL_SECONDS = float(os.environ.get("PERMISSION_CACHE_TTL_SECONDS", "60"))
+PERMISSION_CACHE_SIZE = int(os.environ.get("PERMISSION_CACHE_SIZE", "10000"))
+_NOT_CACHED = object()
+_permission_cache = TTLCache(maxsize=PERMISSION_CACHE_SIZE, ttl=PERMISSION_CACHE_TTL_SECONDS)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
+    """Verify a password against its hash (blocking - for scripts; routes use password_hashing.verify_password)"""
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """Hash a password"""
+    """Hash a password (blocking - for scripts; routes use password_hashing.hash_password)"""
     return pwd_context.hash(password)
 
 
@@ -55,10 +62,37 @@ def decode_token(token: str) -> dict:
         )
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+def get_token_claims(request: Request) -> Optional[dict]:
+    """
+    Decoded JWT claims for this request, or None if there is no valid bearer token.
+    The token is decoded once per request and cached on request.state.auth_claims,
+    so get_current_user, require_permission and get_tenant_id share one decode.
+    """
+    claims = getattr(request.state, "auth_claims", _NOT_CACHED)
+    if claims is not _NOT_CACHED:
+        return claims
+    claims = None
+    authorization = request.headers.get("authorization") or ""
+    scheme, _, token = authorization.partition(" ")
+    token = token.strip() if scheme.lower() == "bearer" else authorization.strip()
+    if token:
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            claims = None
+    request.state.auth_claims = claims
+    return claims
+
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Get current user from JWT token"""
-    token = credentials.credentials
-    payload = decode_token(token)
+    payload = get_token_claims(request)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return payload
 
 
@@ -95,20 +129,70 @@ def require_super_admin(current_user: dict = Depends(get_current_user)) -> dict:
     return current_user
 
 
+async def get_user_permissions(user_id: str) -> Optional[dict]:
+    """Permissions of a user, served from the in-process cache. Returns None if the user does not exist."""
+    cached = _permission_cache.get(user_id, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+    from server import db
+    from bson import ObjectId
+    user_doc = await db.users.find_one({"_id": ObjectId(user_id)}, {"permissions": 1})
+    perms = (user_doc.get("permissions") or {}) if user_doc else None
+    _permission_cache.set(user_id, perms)
+    return perms
+
+
+def invalidate_user_permissions(user_id: Optional[str] = None) -> None:
+    """Drop cached permissions for one user, or for everyone when user_id is None."""
+    if user_id is None:
+        _permission_cache.clear()
+    else:
+        _permission_cache.delete(str(user_id))
+
+
+def get_permission_cache_stats() -> dict:
+    """Hit/miss counters of the permission cache (exposed via /api/metrics)."""
+    return _permission_cache.stats()
+
+
+async def get_auth_context(request: Request, current_user: dict = Depends(get_current_user)) -> dict:
+    """
+    Caller identity for routers: userId, username, role, tenantId and permissions.
+    Built once per request and cached on request.state.auth_context.
+    permissions is None for super_admin (all allowed) or when the user no longer exists.
+    """
+    context = getattr(request.state, "auth_context", None)
+    if context is not None:
+        return context
+    from bson import ObjectId
+    user_id = current_user.get("userId")
+    permissions = None
+    if current_user.get("role") != "super_admin" and user_id and ObjectId.is_valid(user_id):
+        permissions = await get_user_permissions(user_id)
+    context = {
+        "userId": user_id,
+        "username": current_user.get("username"),
+        "role": current_user.get("role"),
+        "tenantId": current_user.get("tenantId"),
+        "permissions": permissions,
+    }
+    request.state.auth_context = context
+    return context
+
+
 def require_permission(permission: str):
-    """Dependency to require a specific permission (RBAC). Loads user from DB to get permissions."""
-    async def permission_checker(current_user: dict = Depends(get_current_user)):
-        if current_user.get("role") == "super_admin":
+    """Dependency to require a specific permission (RBAC). Permissions are cached per userId."""
+    async def permission_checker(
+        current_user: dict = Depends(get_current_user),
+        context: dict = Depends(get_auth_context),
+    ):
+        if context["role"] == "super_admin":
             return current_user
-        from server import db
-        from bson import ObjectId
-        user_id = current_user.get("userId")
-        if not user_id:
+        if not context["userId"]:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
-        user_doc = await db.users.find_one({"_id": ObjectId(user_id)})
-        if not user_doc:
+        perms = context["permissions"]
+        if perms is None:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User not found")
-        perms = user_doc.get("permissions") or {}
         if not perms.get(permission):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
         return current_user
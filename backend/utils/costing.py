@@ -0,0 +1,124 @@
+"""
+Cost of goods sold - weighted average cost on products and cost snapshots on invoice lines.
+
+Every purchase receipt moves a product's `avgCost` to the weighted average of the stock
+on hand (at its previous average, or costPrice when none was recorded yet) and the
+received quantity at the purchase unit cost. The update runs in the same pipeline
+as the stock increment, so it sees the stock before the receipt.
+
+When an invoice is written each line gets:
+
+    unitCost   avgCost of the product at sale time (costPrice when it has no average)
+    costTotal  unitCost x quantity
+    category   the product category, so reports keep the category the item was sold under
+
+Lines whose product is unknown (free-text lines, deleted products) carry no cost and
+are reported as uncosted by the profit report. backfill_line_costs() snapshots invoices
+written before this existed at the products' current cost (an approximation).
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+BACKFILL_BATCH = 500
+
+
+def received_avg_cost_expr(quantity: float, amount: float) -> dict:
+    """
+    avgCost after receiving `quantity` units costing `amount` in total; evaluated against
+    the stored product (negative stock counts as none on hand).
+    """
+    unit_cost = amount / quantity if quantity else 0
+    on_hand = {"$max": [{"$ifNull": ["$stock", 0]}, 0]}
+    previous = {"$ifNull": ["$avgCost", {"$ifNull": ["$costPrice", unit_cost]}]}
+    units = {"$add": [on_hand, quantity]}
+    return {"$cond": [
+        {"$gt": [units, 0]},
+        {"$divide": [{"$add": [{"$multiply": [on_hand, previous]}, amount]}, units]},
+        unit_cost,
+    ]}
+
+
+def unit_cost_of(product: Dict[str, Any]) -> float:
+    for field in ("avgCost", "costPrice"):
+        value = product.get(field)
+        if isinstance(value, (int, float)):
+            return value
+    return 0
+
+
+def _number(value: Any) -> float:
+    return value if isinstance(value, (int, float)) else 0
+
+
+def carry_line_costs(previous_items: Iterable[dict], items: Iterable[dict]) -> None:
+    """Edited invoice lines keep the cost snapshot of the original line of the same product."""
+    snapshots = {
+        item['productId']: item for item in previous_items
+        if item.get('productId') and 'unitCost' in item
+    }
+    for item in items:
+        previous = snapshots.get(item.get('productId'))
+        if previous is not None and 'unitCost' not in item:
+            item['unitCost'] = previous['unitCost']
+            item.setdefault('category', previous.get('category'))
+
+
+async def snapshot_line_costs(db, tenant_id: Optional[str], invoices: Iterable[dict]) -> None:
+    """
+    Set unitCost / costTotal / category on the lines of invoice dicts in place, with one
+    product query for the whole batch. Lines that already carry a unitCost keep it.
+    """
+    invoices = list(invoices)
+    lines: List[dict] = [item for inv in invoices for item in inv.get('items') or []]
+    ids = {
+        item['productId'] for item in lines
+        if 'unitCost' not in item and item.get('productId') and ObjectId.is_valid(item['productId'])
+    }
+    products: Dict[str, dict] = {}
+    if ids:
+        query = {"_id": {"$in": [ObjectId(pid) for pid in ids]}}
+        if tenant_id:
+            query["tenantId"] = tenant_id
+        projection = {"avgCost": 1, "costPrice": 1, "category": 1}
+        async for product in db.products.find(query, projection):
+            products[str(product["_id"])] = product
+    for item in lines:
+        if 'unitCost' not in item:
+            product = products.get(item.get('productId'))
+            if product is None:
+                continue
+            item['unitCost'] = unit_cost_of(product)
+            item.setdefault('category', product.get('category'))
+        item['costTotal'] = _number(item['unitCost']) * _number(item.get('quantity'))
+
+
+async def backfill_line_costs(db, tenant_id: Optional[str] = None) -> int:
+    """Snapshot line costs on invoices that have product lines without one. Returns invoices updated."""
+    query = {"items": {"$elemMatch": {"productId": {"$nin": [None, ""]}, "unitCost": {"$exists": False}}}}
+    if tenant_id:
+        query["tenantId"] = tenant_id
+    updated = 0
+    batch: List[dict] = []
+
+    async def flush():
+        by_tenant: Dict[Optional[str], List[dict]] = {}
+        for inv in batch:
+            by_tenant.setdefault(inv.get("tenantId"), []).append(inv)
+        for tenant, invoices in by_tenant.items():
+            await snapshot_line_costs(db, tenant, invoices)
+        await db.invoices.bulk_write(
+            [UpdateOne({"_id": inv["_id"]}, {"$set": {"items": inv["items"]}}) for inv in batch], ordered=False
+        )
+
+    async for invoice in db.invoices.find(query, {"tenantId": 1, "items": 1}):
+        batch.append(invoice)
+        if len(batch) >= BACKFILL_BATCH:
+            await flush()
+            updated += len(batch)
+            batch = []
+    if batch:
+        await flush()
+        updated += len(batch)
+    return updated
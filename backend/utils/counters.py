@@ -0,0 +1,123 @@
+"""
+Counters - atomic per-tenant number sequences (invoice, purchase and journal entry numbers).
+
+One document per (tenant, sequence) in the `counters` collection, advanced with
+find_one_and_update($inc) so concurrent terminals never get the same number.
+A block of numbers can be reserved in one call (offline POS terminals, batch imports).
+"""
+import re
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+INVOICES = "invoices"
+PURCHASES = "purchases"
+JOURNAL_ENTRIES = "journal_entries"
+
+# Keys whose counter document is known to exist (skips the baseline check)
+_initialized: Set[str] = set()
+
+
+def counter_key(tenant_id: Optional[str], name: str) -> str:
+    return f"{tenant_id or 'global'}:{name}"
+
+
+async def _ensure_counter(db, key: str, tenant_id: Optional[str], name: str,
+                          baseline: Optional[Callable[[], Awaitable[int]]]) -> None:
+    """
+    Create the counter on first use, starting from baseline() so numbers issued
+    before counters existed (e.g. INV-0001..INV-0420 from count_documents) are not reused.
+    $max keeps this idempotent when several workers initialize at the same time.
+    """
+    if key in _initialized:
+        return
+    if baseline is not None and not await db.counters.find_one({"_id": key}, {"_id": 1}):
+        start = await baseline()
+        try:
+            await db.counters.update_one(
+                {"_id": key},
+                {"$max": {"value": int(start)}, "$setOnInsert": {"tenantId": tenant_id, "name": name}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass  # another worker created it first
+    _initialized.add(key)
+
+
+async def reserve(db, tenant_id: Optional[str], name: str, count: int = 1,
+                  baseline: Optional[Callable[[], Awaitable[int]]] = None) -> range:
+    """Atomically reserve `count` consecutive numbers. Returns range(first, last + 1)."""
+    if count < 1:
+        raise ValueError("count must be >= 1")
+    key = counter_key(tenant_id, name)
+    await _ensure_counter(db, key, tenant_id, name, baseline)
+    for attempt in range(2):
+        try:
+            doc = await db.counters.find_one_and_update(
+                {"_id": key},
+                {
+                    "$inc": {"value": count},
+                    "$set": {"updatedAt": datetime.now(timezone.utc)},
+                    "$setOnInsert": {"tenantId": tenant_id, "name": name},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            break
+        except DuplicateKeyError:
+            # Concurrent upsert of a brand-new counter; the retry hits the existing document
+            if attempt:
+                raise
+    last = doc["value"]
+    return range(last - count + 1, last + 1)
+
+
+async def next_value(db, tenant_id: Optional[str], name: str,
+                     baseline: Optional[Callable[[], Awaitable[int]]] = None) -> int:
+    """Atomically take the next number of a sequence."""
+    return (await reserve(db, tenant_id, name, 1, baseline))[0]
+
+
+async def issued_value(db, tenant_id: Optional[str], name: str) -> int:
+    """Last number a sequence has handed out (0 when it was never used)."""
+    doc = await db.counters.find_one({"_id": counter_key(tenant_id, name)}, {"value": 1})
+    return doc["value"] if doc else 0
+
+
+async def current_values(db, tenant_id: Optional[str]) -> Dict[str, int]:
+    """Last issued value of every sequence of a tenant."""
+    cursor = db.counters.find({"tenantId": tenant_id}, {"name": 1, "value": 1})
+    return {doc["name"]: doc["value"] async for doc in cursor}
+
+
+# ----- number formats -----
+
+def invoice_baseline(db, tenant_id: Optional[str]) -> Callable[[], Awaitable[int]]:
+    """Old numbering was count_documents + 1, so existing tenants continue after their count."""
+    async def baseline() -> int:
+        return await db.invoices.count_documents({"tenantId": tenant_id} if tenant_id else {})
+    return baseline
+
+
+def format_invoice_number(value: int) -> str:
+    return f"INV-{str(value).zfill(4)}"
+
+
+def parse_invoice_number(number: Optional[str]) -> Optional[int]:
+    """Sequence value of an invoice number in the exact format_invoice_number form, else None."""
+    match = re.fullmatch(r"INV-(\d+)", number or "")
+    if not match:
+        return None
+    value = int(match.group(1))
+    return value if value > 0 and format_invoice_number(value) == number else None
+
+
+def format_purchase_number(value: int, when: Optional[datetime] = None) -> str:
+    # 5-digit sequence so it can never equal an old random PO-YYYYMMDD-XXXX number
+    return f"PO-{(when or datetime.now(timezone.utc)).strftime('%Y%m%d')}-{str(value).zfill(5)}"
+
+
+def format_entry_number(value: int, when: Optional[datetime] = None) -> str:
+    return f"JE-{(when or datetime.now(timezone.utc)).strftime('%Y%m%d')}-{str(value).zfill(5)}"
@@ -0,0 +1,162 @@
+"""
+Dashboard cache - per-tenant responses of /api/dashboard/stats and /alerts.
+
+Entries are fresh for DASHBOARD_CACHE_TTL_SECONDS. After that, and after any write
+that changes the numbers (invoices, purchases, products, units, counts, sync uploads
+call invalidate_dashboard), they are stale: for DASHBOARD_CACHE_STALE_SECONDS more
+the stale response is returned at once while one background task recomputes it
+(stale-while-revalidate), so a dashboard refresh only waits on Mongo when nothing
+usable is cached. Concurrent misses of the same key share one computation.
+
+Each uvicorn worker holds its own copy; counts of customers, suppliers, users and
+warehouses are not invalidated and follow the TTL.
+
+DASHBOARD_CACHE_TTL_SECONDS    fresh lifetime (default 15)
+DASHBOARD_CACHE_STALE_SECONDS  how long a stale entry may still be served (default 120)
+DASHBOARD_CACHE_SIZE           cached responses (default 1000)
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_CACHE_TTL_SECONDS = float(os.environ.get("DASHBOARD_CACHE_TTL_SECONDS", "15"))
+DASHBOARD_CACHE_STALE_SECONDS = float(os.environ.get("DASHBOARD_CACHE_STALE_SECONDS", "120"))
+DASHBOARD_CACHE_SIZE = int(os.environ.get("DASHBOARD_CACHE_SIZE", "1000"))
+
+Key = Tuple[Optional[str], str]
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until", "version")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float, version: int):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.version = version
+
+
+class DashboardCache:
+    """Stale-while-revalidate cache keyed by (tenantId, name) with hit/stale/miss counters."""
+
+    def __init__(self, ttl: float = 15.0, stale: float = 120.0, maxsize: int = 1000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.stale = stale
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        # Bumped by every invalidation, so a computation that started before a write
+        # is stored as already stale
+        self._versions: Dict[Key, int] = {}
+        self._tasks: Dict[Key, asyncio.Task] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, tenant_id: Optional[str], name: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached value of compute() for this tenant; recomputed when missing, expired or stale."""
+        key = (tenant_id, name)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.stale_until <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry.fresh_until > now and entry.version == self._versions.get(key, 0):
+                    self.hits += 1
+                    return entry.value
+                self.stale_hits += 1
+            else:
+                self.misses += 1
+        task = self._refresh(key, compute)
+        if entry is not None:
+            return entry.value
+        return await asyncio.shield(task)
+
+    def _refresh(self, key: Key, compute: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """The running computation of key, or a new one (one per key at a time)."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.create_task(self._compute(key, compute))
+            # A failed background refresh is logged in _compute; the stale entry stays
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def _compute(self, key: Key, compute: Callable[[], Awaitable[Any]]) -> Any:
+        version = self._versions.get(key, 0)
+        try:
+            value = await compute()
+        except Exception:
+            logger.exception("Dashboard refresh of %s failed", key)
+            raise
+        finally:
+            self._tasks.pop(key, None)
+        now = self._clock()
+        with self._lock:
+            self._entries[key] = _Entry(value, now + self.ttl, now + self.ttl + self.stale, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self._versions.pop(evicted, None)
+        return value
+
+    def invalidate(self, tenant_id: Optional[str]) -> None:
+        """
+        Mark a tenant's entries stale (and the super admin's all-tenant view with them).
+        tenant_id None (super admin writes) marks everything.
+        """
+        with self._lock:
+            keys = set(self._entries) | set(self._tasks)
+            for key in keys:
+                if tenant_id is None or key[0] in (tenant_id, None):
+                    self._versions[key] = self._versions.get(key, 0) + 1
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttlSeconds": self.ttl,
+            "staleSeconds": self.stale,
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "refreshing": len(self._tasks),
+            "hitRate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache = DashboardCache(DASHBOARD_CACHE_TTL_SECONDS, DASHBOARD_CACHE_STALE_SECONDS, DASHBOARD_CACHE_SIZE)
+
+
+async def cached_dashboard(tenant_id: Optional[str], name: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Dashboard response `name` ("stats" / "alerts") of a tenant, computed by compute() when needed."""
+    return await _cache.get(tenant_id, name, compute)
+
+
+def invalidate_dashboard(tenant_id: Optional[str] = None) -> None:
+    """Call after writes that change dashboard numbers (sales, purchases, stock, prices)."""
+    _cache.invalidate(tenant_id)
+
+
+def get_dashboard_cache_stats() -> Dict[str, Any]:
+    """Hit rate and size of the dashboard cache (exposed via /api/metrics)."""
+    return _cache.stats()
@@ -1,8 +1,11 @@
 """
 Database Utilities
 """
+import os
+import time
 from bson import ObjectId
-from typing import Any, Dict
+from pymongo.errors import PyMongoError
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 
 def serialize_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
@@ -44,3 +47,70 @@ def generate_tenant_code(name: str) -> str:
     suffix = ''.join(random.choices(string.digits, k=4))
     
     return f"{prefix}{suffix}"
+
+
+# MONGO_TRANSACTIONS: "auto" (default) detects a replica set / mongos, "true" forces, "false" disables
+_transactions_supported: Optional[bool] = None
+
+
+async def transactions_supported(db) -> bool:
+    """Multi-document transactions need a replica set or sharded cluster (not a standalone mongod)."""
+    global _transactions_supported
+    mode = os.environ.get("MONGO_TRANSACTIONS", "auto").lower()
+    if mode in ("false", "0", "no"):
+        return False
+    if mode in ("true", "1", "yes"):
+        return True
+    if _transactions_supported is None:
+        try:
+            hello = await db.client.admin.command("hello")
+        except Exception:
+            hello = await db.client.admin.command("isMaster")
+        _transactions_supported = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+    return _transactions_supported
+
+
+# Same retry budget as pymongo's ClientSession.with_transaction
+TRANSACTION_RETRY_SECONDS = 120
+
+
+def _has_label(error: BaseException, label: str) -> bool:
+    return isinstance(error, PyMongoError) and error.has_error_label(label)
+
+
+async def run_in_transaction(db, work: Callable[[Any], Awaitable[Any]]) -> Any:
+    """
+    Run work(session) inside a transaction when the deployment supports it,
+    otherwise run work(None) - the writes are then applied one after another without atomicity.
+
+    Like with_transaction: the whole transaction is retried on TransientTransactionError
+    (e.g. a WriteConflict with a concurrent invoice on the same product) and the commit
+    on UnknownTransactionCommitResult, for up to TRANSACTION_RETRY_SECONDS. work() must
+    therefore only have effects through the session (it can run more than once).
+    """
+    if not await transactions_supported(db):
+        return await work(None)
+    deadline = time.monotonic() + TRANSACTION_RETRY_SECONDS
+    async with await db.client.start_session() as session:
+        while True:
+            session.start_transaction()
+            try:
+                result = await work(session)
+            except BaseException as e:
+                if session.in_transaction:
+                    await session.abort_transaction()
+                if _has_label(e, "TransientTransactionError") and time.monotonic() < deadline:
+                    continue
+                raise
+            while True:
+                try:
+                    await session.commit_transaction()
+                    return result
+                except PyMongoError as e:
+                    if time.monotonic() >= deadline:
+                        raise
+                    if _has_label(e, "UnknownTransactionCommitResult"):
+                        continue
+                    if _has_label(e, "TransientTransactionError"):
+                        break
+                    raise
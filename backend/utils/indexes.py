@@ -0,0 +1,188 @@
+"""
+Database Indexes - declarative registry of the indexes the routes rely on.
+
+Every tenant-scoped query in routes/ filters on tenantId first, so each entry
+here starts with tenantId followed by the field the route sorts or looks up by.
+Built on startup (INDEX_AUTO_BUILD, default true) or from the CLI:
+
+    python scripts/ensure_indexes.py          # create missing indexes
+    python scripts/ensure_indexes.py --check  # only report drift
+"""
+import logging
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+ASC = 1
+DESC = -1
+
+# collection -> list of index specs. "keys" is the compound key; any other
+# entry is passed to create_index() as an option (unique, sparse, ...).
+INDEX_REGISTRY: Dict[str, List[Dict[str, Any]]] = {
+    "tenants": [
+        {"keys": [("code", ASC)], "unique": True, "sparse": True},
+        {"keys": [("email", ASC)], "unique": True, "sparse": True},
+    ],
+    "users": [
+        {"keys": [("tenantId", ASC), ("username", ASC)]},
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+        {"keys": [("email", ASC)]},
+    ],
+    "products": [
+        {"keys": [("tenantId", ASC), ("sku", ASC)]},
+        {"keys": [("tenantId", ASC), ("barcode", ASC)]},
+        {"keys": [("tenantId", ASC), ("rfidTag", ASC)]},
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+        # Multikey: normalized prefixes / words / trigrams (utils/search.py)
+        {"keys": [("tenantId", ASC), ("searchKeys", ASC)]},
+        # Low / out of stock lists, dashboard counts and the inventory report sections
+        # (utils/stock_state.py, keyset pages in _id order)
+        {"keys": [("tenantId", ASC), ("stockState", ASC), ("_id", ASC)]},
+        # Inventory report "all" section pages
+        {"keys": [("tenantId", ASC), ("_id", ASC)]},
+        # Products touched by a bulk price change (routes/products.py reprice)
+        {"keys": [("tenantId", ASC), ("priceBatch", ASC)]},
+    ],
+    "product_units": [
+        {"keys": [("tenantId", ASC), ("rfidTag", ASC)], "unique": True},
+        {"keys": [("tenantId", ASC), ("productId", ASC), ("status", ASC)]},
+        {"keys": [("tenantId", ASC), ("warehouseId", ASC), ("status", ASC)]},
+        # Only units an inventory count marked missing (routes/inventory_counts.py)
+        {"keys": [("tenantId", ASC), ("countSessionId", ASC)],
+         "partialFilterExpression": {"countSessionId": {"$exists": True}}},
+    ],
+    "invoices": [
+        {"keys": [("tenantId", ASC), ("createdAt", DESC)]},
+        # One invoice per number (client numbers come from /number-block); invoices
+        # without a number, e.g. old sync uploads, are left out of the index
+        {"keys": [("tenantId", ASC), ("invoiceNumber", ASC)], "unique": True,
+         "partialFilterExpression": {"invoiceNumber": {"$type": "string"}}},
+        # Offline queue resends of /invoices/batch are recognised by their clientRef
+        {"keys": [("tenantId", ASC), ("clientRef", ASC)], "unique": True,
+         "partialFilterExpression": {"clientRef": {"$type": "string"}}},
+        {"keys": [("tenantId", ASC), ("status", ASC)]},
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+    ],
+    "purchases": [
+        {"keys": [("tenantId", ASC), ("createdAt", DESC)]},
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+    ],
+    "customers": [
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+    ],
+    "suppliers": [
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+    ],
+    "warehouses": [
+        {"keys": [("tenantId", ASC), ("code", ASC)]},
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+    ],
+    "expenses": [
+        {"keys": [("tenantId", ASC), ("date", DESC)]},
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+    ],
+    "accounts": [
+        {"keys": [("tenantId", ASC), ("code", ASC)]},
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+    ],
+    "journal_entries": [
+        {"keys": [("tenantId", ASC), ("date", DESC)]},
+        {"keys": [("tenantId", ASC), ("updatedAt", ASC)]},
+    ],
+    "daily_rollups": [
+        {"keys": [("tenantId", ASC), ("day", ASC)], "unique": True},
+    ],
+    "inventory_counts": [
+        {"keys": [("tenantId", ASC), ("warehouseId", ASC), ("status", ASC)]},
+        {"keys": [("tenantId", ASC), ("createdAt", DESC)]},
+    ],
+    "inventory_count_scans": [
+        {"keys": [("sessionId", ASC), ("rfidTag", ASC)], "unique": True},
+        {"keys": [("sessionId", ASC), ("result", ASC), ("rfidTag", ASC)]},
+    ],
+    "esl_devices": [
+        {"keys": [("tenantId", ASC), ("deviceId", ASC)]},
+        {"keys": [("tenantId", ASC), ("productId", ASC)]},
+        {"keys": [("tenantId", ASC), ("refreshStatus", ASC), ("refreshRequestedAt", ASC)]},
+    ],
+    "audit_logs": [
+        {"keys": [("resource", ASC), ("timestamp", DESC)]},
+    ],
+    "password_reset_tokens": [
+        {"keys": [("token", ASC)]},
+    ],
+}
+
+# Options that change index behaviour and therefore count as drift when they differ
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def index_name(keys: List[Tuple[str, int]]) -> str:
+    """Default MongoDB index name for a key list, e.g. tenantId_1_createdAt_-1."""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def _spec_options(spec: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in spec.items() if k != "keys"}
+
+
+def _compared(options: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: options[k] for k in _COMPARED_OPTIONS if options.get(k)}
+
+
+async def ensure_indexes(db, registry: Dict[str, List[Dict[str, Any]]] = None) -> Dict[str, List[str]]:
+    """
+    Create every declared index that does not exist yet.
+    A failing index (e.g. unique index over duplicate data) is logged and reported,
+    it does not stop the remaining indexes from being built.
+    Returns {"created": [...], "failed": [...]} as "collection.index_name" strings.
+    """
+    registry = registry or INDEX_REGISTRY
+    created: List[str] = []
+    failed: List[str] = []
+    for collection, specs in registry.items():
+        coll = db[collection]
+        existing = await coll.index_information()
+        for spec in specs:
+            name = index_name(spec["keys"])
+            if name in existing:
+                continue
+            try:
+                await coll.create_index(spec["keys"], name=name, **_spec_options(spec))
+                created.append(f"{collection}.{name}")
+            except Exception as e:  # noqa: BLE001
+                logger.error("Index %s.%s could not be built: %s", collection, name, e)
+                failed.append(f"{collection}.{name}")
+    return {"created": created, "failed": failed}
+
+
+async def index_drift(db, registry: Dict[str, List[Dict[str, Any]]] = None) -> Dict[str, List[str]]:
+    """
+    Compare declared indexes with what exists in the database.
+    - missing: declared but not built
+    - mismatched: built with the same keys but different options (unique, sparse, ...)
+    - undeclared: present in a registered collection but not in the registry
+    Undeclared indexes are only reported, never dropped.
+    """
+    registry = registry or INDEX_REGISTRY
+    missing: List[str] = []
+    mismatched: List[str] = []
+    undeclared: List[str] = []
+    for collection, specs in registry.items():
+        existing = await db[collection].index_information()
+        by_keys = {tuple(tuple(k) for k in info["key"]): (name, info) for name, info in existing.items()}
+        declared_keys = set()
+        for spec in specs:
+            keys = tuple(tuple(k) for k in spec["keys"])
+            declared_keys.add(keys)
+            name = index_name(spec["keys"])
+            if keys not in by_keys:
+                missing.append(f"{collection}.{name}")
+                continue
+            found_name, info = by_keys[keys]
+            if _compared(info) != _compared(_spec_options(spec)):
+                mismatched.append(f"{collection}.{found_name}")
+        for keys, (name, _) in by_keys.items():
+            if name != "_id_" and keys not in declared_keys:
+                undeclared.append(f"{collection}.{name}")
+    return {"missing": missing, "mismatched": mismatched, "undeclared": undeclared}
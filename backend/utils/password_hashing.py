@@ -0,0 +1,162 @@
+"""
+Password hashing off the event loop.
+bcrypt takes ~250 ms per call; running it inside `async def` stalls every other
+request on the worker. These helpers run it on a dedicated, size-limited thread
+pool (bcrypt releases the GIL) and keep queue-depth and latency counters.
+
+Logins accept every hash format users may still have (verify_stored_password) and
+report legacy ones so the route can replace them with bcrypt on that login.
+
+PASSWORD_HASH_WORKERS      threads in the pool (default 4)
+PASSWORD_HASH_MAX_PENDING  queued + running jobs before new ones get 503 (default 200)
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "200"))
+
+
+class HashingPool:
+    """Bounded executor for CPU-heavy hashing with queue-depth and latency counters."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._executor = None
+        self._lock = Lock()
+        self.pending = 0  # submitted and not finished (queued + running)
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            with self._lock:
+                self.running += 1
+                self.total_wait += started - submitted
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), job)
+        finally:
+            latency = time.perf_counter() - submitted
+            self.pending -= 1
+            self.completed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def stats(self) -> Dict[str, Any]:
+        done = self.completed
+        return {
+            "workers": self.workers,
+            "maxPending": self.max_pending,
+            "queueDepth": max(0, self.pending - self.running),
+            "running": self.running,
+            "completed": done,
+            "rejected": self.rejected,
+            "avgWaitMs": round(self.total_wait / done * 1000, 2) if done else 0.0,
+            "avgLatencyMs": round(self.total_latency / done * 1000, 2) if done else 0.0,
+            "maxLatencyMs": round(self.max_latency * 1000, 2),
+        }
+
+
+_pool = HashingPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    except Exception:
+        # Unknown/malformed hash format
+        return False
+
+
+async def hash_password(password: str) -> str:
+    """bcrypt hash computed on the hashing pool."""
+    return await _pool.run(pwd_context.hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """bcrypt verify computed on the hashing pool. False for malformed hashes."""
+    return await _pool.run(_verify, plain_password, hashed_password)
+
+
+# Fields user documents keep their password hash in, in the order logins read them
+PASSWORD_FIELDS = ("passwordHash", "hashedPassword", "hashed_password")
+
+
+def stored_password_of(user: Dict[str, Any]) -> Optional[str]:
+    """The hash a login checks: passwordHash first, then the legacy fields."""
+    return next((user[field] for field in PASSWORD_FIELDS if user.get(field)), None)
+
+
+def password_hash_update(hashed_password: str) -> Dict[str, Dict[str, Any]]:
+    """Update storing a bcrypt hash as the user's only password (legacy fields removed)."""
+    return {
+        "$set": {PASSWORD_FIELDS[0]: hashed_password},
+        "$unset": {field: "" for field in PASSWORD_FIELDS[1:]},
+    }
+
+
+def _is_bcrypt(hashed_password: str) -> bool:
+    return hashed_password.startswith("$2b$") or hashed_password.startswith("$2a$")
+
+
+async def verify_stored_password(plain_password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+    """
+    Check a login password against the stored hash. Returns (valid, needs_rehash).
+    - $2b$ / $2a$ bcrypt: verified once on the pool
+    - anything else: the old unsalted SHA256 hex digest (checked inline), then any
+      other format passlib knows ($2y$ / $2$ bcrypt) on the pool
+    needs_rehash is True for a valid legacy hash (or bcrypt with outdated settings):
+    the caller stores hash_password(plain_password) with password_hash_update().
+    """
+    if not stored:
+        return False, False
+    if _is_bcrypt(stored):
+        valid = await verify_password(plain_password, stored)
+        return valid, valid and pwd_context.needs_update(stored)
+    if hmac.compare_digest(hashlib.sha256(plain_password.encode()).hexdigest(), stored):
+        return True, True
+    valid = await verify_password(plain_password, stored)
+    return valid, valid
+
+
+def get_hashing_stats() -> Dict[str, Any]:
+    """Queue depth and latency of the hashing pool (exposed via /api/metrics)."""
+    return _pool.stats()
@@ -0,0 +1,194 @@
+"""
+Product lookup cache - barcode / SKU / rfidTag -> product document for the POS scan path.
+
+One bounded LRU per tenant (least recently used tenants are dropped past
+PRODUCT_CACHE_TENANTS). Entries are indexed by product id so writes that touch a
+product (update, delete, stock changes from invoices, purchases, units and counts)
+drop every lookup key pointing at it. Each uvicorn worker holds its own copy;
+PRODUCT_CACHE_TTL_SECONDS bounds how long a change made through another worker
+can stay invisible.
+
+PRODUCT_CACHE_SIZE         lookup keys per tenant (default 5000)
+PRODUCT_CACHE_TENANTS      tenants kept in memory (default 200)
+PRODUCT_CACHE_TTL_SECONDS  entry lifetime (default 300)
+"""
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", "5000"))
+PRODUCT_CACHE_TENANTS = int(os.environ.get("PRODUCT_CACHE_TENANTS", "200"))
+PRODUCT_CACHE_TTL_SECONDS = float(os.environ.get("PRODUCT_CACHE_TTL_SECONDS", "300"))
+
+LOOKUP_FIELDS = ("barcode", "sku", "rfidTag")
+
+Key = Tuple[str, str]
+
+
+class _TenantLookups:
+    """LRU of (field, value) -> product doc with a product id -> keys index."""
+
+    def __init__(self):
+        self.entries: "OrderedDict[Key, tuple]" = OrderedDict()
+        self.by_product: Dict[str, Set[Key]] = {}
+
+    def remove(self, key: Key) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            keys = self.by_product.get(entry[0]["_id"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_product[entry[0]["_id"]]
+
+
+class ProductLookupCache:
+    """Per-tenant bounded lookup cache with hit/miss/eviction counters."""
+
+    def __init__(self, maxsize: int = 5000, max_tenants: int = 200, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.max_tenants = max_tenants
+        self.ttl = ttl
+        self._clock = clock
+        self._tenants: "OrderedDict[str, _TenantLookups]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, tenant_id: str, field: str, value: str) -> Optional[dict]:
+        """Cached product (a copy) or None."""
+        with self._lock:
+            lookups = self._tenants.get(tenant_id)
+            entry = lookups.entries.get((field, value)) if lookups else None
+            if entry is None:
+                self.misses += 1
+                return None
+            doc, expires_at = entry
+            if expires_at <= self._clock():
+                lookups.remove((field, value))
+                self.misses += 1
+                return None
+            lookups.entries.move_to_end((field, value))
+            self._tenants.move_to_end(tenant_id)
+            self.hits += 1
+            return dict(doc)
+
+    def put(self, tenant_id: str, field: str, value: str, doc: dict) -> None:
+        """Cache a product document whose _id is already a string."""
+        key = (field, value)
+        with self._lock:
+            lookups = self._tenants.get(tenant_id)
+            if lookups is None:
+                lookups = self._tenants[tenant_id] = _TenantLookups()
+                while len(self._tenants) > self.max_tenants:
+                    _, dropped = self._tenants.popitem(last=False)
+                    self.evictions += len(dropped.entries)
+            self._tenants.move_to_end(tenant_id)
+            lookups.remove(key)
+            lookups.entries[key] = (dict(doc), self._clock() + self.ttl)
+            lookups.by_product.setdefault(doc["_id"], set()).add(key)
+            while len(lookups.entries) > self.maxsize:
+                lookups.remove(next(iter(lookups.entries)))
+                self.evictions += 1
+
+    def invalidate_products(self, tenant_id: Optional[str], product_ids: Iterable[Any]) -> int:
+        """Drop every key of these products. tenant_id None (super admin writes) checks all tenants."""
+        ids = {str(pid) for pid in product_ids}
+        removed = 0
+        with self._lock:
+            if tenant_id is None:
+                tenants = list(self._tenants.values())
+            else:
+                tenants = [self._tenants[tenant_id]] if tenant_id in self._tenants else []
+            for lookups in tenants:
+                for pid in ids:
+                    for key in list(lookups.by_product.get(pid, ())):
+                        lookups.remove(key)
+                        removed += 1
+            self.invalidations += removed
+        return removed
+
+    def invalidate_values(self, tenant_id: Optional[str], doc: dict) -> int:
+        """Drop the keys built from a product's barcode/sku/rfidTag (e.g. before they change)."""
+        removed = 0
+        with self._lock:
+            lookups = self._tenants.get(tenant_id)
+            if lookups is None:
+                return 0
+            for field in LOOKUP_FIELDS:
+                if doc.get(field) and (field, doc[field]) in lookups.entries:
+                    lookups.remove((field, doc[field]))
+                    removed += 1
+            self.invalidations += removed
+        return removed
+
+    def invalidate_tenant(self, tenant_id: Optional[str]) -> None:
+        with self._lock:
+            if tenant_id is None:
+                self._tenants.clear()
+            else:
+                self._tenants.pop(tenant_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "tenants": len(self._tenants),
+            "size": sum(len(t.entries) for t in self._tenants.values()),
+            "maxsizePerTenant": self.maxsize,
+            "maxTenants": self.max_tenants,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache = ProductLookupCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TENANTS, PRODUCT_CACHE_TTL_SECONDS)
+
+
+async def find_product_by(db, tenant_id: Optional[str], field: str, value: str) -> Optional[dict]:
+    """
+    Product by barcode / sku / rfidTag, served from the cache when possible.
+    Returns the document with _id as a string. Super admin lookups (no tenant) are not cached.
+    """
+    if tenant_id:
+        cached = _cache.get(tenant_id, field, value)
+        if cached is not None:
+            return cached
+    query = {field: value}
+    if tenant_id:
+        query["tenantId"] = tenant_id
+    product = await db.products.find_one(query, {"searchKeys": 0})
+    if not product:
+        return None
+    product["_id"] = str(product["_id"])
+    if tenant_id:
+        _cache.put(tenant_id, field, value, product)
+    return product
+
+
+def invalidate_products(tenant_id: Optional[str], product_ids: Iterable[Any]) -> int:
+    """Call after any write to these products (stock, price, lookup fields, delete)."""
+    return _cache.invalidate_products(tenant_id, product_ids)
+
+
+def invalidate_product_values(tenant_id: Optional[str], doc: dict) -> int:
+    """Call when a product's barcode/sku/rfidTag may have changed, with its previous values."""
+    return _cache.invalidate_values(tenant_id, doc)
+
+
+def invalidate_tenant_products(tenant_id: Optional[str] = None) -> None:
+    """Drop a whole tenant (or everything) - bulk imports, tenant deletion, sync uploads."""
+    _cache.invalidate_tenant(tenant_id)
+
+
+def get_product_cache_stats() -> Dict[str, Any]:
+    """Hit rate and size of the lookup cache (exposed via /api/metrics)."""
+    return _cache.stats()
@@ -0,0 +1,190 @@
+"""
+Product import - CSV / XLSX files upserted by (tenantId, sku) as a background job.
+
+The upload is copied to a temporary file and read back in chunks of IMPORT_CHUNK rows
+(pandas.read_csv chunks, openpyxl read-only rows for XLSX), so memory stays flat
+whatever the file size. Each row is validated against ProductCreate; valid rows of a
+chunk become one bulk_write(ordered=False) of upserts. Progress and row errors are kept
+on an `import_jobs` document so any worker can report them.
+
+Columns are ProductCreate field names (case-insensitive); unknown columns are ignored.
+Empty cells leave the stored value unchanged on existing products and fall back to the
+ProductCreate defaults on new ones.
+
+IMPORT_CHUNK       rows per bulk_write (default 1000)
+IMPORT_MAX_ERRORS  row errors kept on the job (default 1000; the count is always exact)
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo import UpdateOne
+
+from models.product import ProductCreate
+from utils.dashboard_cache import invalidate_dashboard
+from utils.product_cache import invalidate_tenant_products
+from utils.search import SEARCH_FIELDS, product_search_keys
+from utils.stock_state import upsert_with_state_pipeline
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK = int(os.environ.get("IMPORT_CHUNK", "1000"))
+IMPORT_MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", "1000"))
+
+IMPORT_FORMATS = ("csv", "xlsx")
+_COLUMNS = {name.lower(): name for name in ProductCreate.model_fields}
+_DEFAULTS = {
+    name: field.default for name, field in ProductCreate.model_fields.items() if not field.is_required()
+}
+
+# Strong references to running jobs (asyncio only keeps weak ones)
+_running = set()
+
+
+def _header(cells) -> List[Optional[str]]:
+    return [_COLUMNS.get(str(cell).strip().lower()) if cell is not None else None for cell in cells]
+
+
+def _row(header: List[Optional[str]], cells) -> Dict[str, Any]:
+    row = {}
+    for field, cell in zip(header, cells):
+        if field is None or cell is None:
+            continue
+        if isinstance(cell, str):
+            cell = cell.strip()
+            if not cell:
+                continue
+        row[field] = cell
+    return row
+
+
+def _csv_chunks(path: str, chunk: int) -> Iterator[List[Dict[str, Any]]]:
+    import pandas as pd
+
+    header = None
+    reader = pd.read_csv(path, chunksize=chunk, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    for frame in reader:
+        if header is None:
+            header = _header(frame.columns)
+        yield [_row(header, cells) for cells in frame.itertuples(index=False, name=None)]
+
+
+def _xlsx_chunks(path: str, chunk: int) -> Iterator[List[Dict[str, Any]]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _header(next(rows, ()))
+        batch = []
+        for cells in rows:
+            batch.append(_row(header, cells))
+            if len(batch) >= chunk:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        workbook.close()
+
+
+def read_chunks(path: str, file_format: str, chunk: int = IMPORT_CHUNK) -> Iterator[List[Dict[str, Any]]]:
+    """Rows of the file as {field: value} dicts (empty cells dropped), chunk by chunk."""
+    if file_format == "xlsx":
+        return _xlsx_chunks(path, chunk)
+    return _csv_chunks(path, chunk)
+
+
+def validate_rows(rows: List[Dict[str, Any]], first_row: int) -> Tuple[Dict[str, Dict[str, Any]], List[dict]]:
+    """
+    Valid rows by SKU (a later row of the same SKU wins) and row errors. Rows are numbered
+    as in the spreadsheet: first_row is the line of rows[0] (the header is line 1).
+    """
+    valid: Dict[str, Dict[str, Any]] = {}
+    errors = []
+    for offset, row in enumerate(rows):
+        if not row:
+            continue
+        try:
+            product = ProductCreate.model_validate(row)
+        except ValidationError as e:
+            err = e.errors()[0]
+            field = ".".join(str(part) for part in err.get("loc", ()))
+            errors.append({"row": first_row + offset, "sku": row.get("sku"), "message": f"{field}: {err.get('msg')}"})
+            continue
+        valid[product.sku] = product.model_dump(exclude_unset=True)
+    return valid, errors
+
+
+def upsert_ops(tenant_id: str, rows: Dict[str, Dict[str, Any]], existing: Dict[str, dict], now: datetime) -> List[UpdateOne]:
+    """One upsert per SKU; searchKeys come from the stored product merged with the row."""
+    ops = []
+    for sku, row in rows.items():
+        merged = {**_DEFAULTS, **existing.get(sku, {}), **row}
+        set_fields = {**row, "searchKeys": product_search_keys(merged), "updatedAt": now}
+        insert_fields = {**_DEFAULTS, "createdAt": now}
+        ops.append(UpdateOne(
+            {"tenantId": tenant_id, "sku": sku},
+            upsert_with_state_pipeline(set_fields, insert_fields),
+            upsert=True,
+        ))
+    return ops
+
+
+async def _write_chunk(db, tenant_id: str, rows: Dict[str, Dict[str, Any]]) -> Tuple[int, int]:
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    existing = {
+        p["sku"]: p
+        async for p in db.products.find({"tenantId": tenant_id, "sku": {"$in": list(rows)}}, projection)
+    }
+    result = await db.products.bulk_write(upsert_ops(tenant_id, rows, existing, datetime.now(timezone.utc)), ordered=False)
+    return result.upserted_count, result.matched_count
+
+
+async def run_product_import(db, job_id: ObjectId, tenant_id: str, path: str, file_format: str) -> None:
+    """Process an uploaded file and record progress on the job. Deletes the file when done."""
+    jobs = db.import_jobs
+    await jobs.update_one({"_id": job_id}, {"$set": {"status": "running", "startedAt": datetime.now(timezone.utc)}})
+    chunks = read_chunks(path, file_format)
+    next_row = 2
+    try:
+        while True:
+            rows = await asyncio.to_thread(next, chunks, None)
+            if rows is None:
+                break
+            valid, errors = validate_rows(rows, next_row)
+            next_row += len(rows)
+            inserted = updated = 0
+            if valid:
+                inserted, updated = await _write_chunk(db, tenant_id, valid)
+            update = {"$inc": {
+                "processed": len(rows), "inserted": inserted, "updated": updated, "failed": len(errors),
+            }}
+            if errors:
+                update["$push"] = {"errors": {"$each": errors, "$slice": IMPORT_MAX_ERRORS}}
+            await jobs.update_one({"_id": job_id}, update)
+        status, message = "completed", None
+    except Exception as e:
+        logger.exception("Product import %s failed", job_id)
+        status, message = "failed", str(e)
+    finally:
+        invalidate_tenant_products(tenant_id)
+        invalidate_dashboard(tenant_id)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    await jobs.update_one(
+        {"_id": job_id},
+        {"$set": {"status": status, "message": message, "finishedAt": datetime.now(timezone.utc)}},
+    )
+
+
+def start_product_import(db, job_id: ObjectId, tenant_id: str, path: str, file_format: str) -> None:
+    task = asyncio.create_task(run_product_import(db, job_id, tenant_id, path, file_format))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
@@ -0,0 +1,220 @@
+"""
+Daily rollups - per tenant and UTC day totals of sales, purchases and expenses.
+
+One `daily_rollups` document per (tenantId, day) holds what the dashboard and the
+reports used to recompute from raw invoices, purchases and expenses on every load:
+
+    sales      revenue, orders, items (lines), paidRevenue, paidOrders, unpaidOrders
+    purchases  total, orders
+    expenses   total, count, byCategory.<category>
+    products   <productId or name>.{name, quantity, revenue}
+
+Every write to those collections applies its delta with apply_rollups() (an update
+removes the old document's contribution and adds the new one), so readers cost one
+document per day instead of one per invoice. rebuild_rollups() recomputes everything
+from the source collections (scripts/rebuild_rollups.py).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+# Collection -> field holding the business date of the document
+ROLLUP_SOURCES = {"invoices": "createdAt", "purchases": "createdAt", "expenses": "date"}
+
+REBUILD_BATCH = 500
+
+Acc = Dict[Tuple[Optional[str], str], Dict[str, dict]]
+
+
+def day_key(value: Any) -> Optional[str]:
+    """UTC day (YYYY-MM-DD) of a stored date; ISO strings from offline clients are accepted."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d")
+
+
+def day_start(day: str) -> datetime:
+    return datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def _field_key(value: Any) -> str:
+    """Map keys cannot contain '.' or start with '$'."""
+    return str(value).replace(".", "_").lstrip("$") or "unknown"
+
+
+def _number(value: Any) -> float:
+    return value if isinstance(value, (int, float)) else 0
+
+
+def _increments(kind: str, doc: dict) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    """($inc, $set) of one source document."""
+    inc: Dict[str, float] = {}
+    names: Dict[str, Any] = {}
+    if kind == "invoices":
+        total = _number(doc.get("total"))
+        items = doc.get("items") or []
+        inc = {"sales.revenue": total, "sales.orders": 1, "sales.items": len(items)}
+        if doc.get("status") == "paid":
+            inc["sales.paidRevenue"] = total
+            inc["sales.paidOrders"] = 1
+        elif doc.get("status") == "unpaid":
+            inc["sales.unpaidOrders"] = 1
+        for item in items:
+            key = _field_key(item.get("productId") or item.get("productName") or "unknown")
+            inc[f"products.{key}.quantity"] = inc.get(f"products.{key}.quantity", 0) + _number(item.get("quantity"))
+            inc[f"products.{key}.revenue"] = inc.get(f"products.{key}.revenue", 0) + _number(item.get("total"))
+            names[f"products.{key}.name"] = item.get("productName", "Unknown")
+    elif kind == "purchases":
+        inc = {"purchases.total": _number(doc.get("total")), "purchases.orders": 1}
+    elif kind == "expenses":
+        amount = _number(doc.get("amount"))
+        category = _field_key(doc.get("category") or "other")
+        inc = {"expenses.total": amount, "expenses.count": 1, f"expenses.byCategory.{category}": amount}
+    return inc, names
+
+
+def collect(acc: Acc, kind: str, docs: Iterable[dict], sign: int = 1) -> Acc:
+    """Add (sign=1) or remove (sign=-1) the contribution of docs to acc."""
+    date_field = ROLLUP_SOURCES[kind]
+    for doc in docs:
+        day = day_key(doc.get(date_field))
+        if day is None:
+            continue
+        entry = acc.setdefault((doc.get("tenantId"), day), {"inc": {}, "set": {}})
+        inc, names = _increments(kind, doc)
+        for path, value in inc.items():
+            entry["inc"][path] = entry["inc"].get(path, 0) + sign * value
+        if sign > 0:
+            entry["set"].update(names)
+    return acc
+
+
+def rollup_ops(acc: Acc, now: datetime) -> List[UpdateOne]:
+    ops = []
+    for (tenant_id, day), entry in acc.items():
+        inc = {path: value for path, value in entry["inc"].items() if value}
+        if not inc:
+            continue
+        ops.append(UpdateOne(
+            {"tenantId": tenant_id, "day": day},
+            {"$inc": inc, "$set": {**entry["set"], "updatedAt": now}, "$setOnInsert": {"date": day_start(day)}},
+            upsert=True,
+        ))
+    return ops
+
+
+async def apply_rollups(db, kind: str, removed: Iterable[dict] = (), added: Iterable[dict] = (), session=None) -> None:
+    """
+    Apply the effect of a write to `kind` (invoices / purchases / expenses) in one bulk_write:
+    removed = documents as they were before (update / delete), added = as they are now.
+    """
+    acc: Acc = {}
+    collect(acc, kind, removed, -1)
+    collect(acc, kind, added, 1)
+    ops = rollup_ops(acc, datetime.now(timezone.utc))
+    if ops:
+        await db.daily_rollups.bulk_write(ops, ordered=False, session=session)
+
+
+async def rebuild_rollups(db, tenant_id: Optional[str] = None) -> int:
+    """
+    Recompute rollups from invoices, purchases and expenses (one tenant, or all).
+    Source documents are streamed; memory grows with days x products, not documents.
+    Run while the tenant is idle - writes made during the rebuild may be counted twice.
+    Returns the number of rollup documents written.
+    """
+    query = {"tenantId": tenant_id} if tenant_id else {}
+    acc: Acc = {}
+    for kind, date_field in ROLLUP_SOURCES.items():
+        projection = {"tenantId": 1, date_field: 1, "total": 1, "items": 1, "status": 1, "amount": 1, "category": 1}
+        batch = []
+        async for doc in db[kind].find(query, projection):
+            batch.append(doc)
+            if len(batch) >= REBUILD_BATCH:
+                collect(acc, kind, batch)
+                batch = []
+        collect(acc, kind, batch)
+
+    await db.daily_rollups.delete_many(query)
+    ops = rollup_ops(acc, datetime.now(timezone.utc))
+    for i in range(0, len(ops), REBUILD_BATCH):
+        await db.daily_rollups.bulk_write(ops[i:i + REBUILD_BATCH], ordered=False)
+    return len(ops)
+
+
+# ---------- Readers ----------
+
+def _range_query(tenant_id: Optional[str], start: Optional[datetime], end: Optional[datetime] = None) -> dict:
+    """Rollups of the days of [start, end]; None leaves that side open."""
+    query = {"tenantId": tenant_id} if tenant_id else {}
+    day_range = {}
+    if start is not None:
+        day_range["$gte"] = day_key(start)
+    if end is not None:
+        day_range["$lte"] = day_key(end)
+    if day_range:
+        query["day"] = day_range
+    return query
+
+
+_TOTAL_FIELDS = (
+    "sales.revenue", "sales.orders", "sales.items", "sales.paidRevenue", "sales.paidOrders", "sales.unpaidOrders",
+    "purchases.total", "purchases.orders", "expenses.total", "expenses.count",
+)
+
+
+async def rollup_totals(db, tenant_id: Optional[str], start: Optional[datetime], end: Optional[datetime] = None) -> Dict[str, float]:
+    """Sums over the days of [start, end] (whole UTC days), keyed like "sales.revenue"."""
+    group: Dict[str, Any] = {"_id": None}
+    for path in _TOTAL_FIELDS:
+        group[path.replace(".", "_")] = {"$sum": {"$ifNull": [f"${path}", 0]}}
+    rows = await db.daily_rollups.aggregate([
+        {"$match": _range_query(tenant_id, start, end)},
+        {"$group": group},
+    ]).to_list(1)
+    row = rows[0] if rows else {}
+    return {path: row.get(path.replace(".", "_"), 0) for path in _TOTAL_FIELDS}
+
+
+async def rollup_expense_categories(db, tenant_id: Optional[str], start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, float]:
+    rows = await db.daily_rollups.aggregate([
+        {"$match": _range_query(tenant_id, start, end)},
+        {"$project": {"c": {"$objectToArray": {"$ifNull": ["$expenses.byCategory", {}]}}}},
+        {"$unwind": "$c"},
+        {"$group": {"_id": "$c.k", "amount": {"$sum": "$c.v"}}},
+    ]).to_list(None)
+    return {row["_id"]: row["amount"] for row in rows}
+
+
+def top_products_stages(limit: int) -> List[dict]:
+    """Stages ranking the per-day product maps by revenue: [{name, quantity, revenue}]."""
+    return [
+        {"$project": {"p": {"$objectToArray": {"$ifNull": ["$products", {}]}}}},
+        {"$unwind": "$p"},
+        {"$group": {
+            "_id": "$p.k",
+            "name": {"$last": "$p.v.name"},
+            "quantity": {"$sum": "$p.v.quantity"},
+            "revenue": {"$sum": "$p.v.revenue"},
+        }},
+        {"$sort": {"revenue": -1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "name": 1, "quantity": 1, "revenue": 1}},
+    ]
+
+
+def days_between(start: datetime, end: datetime) -> List[str]:
+    """Every day key from start to end inclusive (for charts that show empty days)."""
+    days, current = [], start
+    while day_key(current) <= day_key(end):
+        days.append(day_key(current))
+        current += timedelta(days=1)
+    return days
@@ -0,0 +1,115 @@
+"""
+Product search keys - normalized prefix / word / trigram terms for Arabic and English.
+
+Every product carries a `searchKeys` array built from name, nameEn, sku, barcode,
+category and categoryEn, indexed together with tenantId. A query is normalized the
+same way and matched with {"searchKeys": {"$all": [...]}} (prefix search), falling back
+to shared trigrams (fuzzy search) when nothing matches. Matching uses the index only,
+so latency does not grow with the size of the catalog.
+
+Normalization: NFKC + casefold, Arabic diacritics and tatweel removed, alef variants
+(أ إ آ ٱ) -> ا, ى/ئ -> ي, ؤ -> و, ة -> ه, Arabic-Indic digits -> 0-9. Words starting
+with the article ال are indexed with and without it.
+
+Key kinds stored in searchKeys:
+    "abc"      prefix of a word (1..SEARCH_MAX_PREFIX chars)
+    "=abc"     whole word
+    "#abc123"  whole sku / barcode without separators
+    "~abc"     trigram of a word (fuzzy fallback)
+"""
+import re
+import unicodedata
+from typing import Dict, List
+
+from pymongo import UpdateOne
+
+SEARCH_FIELDS = ("name", "nameEn", "sku", "barcode", "category", "categoryEn")
+CODE_FIELDS = ("sku", "barcode")
+SEARCH_MAX_PREFIX = 20
+
+_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_SEPARATORS = re.compile(r"[\W_]+")
+_FOLD = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ی": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+    "ک": "ك",
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+})
+
+
+def normalize_text(value) -> str:
+    """Folded, diacritic-free text with words separated by single spaces."""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value)).casefold()
+    text = _DIACRITICS.sub("", text).translate(_FOLD)
+    return " ".join(_SEPARATORS.split(text)).strip()
+
+
+def tokenize(value) -> List[str]:
+    return [t for t in normalize_text(value).split(" ") if t]
+
+
+def _compact(value) -> str:
+    return normalize_text(value).replace(" ", "")
+
+
+def trigrams(word: str) -> List[str]:
+    return [word[i:i + 3] for i in range(len(word) - 2)]
+
+
+def _with_article_variants(words: List[str]) -> List[str]:
+    """Arabic words are also indexed without the definite article (الامل -> امل)."""
+    variants = list(words)
+    variants += [w[2:] for w in words if w.startswith("ال") and len(w) > 3]
+    return variants
+
+
+def product_search_keys(product: Dict) -> List[str]:
+    """searchKeys for a product document (any missing field is ignored)."""
+    keys = set()
+    for field in SEARCH_FIELDS:
+        for word in _with_article_variants(tokenize(product.get(field))):
+            keys.add("=" + word[:SEARCH_MAX_PREFIX])
+            keys.update(word[:n] for n in range(1, min(len(word), SEARCH_MAX_PREFIX) + 1))
+            keys.update("~" + g for g in trigrams(word))
+    for field in CODE_FIELDS:
+        code = _compact(product.get(field))
+        if code:
+            keys.add("#" + code)
+            keys.update(code[:n] for n in range(1, min(len(code), SEARCH_MAX_PREFIX) + 1))
+    return sorted(keys)
+
+
+def query_tokens(query: str) -> List[str]:
+    """Distinct normalized query words, cut to the stored prefix length."""
+    return list(dict.fromkeys(t[:SEARCH_MAX_PREFIX] for t in tokenize(query)))
+
+
+def query_trigrams(query: str) -> List[str]:
+    return list(dict.fromkeys("~" + g for t in tokenize(query) for g in trigrams(t)))
+
+
+def query_code(query: str) -> str:
+    return "#" + _compact(query)
+
+
+async def backfill_search_keys(db, only_missing: bool = True, batch_size: int = 500) -> int:
+    """(Re)compute searchKeys for existing products in batches. Returns products updated."""
+    query = {"searchKeys": {"$exists": False}} if only_missing else {}
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    updated = 0
+    ops = []
+    async for product in db.products.find(query, projection):
+        ops.append(UpdateOne({"_id": product["_id"]}, {"$set": {"searchKeys": product_search_keys(product)}}))
+        if len(ops) >= batch_size:
+            await db.products.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await db.products.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
@@ -0,0 +1,94 @@
+"""
+Stock state - maintained ok / low / out flag on products.
+
+`stockState` replaces {"$expr": {"$lte": ["$stock", "$reorderLevel"]}} scans with an
+indexed (tenantId, stockState) lookup. Every write that changes stock or reorderLevel
+keeps it current: updates use the pipelines below (new values and state in the same
+atomic update, so concurrent stock changes are never overwritten with a stale state);
+inserts use stock_state_of().
+
+    out  stock <= 0
+    low  0 < stock <= reorderLevel
+    ok   stock > reorderLevel
+"""
+from typing import Any, Dict, List, Optional
+
+OK = "ok"
+LOW = "low"
+OUT = "out"
+DEFAULT_REORDER_LEVEL = 10
+
+
+def stock_state(stock: Optional[float], reorder_level: Optional[float]) -> str:
+    stock = stock or 0
+    if stock <= 0:
+        return OUT
+    if stock <= (DEFAULT_REORDER_LEVEL if reorder_level is None else reorder_level):
+        return LOW
+    return OK
+
+
+def stock_state_of(product: Dict[str, Any]) -> str:
+    return stock_state(product.get("stock"), product.get("reorderLevel"))
+
+
+def stock_state_expr() -> dict:
+    """Aggregation expression equivalent of stock_state() on the document's own fields."""
+    return {"$switch": {
+        "branches": [
+            {"case": {"$lte": [{"$ifNull": ["$stock", 0]}, 0]}, "then": OUT},
+            {"case": {"$lte": ["$stock", {"$ifNull": ["$reorderLevel", DEFAULT_REORDER_LEVEL]}]}, "then": LOW},
+        ],
+        "default": OK,
+    }}
+
+
+def refresh_state_pipeline() -> List[dict]:
+    """Update pipeline that only recomputes stockState."""
+    return [{"$set": {"stockState": stock_state_expr()}}]
+
+
+def set_with_state_pipeline(fields: Dict[str, Any]) -> List[dict]:
+    """Pipeline form of {$set: fields} that recomputes stockState against the stored stock."""
+    return [{"$set": {field: {"$literal": value} for field, value in fields.items()}}, *refresh_state_pipeline()]
+
+
+def stock_inc_pipeline(delta: float, set_fields: Optional[Dict[str, Any]] = None,
+                       exprs: Optional[Dict[str, Any]] = None) -> List[dict]:
+    """
+    Update pipeline for stock += delta (plus optional literal $set fields) and the new state.
+    exprs are aggregation expressions set in the same stage, i.e. against the stock before delta.
+    """
+    first = {"stock": {"$add": [{"$ifNull": ["$stock", 0]}, delta]}, **(exprs or {})}
+    for field, value in (set_fields or {}).items():
+        first[field] = {"$literal": value}
+    return [{"$set": first}, *refresh_state_pipeline()]
+
+
+def stock_upsert_pipeline(delta: float, set_fields: Dict[str, Any], insert_fields: Dict[str, Any],
+                          exprs: Optional[Dict[str, Any]] = None) -> List[dict]:
+    """
+    Pipeline form of {$inc: stock, $set: set_fields, $setOnInsert: insert_fields} for upserts
+    ($setOnInsert is not available in update pipelines; $ifNull keeps existing values).
+    exprs as in stock_inc_pipeline.
+    """
+    first = {"stock": {"$add": [{"$ifNull": ["$stock", 0]}, delta]}, **(exprs or {})}
+    for field, value in insert_fields.items():
+        first[field] = {"$ifNull": [f"${field}", {"$literal": value}]}
+    for field, value in set_fields.items():
+        first[field] = {"$literal": value}
+    return [{"$set": first}, *refresh_state_pipeline()]
+
+
+def upsert_with_state_pipeline(set_fields: Dict[str, Any], insert_fields: Dict[str, Any]) -> List[dict]:
+    """Pipeline form of {$set: set_fields, $setOnInsert: insert_fields} that recomputes stockState."""
+    first = {field: {"$ifNull": [f"${field}", {"$literal": value}]} for field, value in insert_fields.items()}
+    first.update({field: {"$literal": value} for field, value in set_fields.items()})
+    return [{"$set": first}, *refresh_state_pipeline()]
+
+
+async def backfill_stock_state(db, only_missing: bool = True) -> int:
+    """Set stockState on existing products with one server-side update. Returns products updated."""
+    query = {"stockState": {"$exists": False}} if only_missing else {}
+    result = await db.products.update_many(query, refresh_state_pipeline())
+    return result.modified_count
@@ -25,6 +25,7 @@ const Reports = () => {
   const [period, setPeriod] = useState('month');
   const [salesData, setSalesData] = useState(null);
   const [inventoryData, setInventoryData] = useState(null);
+  const [lowStockItems, setLowStockItems] = useState([]);
   const [purchasesData, setPurchasesData] = useState(null);
   const [profitData, setProfitData] = useState(null);
   const [analyticsData, setAnalyticsData] = useState(null);
@@ -42,8 +43,12 @@ const Reports = () => {
         const res = await reportsAPI.getSales({ period });
         setSalesData(res.data);
       } else if (activeTab === 'inventory') {
-        const res = await reportsAPI.getInventory();
+        const [res, low] = await Promise.all([
+          reportsAPI.getInventory(),
+          reportsAPI.getInventorySection('low', { limit: 100 }),
+        ]);
         setInventoryData(res.data);
+        setLowStockItems(low.data?.items || []);
       } else if (activeTab === 'purchases') {
         const res = await reportsAPI.getPurchases({});
         setPurchasesData(res.data);
@@ -66,6 +71,26 @@ const Reports = () => {
 
   const formatCurrency = (value) => `$${(value || 0).toLocaleString()}`;
 
+  // Product lists are paginated: follow nextCursor until the last page
+  const fetchInventorySection = async (section) => {
+    const items = [];
+    let cursor = null;
+    do {
+      const res = await reportsAPI.getInventorySection(section, { limit: 1000, cursor });
+      items.push(...(res.data?.items || []));
+      cursor = res.data?.nextCursor;
+    } while (cursor);
+    return items;
+  };
+
+  const exportInventory = async () => {
+    try {
+      exportToCSV(await fetchInventorySection('all'), 'inventory-report');
+    } catch (error) {
+      console.error('Error exporting inventory:', error);
+    }
+  };
+
   const exportToCSV = (data, filename) => {
     if (!data || data.length === 0) return;
     const headers = Object.keys(data[0]);
@@ -312,7 +337,7 @@ const Reports = () => {
         {/* Inventory Report */}
         <TabsContent value="inventory" className="space-y-4">
           <div className="flex justify-end">
-            <Button variant="outline" onClick={() => exportToCSV(inventoryData?.allProducts, 'inventory-report')}>
+            <Button variant="outline" onClick={exportInventory}>
               <Download className="w-4 h-4 mr-2" />
               {language === 'ar' ? 'تصدير' : 'Export'}
             </Button>
@@ -354,7 +379,7 @@ const Reports = () => {
                   <CardHeader><CardTitle className="flex items-center gap-2 text-yellow-600"><AlertTriangle className="w-5 h-5" />{language === 'ar' ? 'منتجات منخفضة المخزون' : 'Low Stock Items'}</CardTitle></CardHeader>
                   <CardContent>
                     <div className="space-y-2 max-h-80 overflow-y-auto">
-                      {inventoryData.lowStockItems?.map((item, i) => (
+                      {lowStockItems.map((item, i) => (
                         <div key={i} className="flex justify-between items-center p-2 bg-yellow-50 rounded">
                           <span>{language === 'ar' ? item.name : item.nameEn}</span>
                           <div>
@@ -363,7 +388,7 @@ const Reports = () => {
                           </div>
                         </div>
                       ))}
-                      {(!inventoryData.lowStockItems || inventoryData.lowStockItems.length === 0) && (
+                      {lowStockItems.length === 0 && (
                         <p className="text-center text-gray-500 py-4">{language === 'ar' ? 'لا يوجد' : 'None'}</p>
                       )}
                     </div>
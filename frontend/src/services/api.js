@@ -392,6 +392,7 @@ export const reportsAPI = {
     }
     return axios.get(`${API}/reports/profit`, { params });
   },
+  getInventorySection: async (section, params) => axios.get(`${API}/reports/inventory/${section}`, { params }),
   getAnalytics: async (params) => axios.get(`${API}/reports/analytics`, { params }),
   getCustomers: async (params) => axios.get(`${API}/reports/customers`, { params }),
 };